@@ -1,8 +1,22 @@
+import time
 import streamlit as st
 from streamlit_extras.stylable_container import stylable_container
 from sync import check_and_compare_objects  # Assuming sync.py contains check/compare functions.
 from deploy import sync_all_objects_from_git
 from delete import delete_all_data
+from prune import apply_prune, parse_custom_field_scope, plan_prune
+from jobs import get_job_manager
+from metrics import start_metrics_server_from_env
+from tracing import enable_tracing, last_trace
+from profiling import enable_profiling
+
+# Serves Prometheus metrics on $METRICS_PORT when set; Streamlit reruns make this a no-op after the first call.
+start_metrics_server_from_env()
+# Keeps the last runs' spans in memory for the trace view below (and exports them when $TRACES_FILE or
+# $OTEL_EXPORTER_OTLP_ENDPOINT is set).
+enable_tracing()
+# Profiles every run into $PROFILE_DIR when set.
+enable_profiling()
 
 st.title("NautobotCD GitOps Tool")
 
@@ -15,6 +29,7 @@ where your Nautobot YAML object files are located.
 - **Deploy to Nautobot:** Import all objects in dependency order:
     1. Independent objects: Roles, Manufacturers, Location Types, Statuses, Prefixes.
     2. Dependent objects: Device Types (dependent on Manufacturers), Locations (dependent on Location Types), then Devices (dependent on Role, Status, Location, and Device Type; may include interfaces with optional mgmt_only, IP addresses with assignment as primary IP).
+- **Prune:** Preview, then delete only the Nautobot objects that are absent from the Git YAML (optionally limited to objects marked as GitOps-managed with a tag or custom field).
 - **Delete All Data:** Permanently delete all objects from Nautobot in the following order:
     Devices → IP Addresses → Prefixes → Device Types & Locations → Roles, Manufacturers, Location Types, Statuses.
 """
@@ -34,6 +49,7 @@ else:
     git_pat = None
 
 subdirectory = st.text_input("Enter directory path within the repo (e.g., 'nautobot/objects')")
+incremental = st.checkbox("Incremental deploy (only re-read files/shards changed since the last deploy)")
 
 if st.button("Sync with Git"):
     if not nautobot_token:
@@ -62,15 +78,72 @@ if st.session_state.get("check_done", False):
             elif not subdirectory:
                 st.error("Please enter the directory path containing your YAML files.")
             else:
-                st.info("Starting sync of all objects to Nautobot in dependency order...")
-                try:
-                    sync_all_objects_from_git(nautobot_token, git_repo_url, subdirectory, nautobot_url, username=git_username, token=git_pat)
-                    st.markdown('<div style="background-color: yellow; padding: 5px;">Nautobot data sync process completed (check logs above).</div>', unsafe_allow_html=True)
-                except Exception as e:
-                    st.error(f"An error occurred during sync: {e}")
+                job = get_job_manager().submit("deploy", nautobot_url, sync_all_objects_from_git, nautobot_token, git_repo_url, subdirectory,
+                                               nautobot_url, username=git_username, token=git_pat, incremental=incremental)
+                st.info(f"Deploy job {job.id} submitted; objects are synced in dependency order in the background (see Jobs below).")
 else:
     st.info("Please run 'Sync with Git' first to enable deployment.")
 
+st.markdown("### Prune objects absent from Git")
+prune_tag = st.text_input("Only prune objects with this tag (optional)")
+prune_custom_field = st.text_input("Only prune objects with this custom field value (optional, e.g. 'managed_by=gitops')")
+if st.button("Preview Prune"):
+    cf_name = cf_value = None
+    scope_valid = True
+    if prune_custom_field.strip():
+        try:
+            cf_name, cf_value = parse_custom_field_scope(prune_custom_field)
+        except ValueError:
+            scope_valid = False
+    if not nautobot_token:
+        st.error("Please enter your Nautobot Token.")
+    elif not git_repo_url:
+        st.error("Please enter the Git repository URL.")
+    elif not subdirectory:
+        st.error("Please enter the directory path.")
+    elif not scope_valid:
+        st.error("Please enter the custom field scope as 'name=value', with a non-empty name and value.")
+    else:
+        job = get_job_manager().submit("prune-plan", nautobot_url, plan_prune, nautobot_token, git_repo_url, subdirectory,
+                                       nautobot_url, username=git_username, token=git_pat, tag=prune_tag or None,
+                                       custom_field=cf_name, custom_field_value=cf_value)
+        st.session_state.prune_preview = {"nautobot_url": nautobot_url, "job": job.id}
+        st.session_state.prune_plan = None
+        st.info(f"Prune preview job {job.id} submitted; the plan is shown here once it finishes.")
+
+@st.fragment(run_every=2)
+def show_prune_plan():
+    # The preview runs as a background job; its plan is picked up here once it finishes.
+    preview = st.session_state.get("prune_preview")
+    if preview and preview["nautobot_url"] == nautobot_url:
+        job = get_job_manager().get(preview["job"])
+        if job is not None and not job.done:
+            st.info(f"Prune preview job {job.id} is {job.status}...")
+            return
+        st.session_state.prune_preview = None
+        if job is not None and job.status == "succeeded" and job.result is not None:
+            st.session_state.prune_plan = {"nautobot_url": nautobot_url, "plan": job.result}
+        else:
+            st.error("Prune preview failed; see its log under Jobs below.")
+    prune_state = st.session_state.get("prune_plan")
+    if not prune_state or prune_state["nautobot_url"] != nautobot_url:
+        return
+    st.markdown("#### Objects to be deleted from Nautobot:")
+    for object_type, candidates in prune_state["plan"].items():
+        st.markdown(f"**{object_type}:** {len(candidates)}")
+        if candidates:
+            shown = ", ".join(str(obj["key"]) for obj in candidates[:50])
+            st.write(shown + (f" … and {len(candidates) - 50} more" if len(candidates) > 50 else ""))
+    if any(prune_state["plan"].values()):
+        if st.button("CONFIRM PRUNE"):
+            job = get_job_manager().submit("prune", nautobot_url, apply_prune, nautobot_token, nautobot_url, prune_state["plan"])
+            st.info(f"Prune job {job.id} submitted (see Jobs below).")
+            st.session_state.prune_plan = None
+    else:
+        st.info("Nothing to prune: Nautobot matches the Git YAML.")
+
+show_prune_plan()
+
 with stylable_container("red", css_styles="""
     button {
         background-color: #FF0000;
@@ -87,12 +160,47 @@ with stylable_container("red", css_styles="""
 
 if st.session_state.get("delete_confirm", False):
     if st.button("CONFIRM DELETE ALL DATA"):
-        try:
-            delete_all_data(nautobot_token, nautobot_url)
-            st.markdown('<div style="background-color: yellow; padding: 5px;">All data deleted successfully.</div>', unsafe_allow_html=True)
-            st.session_state.delete_confirm = False
-        except Exception as e:
-            st.error(f"An error occurred during deletion: {e}")
+        job = get_job_manager().submit("delete", nautobot_url, delete_all_data, nautobot_token, nautobot_url)
+        st.info(f"Delete job {job.id} submitted (see Jobs below).")
+        st.session_state.delete_confirm = False
+
+STYLE_ICONS = {"error": "✖", "warning": "⚠", "success": "✔", "imported": "✔"}
+
+@st.fragment(run_every=2)
+def show_jobs():
+    # Polls the background jobs for the current Nautobot URL, including ones started by other sessions.
+    jobs = get_job_manager().list_jobs(target=nautobot_url)[:10]
+    if not jobs:
+        return
+    st.markdown("### Jobs")
+    for job in jobs:
+        info = job.to_dict()
+        elapsed = (info["finished"] or time.time()) - (info["started"] or info["created"])
+        counts = info["counts"]
+        with st.expander(f"{info['kind'].title()} job {info['id']}: {info['status']} ({elapsed:.0f}s)", expanded=not job.done):
+            st.write(f"Succeeded: {counts.get('success', 0)} · Warnings: {counts.get('warning', 0)} · Errors: {counts.get('error', 0)}")
+            if info["log"]:
+                st.text("\n".join(f"{STYLE_ICONS.get(entry['style'], '•')} {entry['message']}" for entry in info["log"][-20:]))
+            if info["error"]:
+                st.error(info["error"])
+            if not job.done and st.button("Cancel", key=f"cancel-{info['id']}"):
+                get_job_manager().cancel(info["id"])
 
+show_jobs()
 
+def show_last_trace():
+    trace = last_trace()
+    if trace is None:
+        return
+    report = trace.report()
+    title = f"Last run trace: {report['pipeline']}"
+    if report["seconds"] is not None:
+        title += f" ({report['seconds']:.1f}s)"
+    with st.expander(title):
+        st.caption(f"Trace {report['trace_id']}" + (f" · {report['dropped']} span(s) not kept" if report["dropped"] else ""))
+        st.markdown("**Slowest spans** (start is the offset from the start of the run)")
+        st.dataframe(report["slowest"], use_container_width=True, hide_index=True)
+        st.markdown("**Time by span**")
+        st.dataframe(report["by_name"], use_container_width=True, hide_index=True)
 
+show_last_trace()
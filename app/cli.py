@@ -0,0 +1,280 @@
+# cli.py
+"""
+Headless entry point for CI jobs and ArgoCD hooks:
+
+    python cli.py check|deploy|delete|prune|fleet|watch|export [options]
+
+Runs the same core functions as the Streamlit app without importing Streamlit. Log lines
+go to stderr; one JSON document with counts, timings and errors is printed on stdout.
+Exit codes: 0 success, 1 the run logged errors, 2 invalid arguments, 3 drift found
+(``check --fail-on-drift``), 130 interrupted.
+"""
+import time
+
+_START = time.perf_counter()
+
+import argparse
+import importlib
+import json
+import os
+import sys
+from collections import deque
+
+EXIT_OK = 0
+EXIT_ERRORS = 1
+EXIT_USAGE = 2
+EXIT_DRIFT = 3
+EXIT_INTERRUPTED = 130
+MAX_WATCH_MESSAGES = 1000
+
+class UsageError(Exception):
+    pass
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="nautobot-gitops", description="Sync Nautobot with YAML objects stored in Git.")
+    parser.add_argument("--quiet", action="store_true", help="do not echo log messages on stderr")
+    parser.add_argument("--trace-file", default=os.environ.get("TRACES_FILE"),
+                        help="append the run's trace spans (OTLP JSON, one line per run) to this file; defaults to $TRACES_FILE")
+    parser.add_argument("--profile-dir", default=os.environ.get("PROFILE_DIR"),
+                        help="write CPU profiles and a per-phase memory report of the run here; defaults to $PROFILE_DIR")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_nautobot_args(sub):
+        sub.add_argument("--nautobot-url", default=os.environ.get("NAUTOBOT_URL", "http://localhost:8080"))
+        sub.add_argument("--nautobot-token", default=os.environ.get("NAUTOBOT_TOKEN"),
+                         help="defaults to $NAUTOBOT_TOKEN")
+
+    def add_git_args(sub, subdirectory: bool = True):
+        sub.add_argument("--repo", required=True, help="Git repository URL (ending with .git)")
+        if subdirectory:
+            sub.add_argument("--subdirectory", required=True, help="directory of the YAML object files within the repo")
+        sub.add_argument("--git-username", default=os.environ.get("GIT_USERNAME"))
+        sub.add_argument("--git-token", default=os.environ.get("GIT_TOKEN"), help="defaults to $GIT_TOKEN")
+
+    check = subparsers.add_parser("check", help="validate the YAML and compare it with Nautobot")
+    add_nautobot_args(check)
+    add_git_args(check)
+    check.add_argument("--fail-on-drift", action="store_true", help="exit with 3 when objects are missing from or differ in Nautobot")
+
+    deploy = subparsers.add_parser("deploy", help="import all objects in dependency order")
+    add_nautobot_args(deploy)
+    add_git_args(deploy)
+    deploy.add_argument("--incremental", action="store_true", help="only re-read files/shards changed since the last deploy")
+
+    delete = subparsers.add_parser("delete", help="delete all supported objects from Nautobot")
+    add_nautobot_args(delete)
+    delete.add_argument("--yes", action="store_true", help="confirm the deletion")
+
+    prune = subparsers.add_parser("prune", help="delete Nautobot objects absent from the Git YAML")
+    add_nautobot_args(prune)
+    add_git_args(prune)
+    prune.add_argument("--tag", help="only prune objects with this tag")
+    prune.add_argument("--custom-field", help="only prune objects with this custom field value (name=value)")
+    prune.add_argument("--dry-run", action="store_true", help="only report what would be deleted")
+
+    fleet = subparsers.add_parser("fleet", help="deploy nautobot-instances/<name>/ to every instance of a fleet")
+    add_git_args(fleet, subdirectory=False)
+    fleet.add_argument("--instances", required=True,
+                       help="YAML file mapping instance names to url, token or token_env, and optional max_concurrency")
+    fleet.add_argument("--base-directory", default="nautobot-instances", help="directory holding one subdirectory per instance")
+    fleet.add_argument("--parallel", type=int, default=4, help="instances deployed at the same time")
+    fleet.add_argument("--incremental", action="store_true", help="only re-read files/shards changed since the last deploy")
+
+    watch = subparsers.add_parser("watch", help="apply new commits continuously (one Nautobot, or a fleet with --instances)")
+    add_nautobot_args(watch)
+    add_git_args(watch, subdirectory=False)
+    watch.add_argument("--subdirectory", help="directory of the YAML object files within the repo (without --instances)")
+    watch.add_argument("--instances", help="fleet file as for fleet; every instance is watched")
+    watch.add_argument("--base-directory", default="nautobot-instances", help="directory holding one subdirectory per instance")
+    watch.add_argument("--interval", type=float, default=60, help="seconds between polls of the repository")
+    watch.add_argument("--jitter", type=float, default=10, help="random seconds added to each poll interval")
+    watch.add_argument("--debounce", type=float, default=30, help="apply a new commit once HEAD has not moved for this long")
+    watch.add_argument("--max-wait", type=float, default=300,
+                       help="apply anyway once a target has been behind this long, even if commits keep coming")
+    watch.add_argument("--max-concurrency", type=int, default=2, help="targets reconciled at the same time")
+    watch.add_argument("--drift-interval", type=float,
+                       help="check up-to-date targets for objects missing from or differing in Nautobot this often (seconds)")
+    watch.add_argument("--webhook-port", type=int, default=int(os.environ.get("WATCH_PORT") or 0) or None,
+                       help="serve POST /hook (push notifications) and GET /status on this port; defaults to $WATCH_PORT")
+    watch.add_argument("--once", action="store_true", help="apply the current HEAD where needed and exit")
+
+    export = subparsers.add_parser("export", help="write Nautobot's objects as YAML object files (onboarding)")
+    add_nautobot_args(export)
+    export.add_argument("--output", required=True, help="directory the object files are written to")
+    export.add_argument("--shard-size", type=int, default=10000,
+                        help="write types with more objects than this as shards (0: never)")
+    return parser
+
+def run_check(args) -> tuple:
+    from sync import compare_objects
+    result = compare_objects(args.nautobot_token, args.repo, args.subdirectory, args.nautobot_url,
+                             username=args.git_username, token=args.git_token)
+    if result is None:
+        return None, EXIT_ERRORS
+    missing = {object_type: keys or [] for object_type, keys in result["compare_results"].items()}
+    result = {"files": result["files"], "validation_errors": result["validation_errors"], "missing": missing,
+              "digests": result["digests"]}
+    if args.fail_on_drift and any(missing.values()):
+        return result, EXIT_DRIFT
+    return result, EXIT_ERRORS if result["validation_errors"] else EXIT_OK
+
+def run_deploy(args) -> tuple:
+    from deploy import sync_all_objects_from_git
+    sync_all_objects_from_git(args.nautobot_token, args.repo, args.subdirectory, args.nautobot_url,
+                              username=args.git_username, token=args.git_token, incremental=args.incremental)
+    return None, EXIT_OK
+
+def run_delete(args) -> tuple:
+    if not args.yes:
+        raise UsageError("refusing to delete without --yes")
+    from delete import delete_all_data
+    delete_all_data(args.nautobot_token, args.nautobot_url)
+    return None, EXIT_OK
+
+def run_prune(args) -> tuple:
+    from prune import apply_prune, parse_custom_field_scope, plan_prune
+    custom_field, custom_field_value = None, None
+    if args.custom_field is not None:
+        try:
+            custom_field, custom_field_value = parse_custom_field_scope(args.custom_field)
+        except ValueError:
+            raise UsageError("--custom-field must be given as name=value, with a non-empty name and value")
+    plan = plan_prune(args.nautobot_token, args.repo, args.subdirectory, args.nautobot_url,
+                      username=args.git_username, token=args.git_token, tag=args.tag,
+                      custom_field=custom_field, custom_field_value=custom_field_value)
+    if plan is None:
+        return None, EXIT_ERRORS
+    result = {"plan": {object_type: [obj["key"] for obj in candidates] for object_type, candidates in plan.items()}}
+    if not args.dry_run:
+        result["deleted"] = apply_prune(args.nautobot_token, args.nautobot_url, plan)
+    return result, EXIT_OK
+
+def load_instances(path: str) -> dict:
+    """Read a fleet file; tokens can be given inline or, preferably, as the name of an environment variable."""
+    import yaml
+    try:
+        with open(path, "r") as f:
+            data = yaml.safe_load(f) or {}
+    except (OSError, yaml.YAMLError) as e:
+        raise UsageError(f"cannot read {path}: {e}")
+    instances = data.get("instances", data) if isinstance(data, dict) else None
+    if not isinstance(instances, dict) or not instances:
+        raise UsageError(f"{path} must map instance names to their settings")
+    for name, config in instances.items():
+        if not isinstance(config, dict) or not config.get("url"):
+            raise UsageError(f"instance {name} needs a url")
+        if config.get("token_env"):
+            config["token"] = os.environ.get(config["token_env"])
+        if not config.get("token"):
+            raise UsageError(f"instance {name} has no token (token or token_env)")
+    return instances
+
+def run_fleet(args) -> tuple:
+    instances = load_instances(args.instances)
+    from fleet import deploy_fleet
+    summary = deploy_fleet(instances, args.repo, base_directory=args.base_directory, username=args.git_username,
+                           token=args.git_token, max_parallel=args.parallel, incremental=args.incremental)
+    if summary is None:
+        return None, EXIT_ERRORS
+    return {"instances": summary}, EXIT_OK if all(result["ok"] for result in summary.values()) else EXIT_ERRORS
+
+def run_watch(args) -> tuple:
+    import signal
+    from watch import WatchTarget, Watcher, start_webhook_server
+    from metrics import start_metrics_server_from_env
+    if args.instances:
+        targets = [WatchTarget(name, config["url"], config["token"], f"{args.base_directory.strip('/')}/{name}", args.repo)
+                   for name, config in load_instances(args.instances).items()]
+    elif args.subdirectory:
+        if not args.nautobot_token:
+            raise UsageError("a Nautobot token is required (--nautobot-token or $NAUTOBOT_TOKEN)")
+        targets = [WatchTarget(args.subdirectory.strip("/").rsplit("/", 1)[-1], args.nautobot_url, args.nautobot_token,
+                               args.subdirectory, args.repo)]
+    else:
+        raise UsageError("watch needs --subdirectory or --instances")
+    watcher = Watcher(args.repo, targets, username=args.git_username, token=args.git_token, interval=args.interval,
+                      jitter=args.jitter, debounce=args.debounce, max_wait=args.max_wait,
+                      max_concurrency=args.max_concurrency, drift_interval=args.drift_interval)
+    start_metrics_server_from_env()
+    server = start_webhook_server(watcher, args.webhook_port) if args.webhook_port else None
+    # Kubernetes stops pods with SIGTERM: finish the applies in progress, then exit.
+    signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+    try:
+        watcher.run(once=args.once)
+    finally:
+        if server is not None:
+            server.shutdown()
+    status = watcher.status()
+    return status, EXIT_OK if all(target["ok"] is not False for target in status["targets"].values()) else EXIT_ERRORS
+
+def run_export(args) -> tuple:
+    from export import export_objects
+    exported = export_objects(args.nautobot_token, args.output, args.nautobot_url, shard_size=args.shard_size or None)
+    return {"files": exported}, EXIT_OK
+
+COMMANDS = {"check": run_check, "deploy": run_deploy, "delete": run_delete, "prune": run_prune, "fleet": run_fleet,
+            "watch": run_watch, "export": run_export}
+# Module each command needs; imported before the start-up time is taken so it reflects the real cold start.
+COMMAND_MODULES = {"check": "sync", "deploy": "deploy", "delete": "delete", "prune": "prune", "fleet": "fleet",
+                   "watch": "watch", "export": "export"}
+
+def main(argv: list | None = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    # fleet and watch --instances take their tokens from the fleet file; watch checks its own.
+    if args.command not in ("fleet", "watch") and not args.nautobot_token:
+        parser.error("a Nautobot token is required (--nautobot-token or $NAUTOBOT_TOKEN)")
+    from logger import console
+    # A watcher runs for days; only its latest messages are kept for the summary.
+    messages = deque(maxlen=MAX_WATCH_MESSAGES) if args.command == "watch" else []
+
+    def sink(message: str, style: str | None):
+        messages.append({"style": style or "info", "message": message})
+        if not args.quiet:
+            print(f"[{style or 'info'}] {message}", file=sys.stderr, flush=True)
+
+    importlib.import_module(COMMAND_MODULES[args.command])
+    if args.profile_dir:
+        import profiling
+        profiling.enable_profiling(args.profile_dir)
+    tracer = None
+    if args.trace_file or os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        import tracing
+        tracer = tracing.enable_tracing(traces_file=args.trace_file)
+    startup_seconds = time.perf_counter() - _START
+    run_start = time.perf_counter()
+    result, exit_code = None, EXIT_OK
+    with console.redirect(sink):
+        try:
+            result, exit_code = COMMANDS[args.command](args)
+        except UsageError as e:
+            parser.error(str(e))
+        except KeyboardInterrupt:
+            exit_code = EXIT_INTERRUPTED
+        except Exception as e:
+            console.log(f"Unhandled error: {e}", style="error")
+    counts = dict(console.counts)
+    if tracer is not None:
+        tracer.flush()
+    if exit_code == EXIT_OK and counts.get("error"):
+        exit_code = EXIT_ERRORS
+    summary = {
+        "command": args.command,
+        "ok": exit_code == EXIT_OK,
+        "exit_code": exit_code,
+        "counts": counts,
+        "timings": {
+            "startup_seconds": round(startup_seconds, 4),
+            "run_seconds": round(time.perf_counter() - run_start, 4),
+        },
+        "errors": [m["message"] for m in messages if m["style"] == "error"],
+        "warnings": [m["message"] for m in messages if m["style"] == "warning"],
+        "result": result,
+    }
+    if tracer is not None and tracer.last_trace():
+        summary["trace_id"] = tracer.last_trace().trace_id
+    print(json.dumps(summary, indent=2, default=list))
+    return exit_code
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,20 @@
-from nautobot_client import NautobotClient
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from nautobot_client import NautobotAPIError, NautobotClient
+from instrumentation import add_objects, bind_stage, run, stage
 from logger import console
 
-def delete_all_data(nautobot_token: str, nautobot_url: str = "http://localhost:8080"):
+# Objects per bulk DELETE request, and bulk requests in flight per object type.
+DELETE_CHUNK_SIZE = 250
+DELETE_WORKERS = 4
+
+@run("delete")
+def delete_all_data(nautobot_token: str, nautobot_url: str = "http://localhost:8080",
+                    chunk_size: int = DELETE_CHUNK_SIZE, workers: int = DELETE_WORKERS):
     nautobot_client = NautobotClient(url=nautobot_url, token=nautobot_token)
+    # Each type is a barrier: it is only listed once the previous one is fully deleted. Objects
+    # removed by a cascade (interfaces and their IP mappings with devices, interface templates
+    # with device types) are therefore never listed or deleted separately.
     deletion_order = [
         {"endpoint": "/api/dcim/devices/", "object_type": "Devices"},
         {"endpoint": "/api/ipam/ip-addresses/", "object_type": "IP Addresses"},
@@ -17,22 +29,76 @@ def delete_all_data(nautobot_token: str, nautobot_url: str = "http://localhost:8
     for item in deletion_order:
         ep = item["endpoint"]
         obj_type = item["object_type"]
-        try:
-            response = nautobot_client.http_call(method="get", url=ep + "?limit=0")
-            objects = response.get("results", [])
-        except Exception as e:
-            console.log(f"Error retrieving {obj_type} for deletion: {e}", style="error")
-            continue
-        for obj in objects:
-            name = obj.get("name") or obj.get("model") or obj.get("prefix") or obj.get("host")
-            obj_id = obj.get("id")
-            if obj_id:
-                delete_url = f"{ep}{obj_id}/"
-                try:
-                    nautobot_client.http_call(method="delete", url=delete_url)
-                    label = "IP Address" if obj_type == "IP Addresses" else ("Prefix" if obj_type == "Prefixes" else obj_type)
-                    console.log(f"Deleted {label}: {name}", style="success")
-                except Exception as e:
-                    console.log(f"Error deleting {obj_type if obj_type != 'Prefixes' else 'Prefix'} '{name}': {e}", style="error")
+        with stage(obj_type):
+            try:
+                object_ids = list_object_ids(nautobot_client, ep)
+            except Exception as e:
+                console.log(f"Error retrieving {obj_type} for deletion: {e}", style="error")
+                continue
+            add_objects(bulk_delete(nautobot_client, ep, obj_type, object_ids, chunk_size=chunk_size, workers=workers))
+    nautobot_client.stats.report()
     console.log("Deletion process completed.", style="warning")
 
+def list_object_ids(nautobot_client: NautobotClient, endpoint: str, params: dict = None) -> list:
+    """
+    Page through a list endpoint and keep only the object ids.
+
+    Nautobot's REST API has no field selection, so each page is requested without nested
+    objects or many-to-many fields and everything but the id is dropped right away.
+    """
+    page_params = dict(params or {}, depth=0, exclude_m2m="true")
+    return [obj["id"] for obj in nautobot_client.iter_results(endpoint, params=page_params) if obj.get("id")]
+
+def bulk_delete(nautobot_client: NautobotClient, endpoint: str, object_type: str, object_ids: list,
+                chunk_size: int = DELETE_CHUNK_SIZE, workers: int = DELETE_WORKERS) -> int:
+    """
+    Delete ``object_ids`` with chunked bulk DELETE requests sent concurrently, reporting
+    progress and throughput. Returns the number of objects deleted.
+    """
+    if not object_ids:
+        console.log(f"No {object_type} to delete.", style="info")
+        return 0
+    total = len(object_ids)
+    chunks = [object_ids[i:i + chunk_size] for i in range(0, total, chunk_size)]
+    console.log(f"Deleting {total} {object_type} in {len(chunks)} bulk request(s).", style="info")
+    start = time.perf_counter()
+    deleted = 0
+    next_report = 0.25
+    # Worker threads only send requests; all logging happens here, on the calling thread.
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(bind_stage(_delete_chunk), nautobot_client, endpoint, chunk) for chunk in chunks]
+        for future in as_completed(futures):
+            chunk_deleted, errors = future.result()
+            deleted += chunk_deleted
+            for error in errors:
+                console.log(f"Error deleting {object_type}: {error}", style="error")
+            if deleted / total >= next_report and deleted < total:
+                console.log(f"Deleted {deleted}/{total} {object_type}...", style="info")
+                next_report += 0.25
+    elapsed = time.perf_counter() - start
+    rate = deleted / elapsed if elapsed > 0 else deleted
+    console.log(f"Deleted {deleted}/{total} {object_type} in {elapsed:.1f}s ({rate:.0f}/s).",
+                style="success" if deleted == total else "warning")
+    return deleted
+
+def _delete_chunk(nautobot_client: NautobotClient, endpoint: str, chunk: list):
+    try:
+        nautobot_client.http_call(method="delete", url=endpoint, json_data=[{"id": obj_id} for obj_id in chunk])
+        return len(chunk), []
+    except Exception:
+        pass
+    # The bulk request is atomic; retry one by one so a single bad object doesn't block its chunk.
+    deleted, errors = 0, []
+    for obj_id in chunk:
+        try:
+            nautobot_client.http_call(method="delete", url=f"{endpoint}{obj_id}/")
+            deleted += 1
+        except NautobotAPIError as e:
+            if e.status_code == 404:
+                # Already removed by a cascade.
+                deleted += 1
+            else:
+                errors.append(f"{obj_id}: {e}")
+        except Exception as e:
+            errors.append(f"{obj_id}: {e}")
+    return deleted, errors
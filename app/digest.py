@@ -0,0 +1,100 @@
+# digest.py
+"""
+Merkle-style digests of the objects of one type, so a drift check compares a few hashes
+instead of every object.
+
+Each object is hashed from a canonical serialization of its type, key and compared fields
+(the ids of references such as role or status), so an object whose attributes drifted
+hashes differently from the one in git. Hashes are summed modulo 2**128 into BUCKETS
+buckets by their first byte. Sums make the digest independent of object order, let the
+trees of a type's shards be added into the type's tree and let a tree be updated one
+object at a time; the root is a hash of the bucket digests. Equal roots mean both sides
+hold the same objects with the same fields; otherwise only the buckets whose digests differ
+need their objects compared.
+"""
+import hashlib
+import json
+
+BUCKETS = 256
+MODULUS = 2 ** 128
+
+def object_hash(object_type: str, key, fields: dict | None = None) -> int:
+    canonical = json.dumps([object_type, key, fields or {}], sort_keys=True, separators=(",", ":"), default=str)
+    return int.from_bytes(hashlib.blake2b(canonical.encode(), digest_size=16).digest(), "big")
+
+def bucket_of(digest: int) -> int:
+    return digest >> 120
+
+class DigestTree:
+    __slots__ = ("object_type", "buckets", "leaves")
+
+    def __init__(self, object_type: str, keys=()):
+        self.object_type = object_type
+        self.buckets = [0] * BUCKETS
+        # bucket -> {key: [leaf digests]}, to descend into the buckets that differ. A key has several leaves
+        # when objects share it, e.g. the same prefix in two namespaces.
+        self.leaves = {}
+        for key in keys:
+            self.add(key)
+
+    def add(self, key, fields: dict | None = None):
+        self.add_leaf(key, object_hash(self.object_type, key, fields))
+
+    def add_leaf(self, key, digest: int):
+        """Add an object whose digest is already known (see object_hash)."""
+        bucket = bucket_of(digest)
+        self.buckets[bucket] = (self.buckets[bucket] + digest) % MODULUS
+        self.leaves.setdefault(bucket, {}).setdefault(key, []).append(digest)
+
+    def merge(self, other: "DigestTree") -> "DigestTree":
+        """Add ``other``'s objects (e.g. another shard of the same type) to this tree."""
+        for bucket, digest in enumerate(other.buckets):
+            self.buckets[bucket] = (self.buckets[bucket] + digest) % MODULUS
+        for bucket, leaves in other.leaves.items():
+            for key, digests in leaves.items():
+                self.leaves.setdefault(bucket, {}).setdefault(key, []).extend(digests)
+        return self
+
+    def matching(self, other: "DigestTree") -> "DigestTree":
+        """
+        This tree restricted to the keys of ``other``, e.g. Nautobot's objects restricted
+        to the ones git manages, so objects only Nautobot holds do not make roots differ.
+        A key with several leaves here keeps the one equal to ``other``'s, if any.
+        """
+        wanted = {}
+        for leaves in other.leaves.values():
+            for key, digests in leaves.items():
+                wanted[key] = set(digests)
+        found = {}
+        for leaves in self.leaves.values():
+            for key, digests in leaves.items():
+                if key in wanted:
+                    found.setdefault(key, []).extend(digests)
+        tree = DigestTree(self.object_type)
+        for key, digests in found.items():
+            tree.add_leaf(key, next((digest for digest in digests if digest in wanted[key]), digests[0]))
+        return tree
+
+    @property
+    def root(self) -> str:
+        return hashlib.blake2b(b"".join(digest.to_bytes(16, "big") for digest in self.buckets), digest_size=16).hexdigest()
+
+    def differing(self, other: "DigestTree") -> list:
+        """Buckets whose digests differ between the two trees."""
+        return [bucket for bucket in range(BUCKETS) if self.buckets[bucket] != other.buckets[bucket]]
+
+    def missing_from(self, other: "DigestTree") -> set:
+        """
+        Keys of this tree absent from ``other`` or whose fields differ there, looking only
+        into the buckets that differ. A changed object's leaf moves to another bucket, so
+        a leaf not found in ``other``'s bucket is a key to report.
+        """
+        if self.root == other.root:
+            return set()
+        missing = set()
+        for bucket in self.differing(other):
+            theirs = other.leaves.get(bucket, {})
+            for key, digests in self.leaves.get(bucket, {}).items():
+                if not set(digests) <= set(theirs.get(key, ())):
+                    missing.add(key)
+        return missing
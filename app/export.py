@@ -0,0 +1,267 @@
+# export.py
+"""
+Export the objects of an existing Nautobot as the YAML object files deploy reads, to
+onboard a brownfield instance:
+
+    python cli.py export --nautobot-url https://nautobot.example.com --output nautobot-instances/prod
+
+Every type is listed page by page without nested objects and written as it is read, so
+memory does not grow with the number of objects. References are resolved from id -> name
+maps of the referenced types, exported first. Devices are read one page at a time; the
+interfaces, IP mappings and IP addresses of DEVICE_BATCH devices are fetched with a few
+filtered list requests and nested under each device in the ``devices.yml`` shape. Interface
+templates are grouped by device type, as in ``interface_templates.yml``. A type with more
+than ``shard_size`` objects is written as shards (``devices/part-0001.yml``, ...), which
+check and deploy read like the flat file. Existing files of the exported types are
+replaced. Location parents are not exported, since deploy does not create them.
+"""
+import os
+import shutil
+import yaml
+from nautobot_client import NautobotClient
+from logger import console
+from instrumentation import add_objects, run, stage
+
+PAGE_SIZE = 1000
+DEFAULT_SHARD_SIZE = 10000
+# Devices whose interfaces and IP addresses are fetched together, and ids per filtered request (URLs stay under 8 KB).
+DEVICE_BATCH = 50
+ID_BATCH = 100
+# Many-to-many fields (tags...) are only requested for the types that need them (content_types).
+LIST_PARAMS = {"depth": 0}
+LEAN_PARAMS = {"depth": 0, "exclude_m2m": "true"}
+
+# libyaml's dumper is about four times faster; it does not indent lists nested in mappings, which YAML allows.
+_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+def _id(value):
+    return value.get("id") if isinstance(value, dict) else value
+
+def _ref(value, names: dict):
+    """Name of a referenced object; references already given by name (older payloads) are kept."""
+    if isinstance(value, dict):
+        return names.get(value.get("id"))
+    return value
+
+def _choice(value, label: bool = False):
+    """Value (or label) of a choice field such as an interface type."""
+    if isinstance(value, dict):
+        return value.get("label" if label else "value")
+    return value
+
+def _compact(entry: dict) -> dict:
+    return {key: value for key, value in entry.items() if value not in (None, [], "")}
+
+class ShardWriter:
+    """
+    Write objects to ``<filename>`` one at a time; once it holds ``shard_size`` objects it
+    becomes ``<name>/part-0001.yml`` and the next ones go to further parts.
+    """
+
+    def __init__(self, output_dir: str, filename: str, shard_size: int | None = DEFAULT_SHARD_SIZE):
+        self.path = os.path.join(output_dir, filename)
+        self.shard_dir = os.path.join(output_dir, os.path.splitext(filename)[0])
+        self.shard_size = shard_size
+        self.count = 0
+        self.parts = 0
+        if os.path.isdir(self.shard_dir):
+            shutil.rmtree(self.shard_dir)
+        self._file = self._open(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _open(self, path: str):
+        f = open(path, "w")
+        f.write("---\n")
+        return f
+
+    def _part_path(self, part: int) -> str:
+        return os.path.join(self.shard_dir, f"part-{part:04d}.yml")
+
+    def write(self, obj: dict):
+        if self.shard_size and self.count and self.count % self.shard_size == 0:
+            self._file.close()
+            if not self.parts:
+                os.makedirs(self.shard_dir, exist_ok=True)
+                os.replace(self.path, self._part_path(1))
+                self.parts = 1
+            self.parts += 1
+            self._file = self._open(self._part_path(self.parts))
+        self._file.write(yaml.dump([obj], Dumper=_DUMPER, sort_keys=False, default_flow_style=False, allow_unicode=True))
+        self.count += 1
+
+    def close(self):
+        self._file.close()
+        if not self.count:
+            os.remove(self.path)
+
+@run("export")
+def export_objects(nautobot_token: str, output_dir: str, nautobot_url: str = "http://localhost:8080",
+                   shard_size: int | None = DEFAULT_SHARD_SIZE) -> dict:
+    """Write the object files of every supported type to ``output_dir``; returns the objects exported per file."""
+    nautobot_client = NautobotClient(url=nautobot_url, token=nautobot_token)
+    os.makedirs(output_dir, exist_ok=True)
+    # endpoint -> {id: name (or model)} of the types referenced by others.
+    names = {}
+    # Prefix id -> namespace name, for IP addresses that only reference their parent prefix.
+    prefix_namespaces = {}
+    exported = {}
+
+    def export_type(filename: str, endpoint: str, convert, key: str | None = "name", params: dict = LEAN_PARAMS):
+        with stage(filename):
+            lookup = names.setdefault(endpoint, {}) if key else None
+            try:
+                with ShardWriter(output_dir, filename, shard_size) as writer:
+                    for obj in nautobot_client.iter_results(endpoint, params=params, page_size=PAGE_SIZE):
+                        if lookup is not None and obj.get(key):
+                            lookup[obj["id"]] = obj[key]
+                        entry = convert(obj)
+                        if entry:
+                            writer.write(entry)
+            except Exception as e:
+                console.log(f"Error exporting {filename}: {e}", style="error")
+                return
+            _report(filename, writer, exported)
+
+    with stage("lookups"):
+        try:
+            names["/api/ipam/namespaces/"] = {ns["id"]: ns["name"] for ns in nautobot_client.iter_results(
+                "/api/ipam/namespaces/", params=LEAN_PARAMS, page_size=PAGE_SIZE) if ns.get("name")}
+        except Exception as e:
+            console.log(f"Error retrieving namespaces: {e}", style="error")
+            names["/api/ipam/namespaces/"] = {}
+    export_type("statuses.yml", "/api/extras/statuses/", lambda obj: _compact({
+        "name": obj.get("name"), "content_types": obj.get("content_types"), "color": obj.get("color")}), params=LIST_PARAMS)
+    export_type("roles.yml", "/api/extras/roles/", lambda obj: _compact({
+        "name": obj.get("name"), "color": obj.get("color"), "content_types": obj.get("content_types")}), params=LIST_PARAMS)
+    export_type("manufacturers.yml", "/api/dcim/manufacturers/", lambda obj: _compact({"name": obj.get("name")}))
+    export_type("location_types.yml", "/api/dcim/location-types/", lambda obj: _compact({
+        "name": obj.get("name"), "content_types": obj.get("content_types")}), params=LIST_PARAMS)
+    export_type("device_types.yml", "/api/dcim/device-types/", lambda obj: _compact({
+        "model": obj.get("model"), "manufacturer": _ref(obj.get("manufacturer"), names["/api/dcim/manufacturers/"]),
+        # Nautobot's default height, for device types listed without one.
+        "u_height": obj.get("u_height", 1)}), key="model")
+    with stage("interface_templates.yml"):
+        try:
+            export_interface_templates(nautobot_client, output_dir, names["/api/dcim/device-types/"], shard_size, exported)
+        except Exception as e:
+            console.log(f"Error exporting interface_templates.yml: {e}", style="error")
+    export_type("locations.yml", "/api/dcim/locations/", lambda obj: _compact({
+        "name": obj.get("name"), "location_type": _ref(obj.get("location_type"), names["/api/dcim/location-types/"]),
+        "status": _ref(obj.get("status"), names["/api/extras/statuses/"])}))
+
+    def convert_prefix(obj: dict) -> dict:
+        namespace = _ref(obj.get("namespace"), names["/api/ipam/namespaces/"])
+        if namespace:
+            prefix_namespaces[obj["id"]] = namespace
+        return _compact({"prefix": obj.get("prefix"), "namespace": namespace, "type": _choice(obj.get("type"), label=True),
+                         "status": _ref(obj.get("status"), names["/api/extras/statuses/"])})
+
+    export_type("prefixes.yml", "/api/ipam/prefixes/", convert_prefix, key=None)
+    with stage("devices.yml"):
+        try:
+            export_devices(nautobot_client, output_dir, names, prefix_namespaces, shard_size, exported)
+        except Exception as e:
+            console.log(f"Error exporting devices.yml: {e}", style="error")
+    nautobot_client.stats.report()
+    files = sum(1 for count in exported.values() if count)
+    console.log(f"Export completed: {sum(exported.values())} object(s) in {files} file(s) under {output_dir}.",
+                style="warning")
+    return exported
+
+def _report(filename: str, writer: ShardWriter, exported: dict):
+    exported[filename] = writer.count
+    add_objects(writer.count)
+    shards = f" in {writer.parts} shard(s)" if writer.parts else ""
+    console.log(f"Exported {writer.count} object(s) to {filename}{shards}.", style="info")
+
+def _list_by(nautobot_client: NautobotClient, endpoint: str, field: str, values) -> list:
+    """The objects of ``endpoint`` matching any of ``values`` for ``field``, ID_BATCH values per request."""
+    values = list(dict.fromkeys(value for value in values if value))
+    results = []
+    for start in range(0, len(values), ID_BATCH):
+        params = dict(LEAN_PARAMS, **{field: values[start:start + ID_BATCH]})
+        results.extend(nautobot_client.iter_results(endpoint, params=params, page_size=PAGE_SIZE))
+    return results
+
+def export_interface_templates(nautobot_client: NautobotClient, output_dir: str, device_types: dict,
+                               shard_size: int | None, exported: dict):
+    """Write interface_templates.yml, one ``{model: [templates]}`` entry per device type."""
+    # Templates are held until all are read to group them; there are a few per device type, not per device.
+    templates = {}
+    for template in nautobot_client.iter_results("/api/dcim/interface-templates/", params=LEAN_PARAMS, page_size=PAGE_SIZE):
+        templates.setdefault(_id(template.get("device_type")), []).append(_compact({
+            "name": template.get("name"), "type": _choice(template.get("type")),
+            "mgmt_only": True if template.get("mgmt_only") else None,
+        }))
+    with ShardWriter(output_dir, "interface_templates.yml", shard_size) as writer:
+        for device_type_id, model in device_types.items():
+            if templates.get(device_type_id):
+                writer.write({model: templates[device_type_id]})
+    _report("interface_templates.yml", writer, exported)
+
+def export_devices(nautobot_client: NautobotClient, output_dir: str, names: dict, prefix_namespaces: dict,
+                   shard_size: int | None, exported: dict):
+    """Write devices.yml with each device's interfaces and their IP addresses nested, DEVICE_BATCH devices at a time."""
+    with ShardWriter(output_dir, "devices.yml", shard_size) as writer:
+        batch = []
+        for device in nautobot_client.iter_results("/api/dcim/devices/", params=LEAN_PARAMS, page_size=PAGE_SIZE):
+            batch.append(device)
+            if len(batch) == DEVICE_BATCH:
+                _write_devices(nautobot_client, writer, batch, names, prefix_namespaces)
+                batch = []
+        if batch:
+            _write_devices(nautobot_client, writer, batch, names, prefix_namespaces)
+    _report("devices.yml", writer, exported)
+
+def _write_devices(nautobot_client: NautobotClient, writer: ShardWriter, devices: list, names: dict,
+                   prefix_namespaces: dict):
+    statuses = names["/api/extras/statuses/"]
+    interfaces = _list_by(nautobot_client, "/api/dcim/interfaces/", "device", (device["id"] for device in devices))
+    mappings = _list_by(nautobot_client, "/api/ipam/ip-address-to-interface/", "interface",
+                        (interface["id"] for interface in interfaces))
+    ip_ids = [_id(mapping.get("ip_address")) for mapping in mappings]
+    ips = {ip["id"]: ip for ip in _list_by(nautobot_client, "/api/ipam/ip-addresses/", "id", ip_ids)}
+    # Primary IPs are normally among the device's own; any other is fetched separately.
+    missing = [_id(device.get("primary_ip4")) for device in devices if _id(device.get("primary_ip4")) not in ips]
+    ips.update((ip["id"], ip) for ip in _list_by(nautobot_client, "/api/ipam/ip-addresses/", "id", missing))
+    interfaces_by_device = {}
+    for interface in interfaces:
+        interfaces_by_device.setdefault(_id(interface.get("device")), []).append(interface)
+    ips_by_interface = {}
+    for mapping in mappings:
+        ips_by_interface.setdefault(_id(mapping.get("interface")), []).append(_id(mapping.get("ip_address")))
+    for device in devices:
+        if not device.get("name"):
+            continue
+        device_interfaces = []
+        for interface in interfaces_by_device.get(device["id"], []):
+            addresses = []
+            for ip_id in ips_by_interface.get(interface["id"], []):
+                ip = ips.get(ip_id)
+                if ip is None:
+                    continue
+                namespace = (_ref(ip.get("namespace"), names["/api/ipam/namespaces/"])
+                             or prefix_namespaces.get(_id(ip.get("parent"))))
+                addresses.append(_compact({"address": ip.get("address"), "namespace": namespace,
+                                           "type": _choice(ip.get("type"), label=True),
+                                           "status": _ref(ip.get("status"), statuses)}))
+            device_interfaces.append(_compact({
+                "name": interface.get("name"), "type": _choice(interface.get("type")),
+                "status": _ref(interface.get("status"), statuses),
+                "mgmt_only": True if interface.get("mgmt_only") else None, "ip-address": addresses,
+            }))
+        primary_ip = ips.get(_id(device.get("primary_ip4")))
+        writer.write(_compact({
+            "name": device["name"],
+            "role": _ref(device.get("role"), names["/api/extras/roles/"]),
+            "status": _ref(device.get("status"), statuses),
+            "location": _ref(device.get("location"), names["/api/dcim/locations/"]),
+            "device-type": _ref(device.get("device_type"), names["/api/dcim/device-types/"]),
+            "primary_ip4": primary_ip.get("address") if primary_ip else None,
+            "interfaces": device_interfaces,
+        }))
@@ -0,0 +1,137 @@
+# fleet.py
+import os
+import queue
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from nautobot_client import NautobotClient
+from logger import console
+from loader import ParseCache, ShardTracker, repo_blob_shas
+from jobs import JobCancelled
+from deploy import deploy_objects
+from instrumentation import run, stage
+from state import state_key, state_path
+from snapshot import Snapshot
+from validation import nautobot_keys, validate_repo
+
+FLEET_BASE_DIRECTORY = "nautobot-instances"
+# Instances deployed at the same time, and requests in flight per instance unless an instance sets its own.
+FLEET_PARALLEL = 4
+INSTANCE_CONCURRENCY = 4
+
+@run("fleet")
+def deploy_fleet(instances: dict, git_repo_url: str, base_directory: str = FLEET_BASE_DIRECTORY,
+                 username: str = None, token: str = None, max_parallel: int = FLEET_PARALLEL,
+                 incremental: bool = False) -> dict | None:
+    """
+    Deploy ``<base_directory>/<name>/`` to every instance of a fleet from a single clone.
+
+    ``instances`` maps an instance directory name to ``{"url", "token"}`` and optionally
+    ``max_concurrency``. Files are parsed once per distinct content and shared between
+    instances; each instance gets its own client (connection pool and request limit) and
+    runs in its own thread. Messages are logged as ``[name] message`` from the calling
+    thread. Returns a summary per instance, or None if the clone failed.
+    """
+    import git
+    console.log(f"Cloning repository: {git_repo_url}", style="info")
+    source_repo_url = git_repo_url
+    if username and token:
+        if git_repo_url.startswith("https://"):
+            git_repo_url = git_repo_url.replace("https://", f"https://{username}:{token}@")
+        elif git_repo_url.startswith("http://"):
+            git_repo_url = git_repo_url.replace("http://", f"http://{username}:{token}@")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        try:
+            with stage("clone"):
+                repo = git.Repo.clone_from(git_repo_url, temp_dir)
+        except Exception as e:
+            console.log(f"Error cloning repository: {e}", style="error")
+            return None
+        blob_shas = repo_blob_shas(repo, base_directory)
+        cache = ParseCache(blob_shas)
+        messages = queue.Queue()
+        stop = threading.Event()
+        console.log(f"Deploying to {len(instances)} instance(s), {max_parallel} at a time.", style="info")
+        with ThreadPoolExecutor(max_workers=max_parallel) as executor:
+            futures = {
+                name: executor.submit(_deploy_instance, name, config, temp_dir, base_directory, source_repo_url,
+                                      blob_shas, cache, incremental, messages, stop)
+                for name, config in instances.items()
+            }
+            # Worker threads only queue their messages; they are logged here so a job or the CLI sees them.
+            try:
+                while not all(future.done() for future in futures.values()) or not messages.empty():
+                    try:
+                        name, message, style = messages.get(timeout=0.2)
+                    except queue.Empty:
+                        continue
+                    console.log(f"[{name}] {message}", style=style)
+            except BaseException:
+                stop.set()
+                raise
+        summary = {name: future.result() for name, future in futures.items()}
+    failed = [name for name, result in summary.items() if not result["ok"]]
+    console.log(f"Parse cache: {cache.misses} file(s) parsed into it for {len(instances)} instance(s), {cache.hits} read(s) served from it.", style="info")
+    if failed:
+        console.log(f"Fleet deploy completed; {len(failed)} instance(s) had errors: {', '.join(sorted(failed))}.", style="warning")
+    else:
+        console.log("Fleet deploy completed.", style="warning")
+    return summary
+
+def _deploy_instance(name: str, config: dict, temp_dir: str, base_directory: str, source_repo_url: str,
+                     blob_shas: dict, cache: ParseCache, incremental: bool, messages: queue.Queue,
+                     stop: threading.Event) -> dict:
+    errors = []
+
+    def sink(message: str, style: str | None):
+        if style == "error":
+            errors.append(message)
+        messages.put((name, message, style))
+        if stop.is_set():
+            raise JobCancelled()
+
+    start = time.perf_counter()
+    # Pool threads are reused, so the instance's counts are taken relative to this point.
+    counts_before = Counter(console.counts)
+    with console.redirect(sink), run("deploy"):
+        try:
+            subdirectory = f"{base_directory.strip('/')}/{name}"
+            repo_dir = os.path.join(temp_dir, subdirectory)
+            if not os.path.isdir(repo_dir):
+                console.log(f"Directory {subdirectory} not found in the repository.", style="error")
+            else:
+                nautobot_client = NautobotClient(url=config["url"], token=config.get("token"),
+                                                 max_concurrency=config.get("max_concurrency", INSTANCE_CONCURRENCY),
+                                                 memoize=True)
+                # With incremental deploys, only shards changed since the last deploy are validated and read.
+                tracker = None
+                if incremental:
+                    state_file = state_path("shards", state_key(config["url"], source_repo_url, subdirectory) + ".json")
+                    tracker = ShardTracker(state_file, repo_dir, blob_shas)
+                with Snapshot(nautobot_client) as snapshot:
+                    with stage("validate"):
+                        validation_errors = validate_repo(repo_dir, known=nautobot_keys(snapshot), cache=cache, tracker=tracker)
+                    for error in validation_errors:
+                        console.log(error, style="error")
+                    if validation_errors:
+                        console.log(f"Validation failed with {len(validation_errors)} error(s); deploy aborted before any change.", style="error")
+                    else:
+                        deploy_objects(nautobot_client, repo_dir, tracker, cache, snapshot)
+                        if tracker:
+                            tracker.save()
+                        nautobot_client.stats.report()
+                        console.log("Sync process completed.", style="warning")
+        except JobCancelled:
+            pass
+        except Exception as e:
+            console.log(f"Unhandled error: {e}", style="error")
+        counts = dict(console.counts - counts_before)
+    return {
+        "url": config["url"],
+        "ok": not errors,
+        "counts": counts,
+        "seconds": round(time.perf_counter() - start, 2),
+        "errors": errors,
+    }
@@ -0,0 +1,181 @@
+# instrumentation.py
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from urllib.parse import urlsplit
+from logger import console
+
+UUID_SEGMENT = re.compile(r"/[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}(?=/|$)")
+DEFAULT_STAGE = "other"
+DEFAULT_PIPELINE = "other"
+
+_local = threading.local()
+_listeners = []
+
+def add_listener(listener):
+    """
+    Register an object notified of pipeline events (metrics, tracing, profiling). It may
+    define any of: ``run_started(pipeline)``, ``run_finished(pipeline, seconds, ok)``,
+    ``stage_started(pipeline, stage)``, ``stage_finished(pipeline, stage, seconds, objects)``,
+    ``object_started(pipeline, stage, key)``,
+    ``request_finished(method, endpoint, status, seconds, retries)``,
+    ``parse_finished(path, seconds, items)``, ``limit_changed(target, limit)``,
+    ``throttled(target, reason)``, ``watch_reconciled(target, seconds, lag, ok)`` and
+    ``drift_checked(target, missing)``. Listener errors are ignored.
+    """
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+def remove_listener(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+def notify(event: str, *args):
+    for listener in list(_listeners):
+        handler = getattr(listener, event, None)
+        if handler is not None:
+            try:
+                handler(*args)
+            except Exception:
+                pass
+
+def current_pipeline() -> str:
+    return getattr(_local, "pipeline", None) or DEFAULT_PIPELINE
+
+def current_stage() -> str:
+    return getattr(_local, "stage", None) or DEFAULT_STAGE
+
+@contextmanager
+def run(pipeline: str):
+    """
+    Mark one run of a pipeline (``deploy``, ``delete``, ...) on this thread. Usable as a
+    decorator. The run is reported as failed when it raises or logs an error.
+    """
+    previous = getattr(_local, "pipeline", None)
+    _local.pipeline = pipeline
+    errors_before = console.counts["error"]
+    start = time.perf_counter()
+    ok = False
+    notify("run_started", pipeline)
+    try:
+        yield
+        ok = console.counts["error"] == errors_before
+    finally:
+        notify("run_finished", pipeline, time.perf_counter() - start, ok)
+        _local.pipeline = previous
+
+@contextmanager
+def stage(name: str):
+    """Attribute everything this thread does inside the block to pipeline stage ``name`` (e.g. ``devices.yml``)."""
+    previous, previous_objects = getattr(_local, "stage", None), getattr(_local, "objects", 0)
+    _local.stage, _local.objects = name, 0
+    start = time.perf_counter()
+    notify("stage_started", current_pipeline(), name)
+    try:
+        yield
+    finally:
+        notify("stage_finished", current_pipeline(), name, time.perf_counter() - start, _local.objects)
+        _local.stage, _local.objects = previous, previous_objects
+
+def add_objects(count: int):
+    """Count objects handled by the current stage, for its objects-per-second figure."""
+    _local.objects = getattr(_local, "objects", 0) + count
+
+def begin_object(key):
+    """Mark the start of work on one object (e.g. a device name) in the current stage; it ends at the next one or with the stage."""
+    notify("object_started", current_pipeline(), current_stage(), key)
+
+def bind_stage(func):
+    """Wrap ``func`` so it runs in the caller's current pipeline and stage, e.g. when submitted to a thread pool."""
+    pipeline, name = current_pipeline(), current_stage()
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        previous = (getattr(_local, "pipeline", None), getattr(_local, "stage", None))
+        _local.pipeline, _local.stage = pipeline, name
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.pipeline, _local.stage = previous
+    return wrapper
+
+def endpoint_template(url: str) -> str:
+    """``/api/dcim/devices/<uuid>/?depth=0`` -> ``/api/dcim/devices/{id}/``."""
+    return UUID_SEGMENT.sub("/{id}", urlsplit(url).path)
+
+class RequestStats:
+    """API requests made through one client, counted by stage, method and endpoint template."""
+
+    def __init__(self, connections=None, memo=None):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        # Callables returning {"opened", "requests", "reused"} for the client's connection pool and the
+        # summary of its GET memo, if any.
+        self._connections = connections
+        self._memo = memo
+
+    def record(self, method: str, url: str):
+        key = (current_stage(), method.upper(), endpoint_template(url))
+        with self._lock:
+            self._counts[key] += 1
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+    @property
+    def total(self) -> int:
+        with self._lock:
+            return sum(self._counts.values())
+
+    def summary(self) -> dict:
+        """
+        ``{"total", "by_method", "by_stage": {stage: {method: n}}, "by_endpoint": {"GET /path/": n}}``,
+        plus ``"connections"`` and ``"memo"`` when the client reports its connection pool and GET memo.
+        """
+        with self._lock:
+            counts = dict(self._counts)
+        by_method, by_stage, by_endpoint = Counter(), defaultdict(Counter), Counter()
+        for (stage_name, method, template), count in counts.items():
+            by_method[method] += count
+            by_stage[stage_name][method] += count
+            by_endpoint[f"{method} {template}"] += count
+        summary = {
+            "total": sum(counts.values()),
+            "by_method": dict(by_method),
+            "by_stage": {name: dict(methods) for name, methods in by_stage.items()},
+            "by_endpoint": dict(by_endpoint.most_common()),
+        }
+        if self._connections is not None:
+            summary["connections"] = self._connections()
+        if self._memo is not None:
+            summary["memo"] = self._memo()
+        return summary
+
+    def report(self, top: int = 5):
+        """Log the totals per stage and the busiest endpoints."""
+        summary = self.summary()
+        if not summary["total"]:
+            return
+        methods = ", ".join(f"{method} {count}" for method, count in sorted(summary["by_method"].items()))
+        console.log(f"API requests: {summary['total']} ({methods}).", style="info")
+        stages = "; ".join(
+            f"{name}: " + ", ".join(f"{method} {count}" for method, count in sorted(methods.items()))
+            for name, methods in summary["by_stage"].items()
+        )
+        console.log(f"API requests by stage: {stages}.", style="info")
+        busiest = "; ".join(f"{endpoint}: {count}" for endpoint, count in list(summary["by_endpoint"].items())[:top])
+        console.log(f"Busiest endpoints: {busiest}.", style="info")
+        connections = summary.get("connections")
+        if connections and connections["requests"]:
+            reused = connections["reused"] / connections["requests"] * 100
+            console.log(f"Connections: {connections['opened']} opened for {connections['requests']} request(s) "
+                        f"({reused:.1f}% reused).", style="info")
+        memo = summary.get("memo")
+        if memo and memo["hits"] + memo["misses"] + memo["coalesced"]:
+            console.log(f"GET memo: {memo['hits']} hit(s), {memo['coalesced']} coalesced, {memo['misses']} miss(es) "
+                        f"({memo['hit_rate'] * 100:.1f}% served without a request), "
+                        f"{memo['invalidations']} invalidated, {memo['evictions']} evicted.", style="info")
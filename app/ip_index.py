@@ -0,0 +1,124 @@
+# ip_index.py
+"""
+Run-wide handling of the IP addresses listed on devices.yml interfaces.
+
+Deploy collects every interface's addresses while it applies devices, then IPAssignments
+applies them in two bulk phases: the addresses missing from Nautobot are created, then the
+missing interface mappings, each through a write-behind queue. Addresses are resolved
+through an index keyed by (namespace id, address), built from the snapshot's paginated
+listing of IP addresses, so each address is resolved once and in its own namespace, and an
+address on several interfaces (VRRP, anycast) is created once and mapped to each of them.
+"""
+from logger import console
+
+IP_ENDPOINT = "/api/ipam/ip-addresses/"
+MAPPING_ENDPOINT = "/api/ipam/ip-address-to-interface/"
+PREFIX_ENDPOINT = "/api/ipam/prefixes/"
+# Interface ids per request when reading existing mappings.
+MAPPING_BATCH = 100
+
+def build_index(snapshot) -> dict:
+    """
+    ``{(namespace id, address): id}`` for every IP address in Nautobot. Nautobot gives an
+    address's namespace through its parent prefix; a namespace on the object itself is used
+    when present.
+    """
+    prefix_namespaces = {record.id: record.namespace for record in snapshot.objects(PREFIX_ENDPOINT)}
+    return {(record.namespace or prefix_namespaces.get(record.parent), record.key): record.id
+            for record in snapshot.objects(IP_ENDPOINT) if record.key}
+
+class IPAssignments:
+    def __init__(self, nautobot_client, snapshot):
+        self.client = nautobot_client
+        self.snapshot = snapshot
+        # (device name, interface id, IP item from plan_device, whether the interface existed before this run)
+        self._items = []
+
+    def add(self, device_name: str, interface_id: str, ip_plan: dict, existing_interface: bool):
+        self._items.append((device_name, interface_id, ip_plan, existing_interface))
+
+    def apply(self) -> dict:
+        """
+        Create the missing IP addresses, then the missing mappings. Returns
+        ``{(device name, address): IP address id}`` for the addresses now mapped to the
+        device's interfaces, to set primary IPs.
+        """
+        try:
+            index = build_index(self.snapshot)
+        except Exception as e:
+            console.log(f"Error retrieving IP addresses: {e}", style="error")
+            return {}
+        known = set(index)
+        created = self._create_addresses(index)
+        existing = self._existing_mappings(index, known)
+        return self._create_mappings(index, created, existing)
+
+    def _create_addresses(self, index: dict) -> set:
+        pending = {}
+        with self.client.write_behind() as writes:
+            for _, _, ip_plan, _ in self._items:
+                key = (ip_plan["namespace"], ip_plan["address"])
+                if ip_plan["namespace"] and "create" in ip_plan and key not in index and key not in pending:
+                    pending[key] = writes.create(IP_ENDPOINT, ip_plan["create"])
+        created = set()
+        for key, future in pending.items():
+            try:
+                result = future.result()
+                if not result.get("id"):
+                    console.log(f"Failed to create IP Address for {key[1]}", style="error")
+                    continue
+            except Exception as e:
+                console.log(f"Error creating IP address {key[1]}: {e}", style="error")
+                continue
+            self.snapshot.store(IP_ENDPOINT, result)
+            index[key] = result["id"]
+            created.add(key)
+            console.log(f"Created IP Address {key[1]}", style="success")
+        return created
+
+    def _existing_mappings(self, index: dict, known: set) -> set:
+        """``(IP address id, interface id)`` of the mappings that may already exist: pre-existing addresses on pre-existing interfaces."""
+        interface_ids = sorted({interface_id for _, interface_id, ip_plan, existing_interface in self._items
+                                if existing_interface and (ip_plan["namespace"], ip_plan["address"]) in known})
+        mappings = set()
+        for start in range(0, len(interface_ids), MAPPING_BATCH):
+            params = {"interface": interface_ids[start:start + MAPPING_BATCH], "depth": 0}
+            try:
+                for mapping in self.client.iter_results(MAPPING_ENDPOINT, params=params):
+                    ip_address, interface = mapping.get("ip_address"), mapping.get("interface")
+                    if isinstance(ip_address, dict) and isinstance(interface, dict):
+                        mappings.add((ip_address.get("id"), interface.get("id")))
+            except Exception as e:
+                console.log(f"Error retrieving IP address mappings: {e}", style="error")
+        return mappings
+
+    def _create_mappings(self, index: dict, created: set, existing: set) -> dict:
+        pending, resolved = {}, {}
+        with self.client.write_behind() as writes:
+            for device_name, interface_id, ip_plan, _ in self._items:
+                address = ip_plan["address"]
+                key = (ip_plan["namespace"], address)
+                ip_id = index.get(key) if ip_plan["namespace"] else None
+                if ip_id is None:
+                    if "error" in ip_plan:
+                        console.log(ip_plan["error"], style="error")
+                    continue
+                if (ip_id, interface_id) in existing:
+                    console.log(f"IP Address {address} already exists on interface {interface_id} for device {device_name}; skipping mapping.", style="info")
+                    resolved[(device_name, address)] = ip_id
+                    continue
+                if (ip_id, interface_id) not in pending:
+                    payload = {"ip_address": {"id": ip_id}, "interface": {"id": interface_id}}
+                    pending[(ip_id, interface_id)] = (device_name, address, key in created, writes.create(MAPPING_ENDPOINT, payload))
+        for (ip_id, interface_id), (device_name, address, new_address, future) in pending.items():
+            try:
+                future.result()
+            except Exception as e:
+                console.log(f"Error applying mapping for IP {address}: {e}", style="error")
+                continue
+            if new_address:
+                console.log(f"Applied IP address {address} to interface {interface_id} on device {device_name}", style="success")
+            else:
+                console.log(f"Applied mapping for IP {address} to interface {interface_id} on device {device_name}", style="success")
+            resolved[(device_name, address)] = ip_id
+        return resolved
@@ -0,0 +1,211 @@
+# jobs.py
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter, deque
+from logger import console
+from state import load_json, save_json, state_dir
+
+JOB_WORKERS = 2
+# Log lines kept (and persisted) per job, and finished jobs kept as history across restarts.
+JOB_LOG_LINES = 500
+JOB_HISTORY = 50
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled", "interrupted")
+
+class JobCancelled(BaseException):
+    """
+    Raised in a job's thread at its next log call once cancellation is requested. It derives
+    from BaseException so the pipeline's broad ``except Exception`` handlers don't swallow it.
+    """
+
+class Job:
+    def __init__(self, kind: str, target: str, func, args: tuple, kwargs: dict, coalesce_key: tuple):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.target = target
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.coalesce_key = coalesce_key
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.error = None
+        # The pipeline's return value, e.g. a prune plan; kept in memory only.
+        self.result = None
+        self.counts = Counter()
+        self.log = deque(maxlen=JOB_LOG_LINES)
+        self.cancel_event = threading.Event()
+        self._lock = threading.Lock()
+        self._last_persist = 0.0
+
+    @property
+    def done(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def add_log(self, message: str, style: str | None):
+        with self._lock:
+            self.counts[style or "info"] += 1
+            self.log.append({"time": time.time(), "style": style or "info", "message": message})
+
+    def to_dict(self) -> dict:
+        """A consistent snapshot of the job; safe to call from any thread."""
+        # Arguments are deliberately left out: they carry Nautobot and Git tokens.
+        with self._lock:
+            return {
+                "id": self.id,
+                "kind": self.kind,
+                "target": self.target,
+                "status": self.status,
+                "created": self.created,
+                "started": self.started,
+                "finished": self.finished,
+                "error": self.error,
+                "counts": dict(self.counts),
+                "log": list(self.log),
+            }
+
+class JobManager:
+    """
+    Runs long pipelines (deploy, delete, prune and its preview) on worker threads instead of
+    the Streamlit script thread; a finished job's return value is its ``result``.
+
+    Jobs aimed at the same Nautobot URL are serialized: a worker only starts a job when no
+    other job for its target is running. Submitting a job identical to one still queued
+    returns the queued job instead (coalescing). Status, counters and the log tail are
+    persisted as JSON so they survive reruns and restarts.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, jobs_dir: str | None = None):
+        self.jobs_dir = jobs_dir or os.path.join(state_dir(), "jobs")
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self._jobs = {}
+        self._pending = []
+        self._running_targets = set()
+        self._condition = threading.Condition()
+        self._load_persisted()
+        for index in range(workers):
+            threading.Thread(target=self._worker, name=f"job-worker-{index}", daemon=True).start()
+
+    def submit(self, kind: str, target: str, func, *args, **kwargs) -> Job:
+        coalesce_key = (kind, target, repr(args), repr(sorted(kwargs.items())))
+        with self._condition:
+            for job in self._pending:
+                if job.coalesce_key == coalesce_key:
+                    return job
+            job = Job(kind, target, func, args, kwargs, coalesce_key)
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            self._persist(job, force=True)
+            self._condition.notify_all()
+        return job
+
+    def get(self, job_id: str):
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self, target: str | None = None) -> list:
+        with self._condition:
+            jobs = [job for job in self._jobs.values() if target is None or job.target == target]
+        return sorted(jobs, key=lambda job: job.created, reverse=True)
+
+    def cancel(self, job_id: str) -> bool:
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None or job.done:
+                return False
+            job.cancel_event.set()
+            if job in self._pending:
+                self._pending.remove(job)
+                job.status = "cancelled"
+                job.finished = time.time()
+                self._persist(job, force=True)
+            return True
+
+    def _next_job(self) -> Job:
+        with self._condition:
+            while True:
+                for job in self._pending:
+                    if job.target not in self._running_targets:
+                        self._pending.remove(job)
+                        self._running_targets.add(job.target)
+                        job.status = "running"
+                        job.started = time.time()
+                        return job
+                self._condition.wait()
+
+    def _worker(self):
+        while True:
+            job = self._next_job()
+            self._persist(job, force=True)
+            try:
+                with console.redirect(lambda message, style, job=job: self._on_log(job, message, style)):
+                    job.result = job.func(*job.args, **job.kwargs)
+                # Per-object errors don't fail the job; they are visible in its counts and log.
+                job.status = "succeeded"
+            except JobCancelled:
+                job.status = "cancelled"
+            except Exception as e:
+                job.status = "failed"
+                job.error = f"{e}\n{traceback.format_exc()}"
+            finally:
+                job.finished = time.time()
+                with self._condition:
+                    self._running_targets.discard(job.target)
+                    self._condition.notify_all()
+                self._persist(job, force=True)
+
+    def _on_log(self, job: Job, message: str, style: str | None):
+        job.add_log(message, style)
+        self._persist(job)
+        if job.cancel_event.is_set():
+            raise JobCancelled()
+
+    def _persist(self, job: Job, force: bool = False):
+        # Progress updates are throttled to one write per second per job.
+        now = time.time()
+        if not force and now - job._last_persist < 1.0:
+            return
+        job._last_persist = now
+        try:
+            save_json(os.path.join(self.jobs_dir, f"{job.id}.json"), job.to_dict())
+        except OSError:
+            pass
+
+    def _load_persisted(self):
+        # Jobs from a previous process show up as history; unfinished ones can't resume and are marked interrupted.
+        paths = [os.path.join(self.jobs_dir, name) for name in os.listdir(self.jobs_dir) if name.endswith(".json")]
+        paths.sort(key=os.path.getmtime, reverse=True)
+        for path in paths[JOB_HISTORY:]:
+            os.remove(path)
+        for path in paths[:JOB_HISTORY]:
+            data = load_json(path)
+            if not data:
+                continue
+            job = Job(data["kind"], data["target"], None, (), {}, None)
+            job.id = data["id"]
+            job.created = data.get("created") or 0
+            job.started = data.get("started")
+            job.finished = data.get("finished")
+            job.error = data.get("error")
+            job.counts.update(data.get("counts") or {})
+            job.log.extend(data.get("log") or [])
+            job.status = data.get("status")
+            if not job.done:
+                job.status = "interrupted"
+                self._persist(job, force=True)
+            self._jobs[job.id] = job
+
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_job_manager() -> JobManager:
+    """The process-wide job manager, shared by every Streamlit session."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
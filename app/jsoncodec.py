@@ -0,0 +1,28 @@
+# jsoncodec.py
+"""
+JSON encoding and decoding of API bodies, with orjson when it is installed (several times
+faster on large list responses) and the standard library otherwise.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+def dumps(obj) -> bytes:
+    """Compact UTF-8 JSON."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # Types orjson refuses (non-str keys, sets, huge ints) still encode like requests' json= did.
+            pass
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+def loads(data: bytes | str):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,117 @@
+# limiter.py
+"""
+Adaptive concurrency limit for the requests one NautobotClient sends to its Nautobot.
+
+AIMD: the limit grows by one request per round of requests while it is fully used and
+latency stays stable, and is cut by half when Nautobot throttles (429/503) or the p95
+latency of recent requests rises well above its usual level. A ``Retry-After`` from
+Nautobot pauses every request to it, not only the one that was throttled.
+"""
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from instrumentation import notify
+
+THROTTLE_STATUSES = (429, 503)
+# p95 latency of the last LATENCY_WINDOW requests above LATENCY_TOLERANCE times its usual level counts as congestion.
+LATENCY_WINDOW = 50
+LATENCY_TOLERANCE = 2.0
+DECREASE_RATIO = 0.5
+MAX_PAUSE = 60.0
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Seconds to wait from a ``Retry-After`` header (delay in seconds or an HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+class AdaptiveLimiter:
+    def __init__(self, target: str, max_limit: int, min_limit: int = 1, initial_limit: int | None = None):
+        self.target = target
+        self.max_limit = max(max_limit, 1)
+        self.min_limit = max(min(min_limit, self.max_limit), 1)
+        self.limit = float(min(max(initial_limit or self.min_limit, self.min_limit), self.max_limit))
+        self.in_flight = 0
+        self.throttle_events = 0
+        self._paused_until = 0.0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._baseline = None
+        self._since_check = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+        notify("limit_changed", self.target, int(self.limit))
+
+    def acquire(self):
+        """Block until a request may be sent: within the limit and not paused by a Retry-After."""
+        with self._condition:
+            while True:
+                wait = self._paused_until - time.monotonic()
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                self._condition.wait(wait if wait > 0 else None)
+
+    def release(self, seconds: float, status: int | None = None, retry_after: float | None = None):
+        """Record the outcome of a request sent after acquire(); ``status`` is None when no response came back."""
+        with self._condition:
+            self.in_flight -= 1
+            if status in THROTTLE_STATUSES:
+                self._throttled(str(status), retry_after)
+            elif status is not None and status < 500:
+                self._observe(seconds)
+            self._condition.notify_all()
+
+    def pause(self, seconds: float):
+        """Hold every request for ``seconds`` (capped at MAX_PAUSE)."""
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + min(seconds, MAX_PAUSE))
+            self._condition.notify_all()
+
+    def _observe(self, seconds: float):
+        self._latencies.append(seconds)
+        self._since_check += 1
+        if self._since_check >= LATENCY_WINDOW:
+            self._since_check = 0
+            p95 = sorted(self._latencies)[int(len(self._latencies) * 0.95) - 1]
+            if self._baseline is None:
+                self._baseline = p95
+            elif p95 > self._baseline * LATENCY_TOLERANCE:
+                self._throttled("latency")
+                return
+            else:
+                # Follows slow drifts (a bigger Nautobot, a busier hour) but not sudden jumps.
+                self._baseline = 0.9 * self._baseline + 0.1 * p95
+        # Only grow a limit that is actually used; an idle limit says nothing about what Nautobot can take.
+        if self.in_flight + 1 >= int(self.limit) and self.limit < self.max_limit:
+            previous = int(self.limit)
+            self.limit = min(self.limit + 1 / self.limit, self.max_limit)
+            if int(self.limit) != previous:
+                notify("limit_changed", self.target, int(self.limit))
+
+    def _throttled(self, reason: str, retry_after: float | None = None):
+        self.throttle_events += 1
+        notify("throttled", self.target, reason)
+        if retry_after:
+            self._paused_until = max(self._paused_until, time.monotonic() + min(retry_after, MAX_PAUSE))
+        self._decrease()
+
+    def _decrease(self):
+        now = time.monotonic()
+        # A burst of throttled responses to requests sent together is one signal, not many.
+        if now - self._last_decrease < max(self._baseline or 0.0, 0.1):
+            return
+        self._last_decrease = now
+        self._latencies.clear()
+        self._since_check = 0
+        previous = int(self.limit)
+        self.limit = max(self.limit * DECREASE_RATIO, self.min_limit)
+        if int(self.limit) != previous:
+            notify("limit_changed", self.target, int(self.limit))
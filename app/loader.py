@@ -0,0 +1,600 @@
+# loader.py
+import hashlib
+import mmap
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+import yaml
+from logger import console
+from instrumentation import notify
+from state import load_json, save_json
+
+# Below this many bytes in total, shards are parsed inline; process start-up would cost more than it saves.
+PARALLEL_PARSE_MIN_BYTES = 1024 * 1024
+# Shards at least this large are streamed item by item; smaller ones are loaded at once with the faster C loader.
+STREAM_MIN_BYTES = 4 * 1024 * 1024
+# When parsed in the process pool, shards of STREAM_MIN_BYTES or more are split into pieces of about this size.
+PIECE_BYTES = 1024 * 1024
+# Source bytes a ParseCache holds at most; parsed objects take several times their source size.
+CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+def iter_yaml_items(file_path: str):
+    """
+    Yield the top-level list items of a YAML object file one at a time.
+
+    The file is walked at the event level, so only the item currently being built is
+    held in memory instead of the whole list. Multi-document files are accepted too:
+    each document may be a list (its items are yielded in turn) or a single mapping.
+    Raises ValueError if a document holds anything else.
+    """
+    with open(file_path, "r") as f:
+        loader = yaml.SafeLoader(f)
+        try:
+            loader.get_event()  # StreamStartEvent
+            while not loader.check_event(yaml.StreamEndEvent):
+                loader.get_event()  # DocumentStartEvent
+                if loader.check_event(yaml.SequenceStartEvent):
+                    loader.get_event()
+                    while not loader.check_event(yaml.SequenceEndEvent):
+                        yield loader.construct_document(loader.compose_node(None, None))
+                    loader.get_event()
+                else:
+                    document = loader.construct_document(loader.compose_node(None, None))
+                    if isinstance(document, dict):
+                        yield document
+                    elif document is not None:
+                        raise ValueError(f"{file_path} does not contain a list")
+                loader.get_event()  # DocumentEndEvent
+                loader.anchors = {}
+        finally:
+            loader.dispose()
+
+_DONE = object()
+
+def prefetch(iterable, depth: int = 256):
+    """
+    Iterate ``iterable`` on a background thread, buffering at most ``depth`` items.
+
+    Parsing the next items overlaps with the API calls made for the current one, while
+    the bounded queue keeps memory flat however long the input is. Exceptions raised by
+    the producer are re-raised in the consumer.
+    """
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def _put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce():
+        try:
+            for item in iterable:
+                if not _put((item, None)):
+                    return
+        except BaseException as e:
+            _put((_DONE, e))
+            return
+        _put((_DONE, None))
+
+    threading.Thread(target=_produce, name="yaml-prefetch", daemon=True).start()
+    try:
+        while True:
+            item, error = buffer.get()
+            if item is _DONE:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+def discover_shards(repo_dir: str, filename: str) -> list:
+    """
+    Return the YAML files holding one object type.
+
+    Besides the flat file (e.g. ``devices.yml``) a directory named after it is accepted,
+    and every ``*.yml``/``*.yaml`` file below it (``devices/*.yml``, ``devices/<site>/*.yml``)
+    is a shard of that type. Empty files are ignored; the order is stable.
+    """
+    shards = []
+    file_path = os.path.join(repo_dir, filename)
+    if os.path.isfile(file_path) and os.path.getsize(file_path) > 0:
+        shards.append(file_path)
+    shard_dir = os.path.join(repo_dir, os.path.splitext(filename)[0])
+    if os.path.isdir(shard_dir):
+        for root, dirs, files in os.walk(shard_dir):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                if name.endswith((".yml", ".yaml")) and os.path.getsize(path) > 0:
+                    shards.append(path)
+    return shards
+
+def load_shard(file_path: str) -> list:
+    """Parse a whole shard at once, with the same layout rules as iter_yaml_items (used by the process pool)."""
+    with open(file_path, "r") as f:
+        return _load_documents(f, file_path)
+
+def _load_documents(stream, file_path: str) -> list:
+    items = []
+    for document in yaml.load_all(stream, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)):
+        if isinstance(document, list):
+            items.extend(document)
+        elif isinstance(document, dict):
+            items.append(document)
+        elif document is not None:
+            raise ValueError(f"{file_path} does not contain a list")
+    return items
+
+def _load_shard_timed(file_path: str) -> tuple:
+    start = time.perf_counter()
+    items = load_shard(file_path)
+    return items, time.perf_counter() - start
+
+def split_shard(file_path: str, piece_bytes: int = PIECE_BYTES) -> list:
+    """
+    Split a shard into ``(start, end)`` byte ranges of about ``piece_bytes``, each holding
+    whole top-level list items, so one large file can be parsed by several processes.
+
+    Ranges end before a line starting with ``-`` in the first column. Only files holding a
+    single block list are split; any other layout (several documents, a mapping, a flow or
+    indented list) is returned as one range.
+    """
+    size = os.path.getsize(file_path)
+    if size <= piece_bytes:
+        return [(0, size)]
+    with open(file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        # The first line holding content must open the list, after an optional "---".
+        position = 0
+        while position < size:
+            line_end = data.find(b"\n", position)
+            line_end = size if line_end == -1 else line_end
+            line = data[position:line_end].rstrip()
+            if line and not line.startswith(b"#") and not (position == 0 and line == b"---"):
+                break
+            position = line_end + 1
+        if not (data[position:position + 2] in (b"- ", b"-\n", b"-\r") or data[position:] == b"-"):
+            return [(0, size)]
+        if data.find(b"\n---", position) != -1 or data.find(b"\n...", position) != -1:
+            return [(0, size)]
+        ranges, start = [], 0
+        while True:
+            boundary = data.find(b"\n-", start + piece_bytes)
+            while boundary != -1 and data[boundary + 2:boundary + 3] not in (b" ", b"\n", b"\r", b""):
+                boundary = data.find(b"\n-", boundary + 2)
+            if boundary == -1:
+                ranges.append((start, size))
+                return ranges
+            ranges.append((start, boundary + 1))
+            start = boundary + 1
+
+def _load_piece_timed(file_path: str, start: int, end: int) -> tuple:
+    """Parse one range returned by split_shard (used by the process pool)."""
+    begin = time.perf_counter()
+    with open(file_path, "rb") as f:
+        f.seek(start)
+        items = _load_documents(f.read(end - start).decode("utf-8"), file_path)
+    return items, time.perf_counter() - begin
+
+def _load_shard_reported(file_path: str) -> list:
+    items, seconds = _load_shard_timed(file_path)
+    notify("parse_finished", file_path, seconds, len(items))
+    return items
+
+def _stream_shard_reported(file_path: str):
+    """iter_yaml_items, reporting the time spent parsing (not waiting for the consumer) once the shard is done."""
+    items = iter_yaml_items(file_path)
+    seconds, count = 0.0, 0
+    while True:
+        start = time.perf_counter()
+        item = next(items, _DONE)
+        seconds += time.perf_counter() - start
+        if item is _DONE:
+            break
+        count += 1
+        yield item
+    notify("parse_finished", file_path, seconds, count)
+
+def _display(path: str, root: str | None) -> str:
+    return os.path.relpath(path, root) if root else path
+
+class ParseCache:
+    """
+    Parsed shards keyed by git blob id, shared by the passes over one clone: validation and
+    deploy, and in fleet mode the instances, so a file with identical content in several
+    instance directories is parsed once.
+
+    Memory is bounded: shards of STREAM_MIN_BYTES or more are never cached (both passes
+    stream them), at most ``max_bytes`` of source is held at once (further shards are
+    parsed again when read), and a shard is dropped as soon as deploy has taken it once for
+    every path holding its blob (see take()).
+    """
+
+    def __init__(self, blob_shas: dict | None = None, max_bytes: int = CACHE_MAX_BYTES):
+        self.blob_shas = blob_shas or {}
+        self.max_bytes = max_bytes
+        self._items = {}
+        self._sizes = {}
+        self._errors = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        # blob -> paths holding it, i.e. how many times deploy will take it.
+        self._readers = Counter(self.blob_shas.values())
+        self._taken = Counter()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _blob(self, shard: str) -> str:
+        return self.blob_shas.get(shard) or git_blob_sha(shard)
+
+    def _fits(self, size: int) -> bool:
+        return size < STREAM_MIN_BYTES and self.bytes + size <= self.max_bytes
+
+    def _store(self, blob: str, items: list, size: int):
+        self._items[blob] = items
+        self._sizes[blob] = size
+        self.bytes += size
+
+    def get(self, shard: str) -> list | None:
+        """
+        The parsed items of ``shard``, parsing and caching it if needed; None when it is too
+        large to cache or the cache is full, for the caller to stream it. Raises the
+        shard's parse error.
+        """
+        blob = self._blob(shard)
+        with self._lock:
+            lock = self._locks.setdefault(blob, threading.Lock())
+        # One lock per blob: concurrent readers of the same content wait for a single parse.
+        with lock:
+            if blob in self._errors:
+                raise self._errors[blob]
+            if blob in self._items:
+                self.hits += 1
+                return self._items[blob]
+            size = os.path.getsize(shard)
+            with self._lock:
+                if not self._fits(size):
+                    return None
+                # Reserved before parsing, so concurrent parses cannot overshoot max_bytes.
+                self.bytes += size
+            self.misses += 1
+            try:
+                items = _load_shard_reported(shard)
+            except Exception as e:
+                with self._lock:
+                    self.bytes -= size
+                    self._errors[blob] = e
+                raise
+            with self._lock:
+                self.bytes -= size
+                self._store(blob, items, size)
+            return items
+
+    def take(self, shard: str) -> list | None:
+        """
+        The cached items of ``shard`` for deploy, or None if it is not cached (it is then
+        streamed). Once taken for every path holding the blob, the shard is dropped.
+        """
+        blob = self._blob(shard)
+        with self._lock:
+            if blob in self._errors:
+                raise self._errors[blob]
+            items = self._items.get(blob)
+            self._taken[blob] += 1
+            if items is not None:
+                self.hits += 1
+                if self._taken[blob] >= max(self._readers.get(blob, 0), 1):
+                    del self._items[blob]
+                    self.bytes -= self._sizes.pop(blob)
+            return items
+
+    def fill(self, shards: list, workers: int | None = None, root: str | None = None):
+        """
+        Parse the cacheable shards not cached yet in one go, so several shards go through the
+        process pool (see iter_shard_items) instead of being parsed one by one by get(), as
+        many as fit in ``max_bytes``. A shard that fails to parse keeps its error, raised by
+        get().
+        """
+        missing, reserved = [], 0
+        with self._lock:
+            for shard in shards:
+                blob, size = self._blob(shard), os.path.getsize(shard)
+                if blob in self._items or blob in self._errors or size >= STREAM_MIN_BYTES \
+                        or self.bytes + reserved + size > self.max_bytes:
+                    continue
+                missing.append(shard)
+                reserved += size
+            self.bytes += reserved
+        parsed, errors = {}, {}
+        try:
+            # A single shard is left to get(): the pool would not help.
+            if len(missing) < 2:
+                return
+            for shard, item in iter_shard_items(missing, workers, root, on_error=errors.__setitem__):
+                parsed.setdefault(shard, []).append(item)
+        finally:
+            with self._lock:
+                self.bytes -= reserved
+        with self._lock:
+            for shard in missing:
+                blob = self._blob(shard)
+                if shard in errors:
+                    self._errors.setdefault(blob, errors[shard])
+                elif blob not in self._items and self._fits(os.path.getsize(shard)):
+                    self.misses += 1
+                    self._store(blob, parsed.get(shard, []), os.path.getsize(shard))
+
+def iter_shard_items(shards: list, workers: int | None = None, root: str | None = None, cache: ParseCache | None = None,
+                     on_error=None, consume: bool = False):
+    """
+    Yield ``(shard, item)`` for every item of every shard, in shard order.
+
+    Small sets of shards are read inline, streaming shards of STREAM_MIN_BYTES or more;
+    larger sets, or a single large shard split with split_shard, are parsed in a process pool
+    with a bounded number of pieces in flight. With a ``cache``, shards are served from (and
+    added to) it when they fit; with ``consume`` (deploy), cached shards are taken out of it
+    and the others are parsed without being cached. A shard that fails to parse is reported
+    (to ``on_error(shard, error)`` when given) and skipped without aborting the others.
+    """
+
+    def report(shard: str, error: Exception):
+        if on_error is not None:
+            on_error(shard, error)
+        else:
+            console.log(f"Error reading {_display(shard, root)}: {error}", style="error")
+
+    if cache is not None:
+        yield from _iter_cached(shards, workers, root, cache, consume, report)
+        return
+    total_bytes = sum(os.path.getsize(shard) for shard in shards)
+    tasks = []
+    if workers != 1 and total_bytes >= PARALLEL_PARSE_MIN_BYTES:
+        # Large shards are split so that a single big file is parsed by several processes too.
+        pieces = {shard: split_shard(shard) if os.path.getsize(shard) >= STREAM_MIN_BYTES else [(0, os.path.getsize(shard))]
+                  for shard in shards}
+        tasks = [(shard, start, end) for shard in shards for start, end in pieces[shard]]
+    if len(tasks) < 2:
+        for shard in shards:
+            try:
+                if os.path.getsize(shard) >= STREAM_MIN_BYTES:
+                    items = prefetch(_stream_shard_reported(shard))
+                else:
+                    items = _load_shard_reported(shard)
+                for item in items:
+                    yield shard, item
+            except Exception as e:
+                report(shard, e)
+        return
+    workers = workers or min(len(tasks), os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        remaining = iter(tasks)
+        for task in remaining:
+            pending.append((task, executor.submit(_load_piece_timed, *task)))
+            if len(pending) >= workers * 2:
+                break
+        parsed, failed = {}, set()
+        while pending:
+            (shard, start, end), future = pending.pop(0)
+            next_task = next(remaining, None)
+            if next_task is not None:
+                pending.append((next_task, executor.submit(_load_piece_timed, *next_task)))
+            if shard in failed:
+                continue
+            seconds_and_count = parsed.setdefault(shard, [0.0, 0])
+            last = end == pieces[shard][-1][1]
+            try:
+                items, seconds = future.result()
+            except Exception as e:
+                failed.add(shard)
+                if len(pieces[shard]) == 1:
+                    report(shard, e)
+                    continue
+                # A piece may not parse on its own (e.g. an alias to an anchor in another piece):
+                # parse the whole shard instead, which also reports real errors at their line in the file.
+                try:
+                    items, seconds = _load_shard_timed(shard)
+                except Exception as e:
+                    report(shard, e)
+                    continue
+                items, last = items[seconds_and_count[1]:], True
+            seconds_and_count[0] += seconds
+            seconds_and_count[1] += len(items)
+            if last:
+                notify("parse_finished", shard, *seconds_and_count)
+            for item in items:
+                yield shard, item
+
+def _iter_cached(shards, workers, root, cache, consume, report):
+    if not consume:
+        cache.fill(shards, workers, root)
+    # Runs of shards the cache does not hold are parsed together, keeping the process pool and streaming.
+    uncached = []
+    for shard in shards:
+        try:
+            items = cache.take(shard) if consume else cache.get(shard)
+        except Exception as e:
+            yield from iter_shard_items(uncached, workers, root, on_error=report)
+            uncached = []
+            report(shard, e)
+            continue
+        if items is None:
+            uncached.append(shard)
+            continue
+        yield from iter_shard_items(uncached, workers, root, on_error=report)
+        uncached = []
+        for item in items:
+            yield shard, item
+    yield from iter_shard_items(uncached, workers, root, on_error=report)
+
+def iter_source_objects(shards: list, compare_key: str | None = None, known_keys: dict | None = None,
+                        on_key=None, workers: int | None = None, root: str | None = None, cache: ParseCache | None = None,
+                        on_error=None, consume: bool = False):
+    """
+    Yield the objects of one type across all of its shards.
+
+    When ``compare_key`` is given, an object whose key was already seen in another shard
+    (or is listed in ``known_keys``, mapping key to shard) is reported and skipped.
+    ``on_key(shard, key)`` is called for every accepted object. Paths are reported relative
+    to ``root`` when it is given; ``on_error`` and ``consume`` are passed to iter_shard_items.
+    """
+    seen = dict(known_keys or {})
+    for shard, obj in iter_shard_items(shards, workers=workers, root=root, cache=cache, on_error=on_error, consume=consume):
+        key = obj.get(compare_key) if compare_key and isinstance(obj, dict) else None
+        if key is not None:
+            if key in seen:
+                console.log(f"Duplicate {compare_key} '{key}' in {_display(shard, root)} "
+                            f"(already defined in {_display(seen[key], root)}); skipping.", style="error")
+                continue
+            seen[key] = shard
+            if on_key:
+                on_key(shard, key)
+        yield obj
+
+def git_blob_sha(file_path: str) -> str:
+    """The git blob id of a file, computed from its content."""
+    digest = hashlib.sha1()
+    digest.update(f"blob {os.path.getsize(file_path)}\0".encode())
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def repo_blob_shas(repo, subdirectory: str) -> dict:
+    """Map the absolute path of every file below ``subdirectory`` to its blob id, read from the git tree."""
+    shas = {}
+    try:
+        tree = repo.head.commit.tree
+        if subdirectory.strip("/"):
+            tree = tree / subdirectory.strip("/")
+    except (KeyError, ValueError):
+        return shas
+    for item in tree.traverse():
+        if item.type == "blob":
+            shas[os.path.join(repo.working_tree_dir, item.path)] = item.hexsha
+    return shas
+
+class ShardTracker:
+    """
+    Remembers which blob of every shard was last applied, so a deploy only re-reads changed shards.
+
+    The keys defined by each shard are stored alongside its blob, which keeps duplicate
+    detection working across skipped shards. A type's shards are only recorded once its
+    stage finishes without logging errors, so failed objects are retried next time, and a
+    shard rejected with reject() (it failed to parse or validate) is left out of the
+    commit, so it is read again next time. With ``keep_values``, the values given with each
+    key (e.g. the fields a check compares) are stored too, and a shard recorded without
+    them counts as changed.
+    """
+
+    def __init__(self, state_file: str, repo_dir: str, blob_shas: dict | None = None, keep_values: bool = False):
+        self.state_file = state_file
+        self.repo_dir = repo_dir
+        self.blob_shas = blob_shas or {}
+        self.keep_values = keep_values
+        self._state = load_json(state_file, default={})
+        self._pending = {}
+        # filename -> relative paths of the shards left out of its next commit.
+        self._rejected = {}
+
+    def _blob(self, shard: str) -> str:
+        if shard not in self.blob_shas:
+            self.blob_shas[shard] = git_blob_sha(shard)
+        return self.blob_shas[shard]
+
+    def select(self, filename: str, shards: list):
+        """Return the shards that changed since the last deploy and the keys defined by the unchanged ones."""
+        applied = self._state.get(filename, {})
+        pending = {}
+        changed, known_keys = [], {}
+        for shard in shards:
+            rel_path = os.path.relpath(shard, self.repo_dir)
+            entry = applied.get(rel_path)
+            if entry and entry.get("blob") == self._blob(shard) and (not self.keep_values or "values" in entry):
+                pending[rel_path] = entry
+                for key in entry.get("keys", []):
+                    known_keys[key] = shard
+            else:
+                pending[rel_path] = {"blob": self._blob(shard), "keys": [], **({"values": []} if self.keep_values else {})}
+                changed.append(shard)
+        self._pending[filename] = pending
+        return changed, known_keys
+
+    def record_key(self, filename: str, shard: str, key, values=None) -> None:
+        entry = self._pending[filename][os.path.relpath(shard, self.repo_dir)]
+        entry["keys"].append(key)
+        if "values" in entry:
+            entry["values"].append(values)
+
+    def known_values(self, filename: str) -> dict:
+        """``{key: values}`` for the keys recorded so far with ``keep_values``, e.g. those of the unchanged shards after select()."""
+        return {key: values for entry in self._pending.get(filename, {}).values()
+                for key, values in zip(entry["keys"], entry.get("values", ()))}
+
+    def reject(self, filename: str, shard: str) -> bool:
+        """Leave ``shard`` out of the next commit of ``filename``; returns False if it was already rejected."""
+        rejected = self._rejected.setdefault(filename, set())
+        rel_path = os.path.relpath(shard, self.repo_dir)
+        if rel_path in rejected:
+            return False
+        rejected.add(rel_path)
+        return True
+
+    def commit(self, filename: str) -> None:
+        if filename in self._pending:
+            rejected = self._rejected.pop(filename, set())
+            self._state[filename] = {rel_path: entry for rel_path, entry in self._pending.pop(filename).items()
+                                     if rel_path not in rejected}
+
+    def save(self) -> None:
+        save_json(self.state_file, self._state)
+
+def read_objects(repo_dir: str, filename: str, compare_key: str | None = None, tracker: ShardTracker | None = None,
+                 cache: ParseCache | None = None):
+    """
+    Return a generator over the objects of ``filename`` (flat file and/or shard directory),
+    or None when there is nothing to read.
+
+    With a ``tracker``, only shards changed since the last deploy are read; the caller
+    records the type as applied with ``record_applied`` once its stage, including any
+    queued writes, has finished.
+    """
+    shards = discover_shards(repo_dir, filename)
+    if not shards:
+        console.log(f"{filename} not found or empty; skipping.", style="warning")
+        return None
+    known_keys = {}
+    if tracker:
+        shards, known_keys = tracker.select(filename, shards)
+        if not shards:
+            console.log(f"{filename} unchanged since the last deploy; skipping.", style="info")
+            tracker.commit(filename)
+            return None
+    return _read_shards(repo_dir, filename, shards, compare_key, known_keys, tracker, cache)
+
+def _read_shards(repo_dir, filename, shards, compare_key, known_keys, tracker, cache):
+    on_key = (lambda shard, key: tracker.record_key(filename, shard, key)) if tracker else None
+    # Deploy is the last reader of a shard: it is taken out of the cache.
+    yield from iter_source_objects(shards, compare_key, known_keys, on_key, root=repo_dir, cache=cache, consume=True)
+
+@contextmanager
+def record_applied(tracker: ShardTracker | None, filename: str):
+    """
+    Record ``filename`` as applied in ``tracker`` (if any) once the block finishes without
+    raising or logging errors. The block should cover the whole stage, so creates still
+    queued for a bulk POST are resolved before the shards are recorded.
+    """
+    errors_before = console.counts["error"]
+    yield
+    if tracker and console.counts["error"] == errors_before:
+        tracker.commit(filename)
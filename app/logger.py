@@ -1,8 +1,37 @@
 # logger.py
-import streamlit as st
+import threading
+from collections import Counter
+from contextlib import contextmanager
 
 class Console:
+    def __init__(self):
+        self._local = threading.local()
+
+    @property
+    def counts(self) -> Counter:
+        # Messages logged so far by the current thread, per style; lets callers tell whether a stage logged errors.
+        if not hasattr(self._local, "counts"):
+            self._local.counts = Counter()
+        return self._local.counts
+
+    @contextmanager
+    def redirect(self, sink):
+        """Send this thread's messages to ``sink(message, style)`` instead of Streamlit (e.g. for background jobs)."""
+        previous = getattr(self._local, "sink", None)
+        self._local.sink = sink
+        try:
+            yield
+        finally:
+            self._local.sink = previous
+
     def log(self, message: str, style: str = None):
+        self.counts[style or "info"] += 1
+        sink = getattr(self._local, "sink", None)
+        if sink is not None:
+            sink(message, style)
+            return
+        # Imported on first use so headless runs (CLI, jobs) never load Streamlit.
+        import streamlit as st
         if style == "error":
             st.error(message)
         elif style == "warning":
@@ -13,4 +42,3 @@ class Console:
             st.info(message)
 
 console = Console()
-
@@ -0,0 +1,131 @@
+# memo.py
+"""
+Run-scoped memoization of GET responses for NautobotClient (``memoize=True``).
+
+Responses are cached by normalized path and query, in an LRU of ``max_entries``.
+Identical GETs in flight at the same time are sent once (single-flight), and any write
+(POST/PATCH/PUT/DELETE) to an endpoint drops the cached responses of that endpoint and of
+the endpoints whose results it changes (e.g. a new IP-to-interface mapping changes
+``/api/ipam/ip-addresses/?interface=...``). Cached responses are shared between callers and
+must be treated as read-only.
+"""
+import re
+import threading
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlsplit
+from instrumentation import endpoint_template
+
+DEFAULT_MAX_ENTRIES = 1024
+# Writes to the key endpoint also change what the listed endpoints return.
+RELATED_ENDPOINTS = {
+    "/api/ipam/ip-address-to-interface/": ("/api/ipam/ip-addresses/", "/api/dcim/interfaces/"),
+    "/api/ipam/ip-addresses/": ("/api/ipam/ip-address-to-interface/", "/api/dcim/interfaces/"),
+    "/api/dcim/devices/": ("/api/dcim/interfaces/", "/api/ipam/ip-address-to-interface/", "/api/ipam/ip-addresses/"),
+    "/api/dcim/interfaces/": ("/api/ipam/ip-address-to-interface/", "/api/ipam/ip-addresses/"),
+    "/api/dcim/device-types/": ("/api/dcim/interface-templates/",),
+}
+DETAIL_SUFFIX = re.compile(r"\{id\}/.*$")
+
+def collection(url: str) -> str:
+    """``/api/dcim/devices/<uuid>/?depth=0`` -> ``/api/dcim/devices/``."""
+    path = DETAIL_SUFFIX.sub("", endpoint_template(url))
+    return path if path.endswith("/") else path + "/"
+
+def cache_key(url: str, params: dict | None = None) -> tuple:
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    for name, value in (params or {}).items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        query.extend((name, str(item)) for item in values)
+    return parts.path, tuple(sorted(query))
+
+class _Flight:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class GetCache:
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = self.misses = self.coalesced = self.invalidations = self.evictions = 0
+        self._entries = OrderedDict()
+        self._by_endpoint = {}
+        self._generations = {}
+        self._epoch = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def fetch(self, url: str, params: dict | None, send):
+        """The cached response for this GET, or the result of ``send()`` (called once for concurrent identical GETs)."""
+        key = cache_key(url, params)
+        endpoint = collection(key[0])
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                self.misses += 1
+                flight = self._flights[key] = _Flight()
+                generation = self._generation(endpoint)
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = send()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                # A write to the endpoint while this GET was in flight may not be reflected in its response.
+                if flight.error is None and self._generation(endpoint) == generation:
+                    self._store(key, endpoint, flight.result)
+            flight.event.set()
+        return flight.result
+
+    def _generation(self, endpoint: str) -> tuple:
+        return self._epoch, self._generations.get(endpoint, 0)
+
+    def _store(self, key: tuple, endpoint: str, value):
+        self._entries[key] = value
+        self._by_endpoint.setdefault(endpoint, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            old_key, _ = self._entries.popitem(last=False)
+            self._by_endpoint.get(collection(old_key[0]), set()).discard(old_key)
+            self.evictions += 1
+
+    def invalidate(self, url: str):
+        """Forget cached responses that a write to ``url`` may have changed."""
+        endpoint = collection(url)
+        with self._lock:
+            for name in (endpoint, *RELATED_ENDPOINTS.get(endpoint, ())):
+                self._generations[name] = self._generations.get(name, 0) + 1
+                for key in self._by_endpoint.pop(name, ()):
+                    if self._entries.pop(key, None) is not None:
+                        self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._by_endpoint.clear()
+
+    def summary(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced,
+                "invalidations": self.invalidations, "evictions": self.evictions, "entries": len(self._entries),
+                "hit_rate": round((self.hits + self.coalesced) / lookups, 3) if lookups else 0.0,
+            }
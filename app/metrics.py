@@ -0,0 +1,242 @@
+# metrics.py
+"""
+Prometheus metrics for API calls, pipeline runs and stages, served in the text exposition
+format on ``/metrics``. Self-contained so the image needs no extra dependency; collection
+only starts once start_metrics_server (or enable_metrics) is called.
+"""
+import bisect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import instrumentation
+
+METRICS_PORT_ENV = "METRICS_PORT"
+PREFIX = "nautobot_gitops_"
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LONG_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = ()):
+        self.name = PREFIX + name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key: tuple, value) -> list:
+        return [f"{self.name}{_labels(self.label_names, key)} {_number(value)}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple = (), buckets: tuple = REQUEST_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                state[0][index] += 1
+            state[1] += 1
+            state[2] += value
+
+    def _render_value(self, key: tuple, value) -> list:
+        counts, total, value_sum = value
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            le = 'le="' + _number(bound) + '"'
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+        le = 'le="+Inf"'
+        lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {total}")
+        lines.append(f"{self.name}_count{_labels(self.label_names, key)} {total}")
+        lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(value_sum)}")
+        return lines
+
+HTTP_REQUEST_SECONDS = Histogram("http_request_duration_seconds", "Nautobot API request latency, retries included.",
+                                 ("method", "endpoint", "status"))
+HTTP_REQUESTS = Counter("http_requests_total", "Nautobot API requests by final status code ('error' when none).",
+                        ("method", "endpoint", "status"))
+HTTP_RETRIES = Counter("http_retries_total", "Retries made for Nautobot API requests (429/5xx, connection errors).",
+                       ("method", "endpoint"))
+RUNS = Counter("runs_total", "Pipeline runs by result.", ("pipeline", "result"))
+RUN_SECONDS = Histogram("run_duration_seconds", "Pipeline run duration.", ("pipeline",), buckets=LONG_BUCKETS)
+RUN_LAST_SECONDS = Gauge("run_last_duration_seconds", "Duration of the last run of each pipeline.", ("pipeline",))
+RUN_LAST_SUCCESS = Gauge("run_last_success_timestamp_seconds", "Unix time of the last run without errors.", ("pipeline",))
+RUNS_IN_PROGRESS = Gauge("runs_in_progress", "Pipeline runs currently in progress.", ("pipeline",))
+STAGE_SECONDS = Gauge("stage_duration_seconds", "Duration of each stage in the last run of its pipeline.", ("pipeline", "stage"))
+STAGE_OBJECTS_PER_SECOND = Gauge("stage_objects_per_second", "Objects handled per second by each stage in the last run.",
+                                 ("pipeline", "stage"))
+GIT_CLONE_SECONDS = Histogram("git_clone_duration_seconds", "Git clone duration.", ("pipeline",), buckets=LONG_BUCKETS)
+YAML_PARSE_SECONDS = Histogram("yaml_parse_duration_seconds", "Time spent parsing one YAML file or shard.",
+                               buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0))
+YAML_ITEMS = Counter("yaml_parsed_items_total", "Top-level objects parsed from YAML files.")
+CONCURRENCY_LIMIT = Gauge("concurrency_limit", "Current adaptive limit of requests in flight to each Nautobot.", ("target",))
+THROTTLE_EVENTS = Counter("throttle_events_total", "Times a Nautobot throttled requests (429/503) or its latency rose, "
+                          "each cutting the concurrency limit.", ("target", "reason"))
+WATCH_LAG = Gauge("watch_lag_seconds", "Seconds between a commit being seen and applied, for the last apply of each "
+                  "watch target.", ("target",))
+WATCH_LAST_DURATION = Gauge("watch_last_apply_duration_seconds", "Duration of the last apply of each watch target.",
+                            ("target",))
+WATCH_LAST_APPLY = Gauge("watch_last_apply_timestamp_seconds", "Unix time of the last apply without errors of each "
+                         "watch target.", ("target",))
+WATCH_DRIFT_OBJECTS = Gauge("watch_drift_objects", "Objects missing from or differing in Nautobot at the last drift check of each "
+                            "watch target.", ("target",))
+
+ALL_METRICS = [
+    HTTP_REQUEST_SECONDS, HTTP_REQUESTS, HTTP_RETRIES, RUNS, RUN_SECONDS, RUN_LAST_SECONDS, RUN_LAST_SUCCESS,
+    RUNS_IN_PROGRESS, STAGE_SECONDS, STAGE_OBJECTS_PER_SECOND, GIT_CLONE_SECONDS,
+    YAML_PARSE_SECONDS, YAML_ITEMS, CONCURRENCY_LIMIT, THROTTLE_EVENTS, WATCH_LAG, WATCH_LAST_DURATION,
+    WATCH_LAST_APPLY, WATCH_DRIFT_OBJECTS,
+]
+
+def render() -> str:
+    lines = []
+    for metric in ALL_METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+class MetricsListener:
+    """Feeds pipeline events from instrumentation into the metrics above."""
+
+    def __init__(self):
+        self._in_progress = {}
+        self._lock = threading.Lock()
+
+    def run_started(self, pipeline: str):
+        with self._lock:
+            self._in_progress[pipeline] = self._in_progress.get(pipeline, 0) + 1
+            RUNS_IN_PROGRESS.set(self._in_progress[pipeline], pipeline=pipeline)
+
+    def run_finished(self, pipeline: str, seconds: float, ok: bool):
+        with self._lock:
+            self._in_progress[pipeline] = max(self._in_progress.get(pipeline, 1) - 1, 0)
+            RUNS_IN_PROGRESS.set(self._in_progress[pipeline], pipeline=pipeline)
+        RUNS.inc(pipeline=pipeline, result="success" if ok else "error")
+        RUN_SECONDS.observe(seconds, pipeline=pipeline)
+        RUN_LAST_SECONDS.set(seconds, pipeline=pipeline)
+        if ok:
+            RUN_LAST_SUCCESS.set(time.time(), pipeline=pipeline)
+
+    def stage_finished(self, pipeline: str, stage: str, seconds: float, objects: int):
+        STAGE_SECONDS.set(seconds, pipeline=pipeline, stage=stage)
+        if objects:
+            STAGE_OBJECTS_PER_SECOND.set(objects / seconds if seconds > 0 else objects, pipeline=pipeline, stage=stage)
+        if stage == "clone":
+            GIT_CLONE_SECONDS.observe(seconds, pipeline=pipeline)
+
+    def request_finished(self, method: str, endpoint: str, status: str, seconds: float, retries: int):
+        HTTP_REQUEST_SECONDS.observe(seconds, method=method, endpoint=endpoint, status=status)
+        HTTP_REQUESTS.inc(method=method, endpoint=endpoint, status=status)
+        if retries:
+            HTTP_RETRIES.inc(retries, method=method, endpoint=endpoint)
+
+    def parse_finished(self, path: str, seconds: float, items: int):
+        YAML_PARSE_SECONDS.observe(seconds)
+        YAML_ITEMS.inc(items)
+
+    def limit_changed(self, target: str, limit: int):
+        CONCURRENCY_LIMIT.set(limit, target=target)
+
+    def throttled(self, target: str, reason: str):
+        THROTTLE_EVENTS.inc(target=target, reason=reason)
+
+    def watch_reconciled(self, target: str, seconds: float, lag: float, ok: bool):
+        WATCH_LAST_DURATION.set(seconds, target=target)
+        WATCH_LAG.set(lag, target=target)
+        if ok:
+            WATCH_LAST_APPLY.set(time.time(), target=target)
+
+    def drift_checked(self, target: str, missing: int):
+        WATCH_DRIFT_OBJECTS.set(missing, target=target)
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+_listener = MetricsListener()
+_server = None
+_server_lock = threading.Lock()
+
+def enable_metrics():
+    """Start collecting metrics (without serving them)."""
+    instrumentation.add_listener(_listener)
+
+def start_metrics_server(port: int, host: str = "0.0.0.0"):
+    """Collect metrics and serve them on ``http://host:port/metrics``; later calls are no-ops."""
+    global _server
+    with _server_lock:
+        if _server is not None:
+            return _server
+        enable_metrics()
+        _server = ThreadingHTTPServer((host, port), _Handler)
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        return _server
+
+def start_metrics_server_from_env():
+    """Start the metrics server when $METRICS_PORT is set (e.g. by the Kubernetes deployment)."""
+    port = os.environ.get(METRICS_PORT_ENV)
+    if port:
+        return start_metrics_server(int(port))
+    return None
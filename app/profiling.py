@@ -0,0 +1,181 @@
+# profiling.py
+"""
+Opt-in CPU and memory profiling of every phase (instrumentation stage) of a run.
+
+Each top-level stage of a run (``clone``, ``validate``, ``lookups``, ``devices.yml``, ...)
+is wrapped in a cProfile profiler, and tracemalloc records its peak and net memory and
+top allocation sites. Per run, a directory ``<pipeline>-<timestamp>`` is written under the
+output directory with one ``NN-<stage>.prof`` file per phase (open with ``python -m
+pstats`` or snakeviz) and ``report.txt``/``report.json`` holding the per-phase table.
+
+Enabled with $PROFILE_DIR (app) or ``--profile-dir`` (CLI). cProfile only sees the thread
+running the stage, so CPU spent in worker threads or the parse process pool is not in the
+.prof files; tracemalloc figures are process-wide. Both slow the run down noticeably.
+"""
+import cProfile
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+import instrumentation
+from logger import console
+
+PROFILE_DIR_ENV = "PROFILE_DIR"
+TOP_ALLOCATIONS = 5
+TOP_FUNCTIONS = 5
+
+def _safe_name(name: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", name).strip("_") or "stage"
+
+def _mb(size: int) -> float:
+    return round(size / 2 ** 20, 2)
+
+class Profiler:
+    """Instrumentation listener profiling the phases of runs on each thread."""
+
+    def __init__(self, output_dir: str):
+        self.output_dir = output_dir
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._tracemalloc_users = 0
+
+    def run_started(self, pipeline: str):
+        local = self._local
+        local.runs = getattr(local, "runs", 0) + 1
+        if local.runs > 1:
+            return
+        local.run = {"pipeline": pipeline, "started": time.time(), "phases": []}
+        local.depth, local.phase = 0, None
+        with self._lock:
+            if self._tracemalloc_users == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+            self._tracemalloc_users += 1
+
+    def stage_started(self, pipeline: str, stage: str):
+        local = self._local
+        if getattr(local, "run", None) is None:
+            return
+        local.depth += 1
+        if local.depth > 1:
+            # Nested stages are part of the enclosing phase.
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active on this thread.
+            profile = None
+        tracemalloc.reset_peak()
+        local.phase = {
+            "stage": stage,
+            "profile": profile,
+            "memory_before": tracemalloc.get_traced_memory()[0],
+        }
+
+    def stage_finished(self, pipeline: str, stage: str, seconds: float, objects: int):
+        local = self._local
+        if getattr(local, "run", None) is None or local.depth == 0:
+            return
+        local.depth -= 1
+        if local.depth > 0 or local.phase is None:
+            return
+        phase, local.phase = local.phase, None
+        profile = phase["profile"]
+        if profile is not None:
+            profile.disable()
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)])
+        allocations = [
+            {"where": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", "mb": _mb(stat.size), "blocks": stat.count}
+            for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+        ]
+        local.run["phases"].append({
+            "stage": stage,
+            "seconds": round(seconds, 3),
+            "objects": objects,
+            "peak_mb": _mb(peak),
+            "net_mb": _mb(current - phase["memory_before"]),
+            "allocations": allocations,
+            "profile": profile,
+        })
+
+    def run_finished(self, pipeline: str, seconds: float, ok: bool):
+        local = self._local
+        local.runs = max(getattr(local, "runs", 1) - 1, 0)
+        if local.runs or getattr(local, "run", None) is None:
+            return
+        run, local.run = local.run, None
+        with self._lock:
+            self._tracemalloc_users -= 1
+            if self._tracemalloc_users == 0:
+                tracemalloc.stop()
+        try:
+            path = self._write(run, seconds)
+        except OSError as e:
+            console.log(f"Could not write profile: {e}", style="warning")
+            return
+        console.log(f"Profile of {len(run['phases'])} phase(s) written to {path}.", style="info")
+
+    def _write(self, run: dict, seconds: float) -> str:
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(run["started"]))
+        path = os.path.join(self.output_dir, f"{_safe_name(run['pipeline'])}-{stamp}-{threading.get_ident() % 10000:04d}")
+        os.makedirs(path, exist_ok=True)
+        rows = []
+        for index, phase in enumerate(run["phases"], start=1):
+            profile = phase.pop("profile")
+            phase["cpu_seconds"], phase["top_functions"] = None, []
+            if profile is not None:
+                filename = f"{index:02d}-{_safe_name(phase['stage'])}.prof"
+                profile.dump_stats(os.path.join(path, filename))
+                stats = pstats.Stats(profile)
+                phase["profile_file"] = filename
+                phase["cpu_seconds"] = round(stats.total_tt, 3)
+                top = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:TOP_FUNCTIONS]
+                phase["top_functions"] = [
+                    {"function": f"{os.path.basename(file)}:{line}({name})", "seconds": round(tottime, 3), "calls": calls}
+                    for (file, line, name), (_, calls, tottime, _, _) in top
+                ]
+            rows.append(phase)
+        report = {"pipeline": run["pipeline"], "started": stamp, "seconds": round(seconds, 3), "phases": rows}
+        with open(os.path.join(path, "report.json"), "w") as f:
+            json.dump(report, f, indent=2)
+        with open(os.path.join(path, "report.txt"), "w") as f:
+            f.write(self.format_report(report))
+        return path
+
+    @staticmethod
+    def format_report(report: dict) -> str:
+        width = max([len("phase")] + [len(phase["stage"]) for phase in report["phases"]])
+        lines = [
+            f"{report['pipeline']} run of {report['seconds']}s started {report['started']}",
+            "",
+            f"{'phase':<{width}} {'wall s':>9} {'cpu s':>9} {'objects':>8} {'peak MB':>9} {'net MB':>9}",
+        ]
+        for phase in report["phases"]:
+            cpu = "-" if phase["cpu_seconds"] is None else phase["cpu_seconds"]
+            lines.append(f"{phase['stage']:<{width}} {phase['seconds']:>9} {cpu:>9} {phase['objects']:>8} "
+                         f"{phase['peak_mb']:>9} {phase['net_mb']:>9}")
+        for phase in report["phases"]:
+            lines += ["", f"{phase['stage']}:"]
+            lines += [f"  cpu   {entry['seconds']:>8}s {entry['calls']:>8} calls  {entry['function']}" for entry in phase["top_functions"]]
+            lines += [f"  alloc {entry['mb']:>8}MB {entry['blocks']:>8} blocks {entry['where']}" for entry in phase["allocations"]]
+        return "\n".join(lines) + "\n"
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+def enable_profiling(output_dir: str | None = None) -> Profiler | None:
+    """Profile every following run into ``output_dir`` (default $PROFILE_DIR); None when neither is set."""
+    global _profiler
+    output_dir = output_dir or os.environ.get(PROFILE_DIR_ENV)
+    if not output_dir:
+        return None
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = Profiler(output_dir)
+            instrumentation.add_listener(_profiler)
+        return _profiler
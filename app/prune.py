@@ -0,0 +1,161 @@
+# prune.py
+import os
+import tempfile
+from nautobot_client import NautobotClient
+from logger import console
+from loader import discover_shards, iter_source_objects
+from delete import bulk_delete
+from instrumentation import add_objects, run, stage
+from snapshot import Snapshot
+from validation import BUILTIN_STATUSES, nautobot_keys, validate_repo
+
+# Dependency-safe order, matching delete_all_data. IP addresses are read from the interfaces nested in devices.yml.
+PRUNE_ORDER = [
+    {"filename": "devices.yml", "endpoint": "/api/dcim/devices/", "object_type": "Devices", "compare_key": "name"},
+    {"filename": "devices.yml", "endpoint": "/api/ipam/ip-addresses/", "object_type": "IP Addresses", "compare_key": "address", "nested": True},
+    {"filename": "prefixes.yml", "endpoint": "/api/ipam/prefixes/", "object_type": "Prefixes", "compare_key": "prefix"},
+    {"filename": "device_types.yml", "endpoint": "/api/dcim/device-types/", "object_type": "Device Types", "compare_key": "model"},
+    {"filename": "locations.yml", "endpoint": "/api/dcim/locations/", "object_type": "Locations", "compare_key": "name"},
+    {"filename": "roles.yml", "endpoint": "/api/extras/roles/", "object_type": "Roles", "compare_key": "name"},
+    {"filename": "manufacturers.yml", "endpoint": "/api/dcim/manufacturers/", "object_type": "Manufacturers", "compare_key": "name"},
+    {"filename": "location_types.yml", "endpoint": "/api/dcim/location-types/", "object_type": "Location Types", "compare_key": "name"},
+    {"filename": "statuses.yml", "endpoint": "/api/extras/statuses/", "object_type": "Statuses", "compare_key": "name"},
+]
+# Types whose values are unique per namespace only.
+NAMESPACED = {"/api/ipam/ip-addresses/", "/api/ipam/prefixes/"}
+
+def parse_custom_field_scope(scope: str) -> tuple:
+    """
+    Split a custom field scope given as ``name=value`` into ``(name, value)``. Raises
+    ValueError when the ``=`` is missing or either side is empty once stripped, since an
+    empty name would silently drop the scope and widen the prune to the whole instance.
+    """
+    name, separator, value = scope.partition("=")
+    name, value = name.strip(), value.strip()
+    if not separator or not name or not value:
+        raise ValueError(f"custom field scope '{scope}' must be given as name=value, with a non-empty name and value")
+    return name, value
+
+@run("prune-plan")
+def plan_prune(nautobot_token: str, git_repo_url: str, subdirectory: str, nautobot_url: str = "http://localhost:8080",
+               username: str = None, token: str = None, tag: str = None,
+               custom_field: str = None, custom_field_value: str = None):
+    """
+    Work out, per type, which Nautobot objects are absent from the git YAML.
+
+    Only types whose file (or shard directory) exists in the repo are considered, so a
+    missing file never means "delete everything". The scope can be narrowed to objects
+    marked as GitOps-managed with a tag and/or a custom field value; types that do not
+    support the filter are skipped. Built-in statuses are never pruned. Returns a dict
+    mapping object type to a list of ``{"id", "key"}`` candidates, or None on failure.
+    """
+    import git
+    if username and token:
+        if git_repo_url.startswith("https://"):
+            git_repo_url = git_repo_url.replace("https://", f"https://{username}:{token}@")
+        elif git_repo_url.startswith("http://"):
+            git_repo_url = git_repo_url.replace("http://", f"http://{username}:{token}@")
+    if custom_field is not None or custom_field_value is not None:
+        # A half-given scope must not fall back to pruning the whole instance.
+        if not (custom_field or "").strip() or not (custom_field_value or "").strip():
+            console.log("Custom field scope needs both a name and a value; prune plan aborted.", style="error")
+            return None
+    scope_params = {}
+    if tag:
+        scope_params["tags"] = tag
+    if custom_field:
+        scope_params[f"cf_{custom_field}"] = custom_field_value
+    git_keys = {}
+    nautobot_client = NautobotClient(url=nautobot_url, token=nautobot_token)
+    with tempfile.TemporaryDirectory() as temp_dir, Snapshot(nautobot_client) as snapshot:
+        try:
+            with stage("clone"):
+                git.Repo.clone_from(git_repo_url, temp_dir)
+        except Exception as e:
+            console.log(f"Error cloning repository: {e}", style="error")
+            return None
+        repo_dir = os.path.join(temp_dir, subdirectory.strip("/"))
+        with stage("validate"):
+            validation_errors = validate_repo(repo_dir, known=nautobot_keys(snapshot))
+        if validation_errors:
+            for error in validation_errors:
+                console.log(error, style="error")
+            console.log(f"Validation failed with {len(validation_errors)} error(s); refusing to plan a prune.", style="error")
+            return None
+        try:
+            # IP addresses and prefixes are keyed by (namespace id, value): the same value in another namespace is another object.
+            namespaces = snapshot.lookup("/api/ipam/namespaces/")
+            prefix_namespaces = {record.id: record.namespace for record in snapshot.objects("/api/ipam/prefixes/")}
+        except Exception as e:
+            console.log(f"Error retrieving namespaces and prefixes: {e}", style="error")
+            return None
+        for item in PRUNE_ORDER:
+            shards = discover_shards(repo_dir, item["filename"])
+            if not shards:
+                continue
+            errors_before = console.counts["error"]
+            if item.get("nested"):
+                keys = {
+                    (namespaces.get(ip.get("namespace")), ip.get("address"))
+                    for device in iter_source_objects(shards, "name", root=repo_dir) if isinstance(device, dict)
+                    for iface in device.get("interfaces") or [] if isinstance(iface, dict)
+                    for ip in iface.get("ip-address") or [] if isinstance(ip, dict)
+                }
+            elif item["endpoint"] in NAMESPACED:
+                keys = {(namespaces.get(obj.get("namespace")), obj.get(item["compare_key"]))
+                        for obj in iter_source_objects(shards, item["compare_key"], root=repo_dir) if isinstance(obj, dict)}
+            else:
+                keys = {obj.get(item["compare_key"]) for obj in iter_source_objects(shards, item["compare_key"], root=repo_dir)
+                        if isinstance(obj, dict)}
+            if console.counts["error"] != errors_before:
+                console.log(f"Could not read {item['filename']} cleanly; {item['object_type']} will not be pruned.", style="warning")
+                continue
+            git_keys[item["object_type"]] = keys
+
+    def nautobot_key(item: dict, obj: dict):
+        value = obj.get(item["compare_key"])
+        if item["endpoint"] not in NAMESPACED:
+            return value
+        namespace, parent = obj.get("namespace"), obj.get("parent")
+        # Nautobot gives an IP address's namespace through its parent prefix.
+        if isinstance(namespace, dict) and namespace.get("id"):
+            return namespace["id"], value
+        return prefix_namespaces.get(parent.get("id")) if isinstance(parent, dict) else None, value
+
+    plan = {}
+    for item in PRUNE_ORDER:
+        object_type = item["object_type"]
+        if object_type not in git_keys:
+            continue
+        compare_key = item["compare_key"]
+        try:
+            with stage(object_type):
+                existing = nautobot_client.iter_results(item["endpoint"], params=dict(scope_params, depth=0, exclude_m2m="true"))
+                candidates = [
+                    {"id": obj["id"], "key": obj.get(compare_key)}
+                    for obj in existing
+                    if nautobot_key(item, obj) not in git_keys[object_type]
+                    and not (object_type == "Statuses" and obj.get(compare_key) in BUILTIN_STATUSES)
+                ]
+        except Exception as e:
+            console.log(f"Error retrieving {object_type} for pruning (scope filter unsupported?): {e}; skipping.", style="warning")
+            continue
+        plan[object_type] = candidates
+    nautobot_client.stats.report()
+    return plan
+
+@run("prune")
+def apply_prune(nautobot_token: str, nautobot_url: str, plan: dict) -> int:
+    """Delete the objects of a plan from plan_prune, type by type in dependency order, with bulk requests."""
+    nautobot_client = NautobotClient(url=nautobot_url, token=nautobot_token)
+    deleted = 0
+    for item in PRUNE_ORDER:
+        candidates = plan.get(item["object_type"])
+        if candidates:
+            with stage(item["object_type"]):
+                count = bulk_delete(nautobot_client, item["endpoint"], item["object_type"], [obj["id"] for obj in candidates])
+                add_objects(count)
+                deleted += count
+    nautobot_client.stats.report()
+    console.log(f"Prune completed: {deleted} object(s) deleted.", style="warning")
+    return deleted
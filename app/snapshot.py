@@ -0,0 +1,238 @@
+# snapshot.py
+"""
+Local SQLite snapshot of the Nautobot objects this tool compares and resolves, per Nautobot URL.
+
+Only the fields used by check and deploy are kept (ids, names/models/prefixes and the ids of
+references such as role or location). The first refresh of an endpoint lists it in full;
+later ones fetch only the objects changed since the newest ``last_updated`` seen
+(``last_updated__gte``, with an overlap for transactions committed late), then compare the
+object count with Nautobot's: a mismatch means objects were deleted, and the endpoint is
+listed in full again, as it is every ``reconcile_interval`` seconds regardless. Each endpoint
+is refreshed at most once per Snapshot (one run); the run's own writes are applied with
+``store()``.
+
+The leaf digests of each endpoint's DigestTree (see digest.py) are kept in the store too.
+Objects fetched by a refresh or applied with ``store()`` lose theirs, so ``digest()`` only
+hashes the objects that changed since the last check.
+
+In memory, objects are Records: slotted, with the object's id, its key (name, model, prefix
+or address) and the ids of its references, interned since a few statuses, roles or types
+are shared by every device. A device costs about 400 bytes, most of it its id and name
+strings, instead of about 8 KB as an API dict (``python bench/memory_bench.py``).
+"""
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+import jsoncodec
+from digest import DigestTree, object_hash
+from logger import console
+from state import state_key, state_path
+
+RECONCILE_INTERVAL = 6 * 3600
+WATERMARK_OVERLAP = timedelta(seconds=60)
+# Watermark of an endpoint that was empty: anything created later is changed since.
+EMPTY_WATERMARK = "1970-01-01T00:00:00+00:00"
+PAGE_SIZE = 1000
+# An object's key is the first of these it has.
+KEY_FIELDS = ("name", "model", "prefix", "address")
+FIELDS = ("id", *KEY_FIELDS, "last_updated")
+# References are stored as {"id": ...} and kept as the referenced id on Records.
+REFERENCES = ("role", "status", "location", "location_type", "device_type", "manufacturer", "namespace", "parent",
+              "primary_ip4")
+# Ids referenced by one object only; interning them would only grow the interned-string table.
+UNIQUE_REFERENCES = ("primary_ip4",)
+LIST_PARAMS = {"depth": 0, "exclude_m2m": "true"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS objects (endpoint TEXT NOT NULL, id TEXT NOT NULL, data TEXT NOT NULL, PRIMARY KEY (endpoint, id));
+CREATE TABLE IF NOT EXISTS endpoints (endpoint TEXT PRIMARY KEY, watermark TEXT, reconciled REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS digests (endpoint TEXT NOT NULL, fields TEXT NOT NULL, id TEXT NOT NULL, digest TEXT NOT NULL,
+                                    PRIMARY KEY (endpoint, fields, id));
+"""
+
+def project(obj: dict) -> dict:
+    """The fields of a Nautobot object kept in the snapshot."""
+    kept = {field: obj[field] for field in FIELDS if obj.get(field) is not None}
+    for field in REFERENCES:
+        value = obj.get(field)
+        if isinstance(value, dict) and value.get("id"):
+            kept[field] = {"id": value["id"]}
+    return kept
+
+class Record:
+    """Compact in-memory form of a snapshot object; unset references are None."""
+    __slots__ = ("id", "key", *REFERENCES)
+
+    def __init__(self, obj: dict):
+        self.id = obj["id"]
+        self.key = next((obj[field] for field in KEY_FIELDS if obj.get(field)), None)
+        for field in REFERENCES:
+            value = obj.get(field)
+            ref_id = value.get("id") if isinstance(value, dict) else None
+            setattr(self, field, sys.intern(ref_id) if ref_id and field not in UNIQUE_REFERENCES else ref_id or None)
+
+    def __repr__(self) -> str:
+        return f"Record(id={self.id!r}, key={self.key!r})"
+
+def snapshot_path(nautobot_url: str) -> str:
+    return state_path("snapshots", state_key(nautobot_url) + ".sqlite")
+
+class Snapshot:
+    def __init__(self, nautobot_client, path: str | None = None, reconcile_interval: float = RECONCILE_INTERVAL):
+        self.client = nautobot_client
+        self.reconcile_interval = reconcile_interval
+        self.full = self.incremental = self.changed = self.hashed = 0
+        try:
+            self.path = path or snapshot_path(nautobot_client.base_url)
+            self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(SCHEMA)
+        except (OSError, sqlite3.Error) as e:
+            console.log(f"Snapshot store unavailable ({e}); keeping this run's snapshot in memory.", style="warning")
+            self.path = ":memory:"
+            self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._db.executescript(SCHEMA)
+        # endpoint -> {id: Record}, for the endpoints refreshed by this Snapshot.
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def objects(self, endpoint: str) -> list:
+        """The Records of a list endpoint (e.g. ``/api/dcim/devices/``), refreshed once per Snapshot."""
+        with self._lock:
+            if endpoint not in self._objects:
+                self._objects[endpoint] = self._refresh(endpoint)
+            return list(self._objects[endpoint].values())
+
+    def by_key(self, endpoint: str) -> dict:
+        """``{key: Record}`` for the objects of ``endpoint`` that have a key."""
+        return {record.key: record for record in self.objects(endpoint) if record.key}
+
+    def lookup(self, endpoint: str) -> dict:
+        """``{key: id}``, e.g. status names to ids."""
+        return {record.key: record.id for record in self.objects(endpoint) if record.key}
+
+    def store(self, endpoint: str, obj: dict):
+        """Apply an object this run created or updated, so later lookups see it without a refresh."""
+        if not isinstance(obj, dict) or not obj.get("id"):
+            return
+        kept = project(obj)
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO objects VALUES (?, ?, ?)", (endpoint, kept["id"], jsoncodec.dumps(kept)))
+            self._db.execute("DELETE FROM digests WHERE endpoint = ? AND id = ?", (endpoint, kept["id"]))
+            if endpoint in self._objects:
+                record = Record(kept)
+                self._objects[endpoint][record.id] = record
+
+    def digest(self, endpoint: str, object_type: str, fields: tuple = ()) -> DigestTree:
+        """
+        The DigestTree of an endpoint's objects, each hashed from its key and the ids of the
+        references named in ``fields`` (e.g. ``("role", "status")``). Stored leaf digests are
+        reused; only objects without one are hashed, and deleted objects' leaves are dropped.
+        """
+        records = self.objects(endpoint)
+        signature = ",".join((object_type, *fields))
+        tree, hashed = DigestTree(object_type), []
+        with self._lock:
+            stored = {obj_id: int(digest, 16) for obj_id, digest in self._db.execute(
+                "SELECT id, digest FROM digests WHERE endpoint = ? AND fields = ?", (endpoint, signature))}
+            for record in records:
+                if not record.key:
+                    continue
+                digest = stored.pop(record.id, None)
+                if digest is None:
+                    digest = object_hash(object_type, record.key, {field: getattr(record, field) for field in fields})
+                    hashed.append((endpoint, signature, record.id, format(digest, "032x")))
+                tree.add_leaf(record.key, digest)
+            if hashed or stored:
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    self._db.executemany("DELETE FROM digests WHERE endpoint = ? AND fields = ? AND id = ?",
+                                         [(endpoint, signature, obj_id) for obj_id in stored])
+                    self._db.executemany("INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)", hashed)
+                    self._db.execute("COMMIT")
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    raise
+        self.hashed += len(hashed)
+        return tree
+
+    def summary(self) -> dict:
+        return {"full": self.full, "incremental": self.incremental, "changed": self.changed, "hashed": self.hashed}
+
+    def _refresh(self, endpoint: str) -> dict:
+        row = self._db.execute("SELECT watermark, reconciled FROM endpoints WHERE endpoint = ?", (endpoint,)).fetchone()
+        watermark, reconciled = row if row else (None, 0.0)
+        if watermark is None or time.time() - reconciled >= self.reconcile_interval:
+            return self._reload(endpoint)
+        since = (datetime.fromisoformat(watermark) - WATERMARK_OVERLAP).isoformat()
+        rows, _, newest = self._fetch(endpoint, dict(LIST_PARAMS, last_updated__gte=since))
+        total = self.client.http_call(method="get", url=endpoint, params={"limit": 1, "depth": 0}).get("count")
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            self._db.executemany("INSERT OR REPLACE INTO objects VALUES (?, ?, ?)", rows)
+            self._db.executemany("DELETE FROM digests WHERE endpoint = ? AND id = ?", [(endpoint, row[1]) for row in rows])
+            objects = self._load(endpoint)
+            # Creates are all returned by the incremental query, so fewer objects in Nautobot means deletions.
+            if total != len(objects):
+                self._db.execute("ROLLBACK")
+                return self._reload(endpoint)
+            if newest is not None and newest > datetime.fromisoformat(watermark):
+                self._db.execute("UPDATE endpoints SET watermark = ? WHERE endpoint = ?", (newest.isoformat(), endpoint))
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self.incremental += 1
+        self.changed += len(rows)
+        return objects
+
+    def _reload(self, endpoint: str) -> dict:
+        rows, objects, newest = self._fetch(endpoint, LIST_PARAMS)
+        # Without last_updated in Nautobot's objects there is no watermark, and every refresh is a full one.
+        watermark = newest.isoformat() if newest is not None else (EMPTY_WATERMARK if not rows else None)
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            self._db.execute("DELETE FROM objects WHERE endpoint = ?", (endpoint,))
+            self._db.execute("DELETE FROM digests WHERE endpoint = ?", (endpoint,))
+            self._db.executemany("INSERT OR REPLACE INTO objects VALUES (?, ?, ?)", rows)
+            self._db.execute("INSERT OR REPLACE INTO endpoints VALUES (?, ?, ?)", (endpoint, watermark, time.time()))
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self.full += 1
+        self.changed += len(rows)
+        return objects
+
+    def _fetch(self, endpoint: str, params: dict) -> tuple:
+        """
+        List ``endpoint`` page by page, keeping only each object's row, its Record and the
+        newest ``last_updated``, so whole API objects never pile up.
+        """
+        rows, objects, newest = [], {}, None
+        for obj in self.client.iter_results(endpoint, params=params, page_size=PAGE_SIZE):
+            if not obj.get("id"):
+                continue
+            kept = project(obj)
+            rows.append((endpoint, kept["id"], jsoncodec.dumps(kept)))
+            record = Record(kept)
+            objects[record.id] = record
+            if kept.get("last_updated"):
+                updated = datetime.fromisoformat(kept["last_updated"])
+                newest = updated if newest is None or updated > newest else newest
+        return rows, objects, newest
+
+    def _load(self, endpoint: str) -> dict:
+        records = (Record(jsoncodec.loads(data)) for data, in self._db.execute("SELECT data FROM objects WHERE endpoint = ?", (endpoint,)))
+        return {record.id: record for record in records}
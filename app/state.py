@@ -0,0 +1,33 @@
+# state.py
+import hashlib
+import json
+import os
+
+def state_dir() -> str:
+    """Directory holding the tool's local state (shard blobs, jobs, snapshots)."""
+    path = os.environ.get("NAUTOBOT_GITOPS_STATE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "nautobot-gitops")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def state_path(*parts: str) -> str:
+    path = os.path.join(state_dir(), *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+def state_key(*values: str) -> str:
+    """Short, filesystem-safe key identifying a combination of values (e.g. Nautobot URL and repo)."""
+    return hashlib.sha1("\0".join(v or "" for v in values).encode()).hexdigest()[:16]
+
+def load_json(path: str, default=None):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+def save_json(path: str, data) -> None:
+    # Write to a temporary file first so readers never see a partial document.
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
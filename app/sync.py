@@ -1,85 +1,211 @@
 # sync.py
 import os
 import tempfile
-import git
-import yaml
-import streamlit as st
 from nautobot_client import NautobotClient
 from logger import console
+from loader import ParseCache, ShardTracker, discover_shards, iter_source_objects, repo_blob_shas
+from instrumentation import run, stage
+from digest import DigestTree
+from snapshot import Snapshot
+from state import load_json, save_json, state_key, state_path
+from validation import SCHEMAS, nautobot_keys, validate_repo
+
+# compare_fields: the required references compared besides the key, as {snapshot Record field: (git field, endpoint
+# of the referenced type)}. Git names them; they are compared as the ids Nautobot holds.
+REQUIRED_FILES = {
+    "manufacturers.yml": {"endpoint": "/api/dcim/manufacturers/", "object_type": "Manufacturers", "compare_key": "name"},
+    "device_types.yml": {"endpoint": "/api/dcim/device-types/", "object_type": "Device Types", "compare_key": "model",
+                         "compare_fields": {"manufacturer": ("manufacturer", "/api/dcim/manufacturers/")}},
+    "roles.yml": {"endpoint": "/api/extras/roles/", "object_type": "Roles", "compare_key": "name"},
+    "locations.yml": {"endpoint": "/api/dcim/locations/", "object_type": "Locations", "compare_key": "name",
+                      "compare_fields": {"location_type": ("location_type", "/api/dcim/location-types/")}},
+    "location_types.yml": {"endpoint": "/api/dcim/location-types/", "object_type": "Location Types", "compare_key": "name"},
+    "statuses.yml": {"endpoint": "/api/extras/statuses/", "object_type": "Statuses", "compare_key": "name"},
+    "prefixes.yml": {"endpoint": "/api/ipam/prefixes/", "object_type": "Prefixes", "compare_key": "prefix",
+                     "compare_fields": {"namespace": ("namespace", "/api/ipam/namespaces/"),
+                                        "status": ("status", "/api/extras/statuses/")}},
+    "devices.yml": {"endpoint": "/api/dcim/devices/", "object_type": "Devices", "compare_key": "name",
+                    "compare_fields": {"role": ("role", "/api/extras/roles/"), "status": ("status", "/api/extras/statuses/"),
+                                       "location": ("location", "/api/dcim/locations/"),
+                                       "device_type": ("device-type", "/api/dcim/device-types/")}},
+}
 
 def check_and_compare_objects(nautobot_token: str, git_repo_url: str, subdirectory: str,
                               nautobot_url: str = "http://localhost:8080", username: str = None, token: str = None):
+    # Streamlit is only imported here so the headless CLI can use compare_objects without it.
+    import streamlit as st
+    result = compare_objects(nautobot_token, git_repo_url, subdirectory, nautobot_url, username=username, token=token)
+    if result is None:
+        return None
+    shard_counts = result["files"]
+    validation_errors = result["validation_errors"]
+    compare_results = result["compare_results"]
+    st.markdown("### File Status:")
+    for fname in REQUIRED_FILES.keys():
+        if shard_counts.get(fname):
+            st.write(f"• {fname}" if shard_counts[fname] == 1 else f"• {fname} ({shard_counts[fname]} shards)")
+        else:
+            st.write(f"• {fname}: Not Found or Empty")
+    st.markdown("### Validation:")
+    if validation_errors:
+        st.error(f"{len(validation_errors)} validation error(s) found; Deploy will refuse to start until they are fixed.")
+        for error in validation_errors:
+            st.write(f"• {error}")
+    else:
+        st.success("All objects are valid.")
+    st.markdown("### Objects to be added to or updated in Nautobot:")
+    for object_type in [info["object_type"] for info in REQUIRED_FILES.values()]:
+        st.markdown(f"**{object_type}:**")
+        if compare_results.get(object_type):
+            for val in compare_results[object_type]:
+                st.success(val)
+        else:
+            st.info("None")
+    st.session_state.check_done = True
+    return compare_results
+
+@run("check")
+def compare_objects(nautobot_token: str, git_repo_url: str, subdirectory: str,
+                    nautobot_url: str = "http://localhost:8080", username: str = None, token: str = None):
+    """
+    Clone the repo, validate it and compare its objects with Nautobot, without any UI.
+
+    Returns a dict with the shard count per file (``files``), the ``validation_errors``,
+    per object type the sorted keys missing from Nautobot or whose compared fields differ
+    there (``compare_results``) and the root digests of both sides per file (``digests``),
+    or None if the repository could not be cloned. Only the objects git manages are
+    compared. Shards unchanged since the last check are neither validated nor parsed again,
+    changed ones are parsed once for both, and a shard with errors is not recorded, so the
+    next check reports it again. Nautobot's leaf digests are kept in the snapshot, and a
+    type whose digests match the last check's reuses its result (see digest.py).
+    """
+    import git
+    source_repo_url = git_repo_url
     # If authentication credentials are provided, inject them into the repo URL.
     if username and token:
         if git_repo_url.startswith("https://"):
             git_repo_url = git_repo_url.replace("https://", f"https://{username}:{token}@")
         elif git_repo_url.startswith("http://"):
             git_repo_url = git_repo_url.replace("http://", f"http://{username}:{token}@")
-            
-    required_files = {
-        "manufacturers.yml": {"endpoint": "/api/dcim/manufacturers/?limit=0", "object_type": "Manufacturers", "compare_key": "name"},
-        "device_types.yml": {"endpoint": "/api/dcim/device-types/?limit=0", "object_type": "Device Types", "compare_key": "model"},
-        "roles.yml": {"endpoint": "/api/extras/roles/?limit=0", "object_type": "Roles", "compare_key": "name"},
-        "locations.yml": {"endpoint": "/api/dcim/locations/?limit=0", "object_type": "Locations", "compare_key": "name"},
-        "location_types.yml": {"endpoint": "/api/dcim/location-types/?limit=0", "object_type": "Location Types", "compare_key": "name"},
-        "statuses.yml": {"endpoint": "/api/extras/statuses/?limit=0", "object_type": "Statuses", "compare_key": "name"},
-        "prefixes.yml": {"endpoint": "/api/ipam/prefixes/?limit=0", "object_type": "Prefixes", "compare_key": "prefix"},
-        "devices.yml": {"endpoint": "/api/dcim/devices/?limit=0", "object_type": "Devices", "compare_key": "name"},
-    }
+    required_files = REQUIRED_FILES
     found_files = {}
+    nautobot_client = NautobotClient(url=nautobot_url, token=nautobot_token)
+    # Nautobot's objects come from the local snapshot, refreshed with only what changed since the last run.
+    snapshot = Snapshot(nautobot_client)
     with tempfile.TemporaryDirectory() as temp_dir:
         try:
-            git.Repo.clone_from(git_repo_url, temp_dir)
+            with stage("clone"):
+                repo = git.Repo.clone_from(git_repo_url, temp_dir)
         except Exception as e:
             console.log(f"Error cloning repository: {e}", style="error")
+            snapshot.close()
             return None
-        for filename, info in required_files.items():
-            file_path = os.path.join(temp_dir, subdirectory.strip("/"), filename)
-            if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
-                try:
-                    with open(file_path, "r") as f:
-                        data = yaml.safe_load(f)
-                        if isinstance(data, list):
-                            found_files[filename] = data
-                except Exception as e:
-                    console.log(f"Error reading {filename}: {e}", style="error")
-    st.markdown("### File Status:")
-    for fname in required_files.keys():
-        if fname in found_files:
-            st.write(f"• {fname}")
-        else:
-            st.write(f"• {fname}: Not Found or Empty")
-    nautobot_client = NautobotClient(url=nautobot_url, token=nautobot_token)
-    compare_results = {}
+        repo_dir = os.path.join(temp_dir, subdirectory.strip("/"))
+        # The keys and compared fields of every shard are kept with its blob id, so only shards changed since the last
+        # check are validated and parsed, once: the cache hands validation's parse to the read.
+        blob_shas = repo_blob_shas(repo, subdirectory)
+        tracker = ShardTracker(state_path("check", state_key(source_repo_url, subdirectory) + ".json"), repo_dir,
+                               blob_shas, keep_values=True)
+        cache = ParseCache(blob_shas)
+        with stage("validate"):
+            validation_errors = validate_repo(repo_dir, known=nautobot_keys(snapshot), cache=cache, tracker=tracker)
+        # Files that are validated but not compared (interface templates) are recorded once they pass.
+        for filename in SCHEMAS.keys() - required_files.keys():
+            tracker.commit(filename)
+        shard_counts = {}
+        with stage("read"):
+            for filename, info in required_files.items():
+                # Each type may be a single file or a directory of shards (e.g. devices/<site>/*.yml).
+                shards = discover_shards(repo_dir, filename)
+                if shards:
+                    try:
+                        found_files[filename] = _read_digest(tracker, repo_dir, filename, shards, info["compare_key"],
+                                                             _resolver(snapshot, info.get("compare_fields", {})),
+                                                             cache, validation_errors)
+                        shard_counts[filename] = len(shards)
+                    except Exception as e:
+                        console.log(f"Error reading {filename}: {e}", style="error")
+        tracker.save()
+    drift_file = state_path("drift", state_key(nautobot_url, source_repo_url, subdirectory) + ".json")
+    previous = load_json(drift_file, default={})
+    compare_results, digests = {}, {}
     for filename, info in required_files.items():
         object_type = info["object_type"]
-        compare_key = info["compare_key"]
         endpoint = info["endpoint"]
         if filename not in found_files:
             compare_results[object_type] = None
             continue
-        git_list = found_files[filename]
+        git_tree = found_files[filename]
         try:
-            response = nautobot_client.http_call(method="get", url=endpoint)
-            existing_objects = response.get("results", [])
+            with stage(filename):
+                # Objects git does not manage are left out, so they do not make the roots differ.
+                nautobot_tree = snapshot.digest(endpoint, filename, tuple(info.get("compare_fields", {}))).matching(git_tree)
         except Exception as e:
             console.log(f"Error retrieving {object_type} from Nautobot: {e}", style="error")
             compare_results[object_type] = None
             continue
-        git_values = {obj.get(compare_key) for obj in git_list if isinstance(obj, dict) and obj.get(compare_key)}
-        existing_values = {obj.get(compare_key) for obj in existing_objects if isinstance(obj, dict) and obj.get(compare_key)}
-        diff = sorted(list(git_values - existing_values))
-        compare_results[object_type] = diff if diff else None
-    st.markdown("### Objects to be added to Nautobot:")
-    for object_type in [info["object_type"] for info in required_files.values()]:
-        st.markdown(f"**{object_type}:**")
-        if compare_results.get(object_type):
-            for val in compare_results[object_type]:
-                st.success(val)
+        digests[filename] = {"git": git_tree.root, "nautobot": nautobot_tree.root}
+        last = previous.get(filename, {})
+        if last.get("git") == git_tree.root and last.get("nautobot") == nautobot_tree.root:
+            diff = last.get("missing", [])
         else:
-            st.info("None")
-    st.session_state.check_done = True
-    return compare_results
+            diff = sorted(git_tree.missing_from(nautobot_tree))
+        digests[filename]["missing"] = diff
+        compare_results[object_type] = diff if diff else None
+    snapshot.close()
+    save_json(drift_file, digests)
+    unchanged = [filename for filename, digest in digests.items() if previous.get(filename, {}).get("git") == digest["git"]
+                 and previous[filename].get("nautobot") == digest["nautobot"]]
+    if digests and len(unchanged) == len(digests):
+        console.log(f"No change since the last check: digests of all {len(digests)} type(s) match.", style="info")
+    if digests and not any(compare_results.values()):
+        console.log("No drift: every object in Git exists in Nautobot with the same fields.", style="success")
+    nautobot_client.stats.report()
+    return {"files": shard_counts, "validation_errors": validation_errors, "compare_results": compare_results,
+            "digests": {filename: {"git": digest["git"], "nautobot": digest["nautobot"]} for filename, digest in digests.items()}}
 
+def _resolver(snapshot: Snapshot, compare_fields: dict):
+    """Map the compared fields of a git object to the ids Nautobot's records hold; unknown names are kept, so they differ."""
+    lookups = {field: snapshot.lookup(endpoint) for field, (_, endpoint) in compare_fields.items()}
+    return lambda values: {field: lookups[field].get(values.get(field), values.get(field)) for field in compare_fields}
 
+def _read_digest(tracker: ShardTracker, repo_dir: str, filename: str, shards: list, compare_key: str, resolve,
+                 cache: ParseCache | None = None, errors: list | None = None) -> DigestTree:
+    """
+    The digest tree of a type's objects, rolled up from one tree per shard. Each object is
+    hashed from its key and its compared fields as given by ``resolve``; the keys and
+    fields of unchanged shards come from ``tracker``. A shard that cannot be parsed is
+    added to ``errors`` (unless validation already reported it) and is not recorded.
+    """
+    compare_fields = REQUIRED_FILES[filename].get("compare_fields", {})
+    changed, known_keys = tracker.select(filename, shards)
+    known_values = tracker.known_values(filename)
+    shard_trees = {shard: DigestTree(filename) for shard in shards}
+    for key, shard in known_keys.items():
+        if key:
+            shard_trees[shard].add(key, resolve(known_values.get(key) or {}))
+    # on_key runs just before its object is yielded; the object's fields are recorded with the key below.
+    accepted = {}
 
+    def on_key(shard: str, key):
+        accepted["shard"] = shard
+
+    def on_error(shard: str, error: Exception):
+        if tracker.reject(filename, shard) and errors is not None:
+            errors.append(f"{os.path.relpath(shard, repo_dir)}: cannot be parsed: {error}")
+
+    # Only the keys and compared fields are kept, so large files are streamed rather than loaded whole.
+    for obj in iter_source_objects(changed, compare_key, known_keys, on_key=on_key, root=repo_dir, cache=cache,
+                                   on_error=on_error, consume=True):
+        key = obj.get(compare_key) if isinstance(obj, dict) else None
+        if key is None:
+            continue
+        values = {field: obj.get(git_field) for field, (git_field, _) in compare_fields.items()}
+        tracker.record_key(filename, accepted["shard"], key, values)
+        if key:
+            shard_trees[accepted["shard"]].add(key, resolve(values))
+    tracker.commit(filename)
+    tree = DigestTree(filename)
+    for shard_tree in shard_trees.values():
+        tree.merge(shard_tree)
+    return tree
@@ -0,0 +1,285 @@
+# tracing.py
+"""
+Trace spans for pipeline runs, stages, objects and API calls, built from instrumentation
+events and exported in the OpenTelemetry (OTLP/JSON) format.
+
+Each run is one trace: a root span for the run, a child span per stage, a span per object
+inside a stage and a span per HTTP request. Finished traces are kept in memory for the UI
+and, when configured, appended to a JSON-lines file ($TRACES_FILE, one OTLP
+ExportTraceServiceRequest per line, as the OpenTelemetry collector's file exporter
+writes them) and/or posted to an OTLP/HTTP collector ($OTEL_EXPORTER_OTLP_ENDPOINT).
+"""
+import json
+import os
+import secrets
+import threading
+import time
+from collections import deque
+import instrumentation
+
+TRACES_FILE_ENV = "TRACES_FILE"
+OTLP_ENDPOINT_ENV = "OTEL_EXPORTER_OTLP_ENDPOINT"
+SERVICE_NAME = "nautobot-gitops"
+# Spans kept per trace; later ones are only counted in the per-name summary, so a 100k-device run stays bounded.
+MAX_SPANS_PER_TRACE = 20000
+RECENT_TRACES = 10
+STATUS_OK, STATUS_ERROR = 1, 2
+OBJECT_GROUP = " (per object)"
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent", "name", "group", "start_ns", "end_ns", "attributes", "status")
+
+    def __init__(self, trace: "Trace", name: str, parent: "Span | None" = None, group: str | None = None,
+                 start_ns: int | None = None, attributes: dict | None = None):
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent = parent
+        self.name = name
+        self.group = group or name
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes or {}
+        self.status = STATUS_OK
+
+    @property
+    def depth(self) -> int:
+        return self.parent.depth + 1 if self.parent is not None else 0
+
+    def end(self, end_ns: int | None = None):
+        self.end_ns = end_ns or time.time_ns()
+        self.trace.add(self)
+
+    def to_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 3 if "http.request.method" in self.attributes else 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": self.status},
+        }
+        if self.parent is not None:
+            span["parentSpanId"] = self.parent.span_id
+        return span
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+class Trace:
+    """The spans of one run, plus a per-name summary covering every span (kept or not)."""
+
+    def __init__(self, pipeline: str):
+        self.trace_id = secrets.token_hex(16)
+        self.pipeline = pipeline
+        self.root = None
+        self.spans = []
+        self.dropped = 0
+        self.summary = {}
+        self._lock = threading.Lock()
+
+    def add(self, span: Span):
+        duration = (span.end_ns - span.start_ns) / 1e9
+        with self._lock:
+            entry = self.summary.setdefault(span.group, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += duration
+            entry[2] = max(entry[2], duration)
+            if len(self.spans) < MAX_SPANS_PER_TRACE:
+                self.spans.append(span)
+            else:
+                self.dropped += 1
+
+    def to_otlp(self) -> dict:
+        with self._lock:
+            spans = [span.to_otlp() for span in self.spans]
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "nautobot-gitops.tracing"}, "spans": spans}],
+        }]}
+
+    def report(self, top: int = 20) -> dict:
+        """The slowest spans (with their offset from the run start, for a waterfall) and time per span name."""
+        start = self.root.start_ns if self.root else 0
+        with self._lock:
+            slowest = sorted(self.spans, key=lambda span: span.end_ns - span.start_ns, reverse=True)[:top]
+            summary = sorted(self.summary.items(), key=lambda item: item[1][1], reverse=True)
+        return {
+            "trace_id": self.trace_id,
+            "pipeline": self.pipeline,
+            "seconds": (self.root.end_ns - self.root.start_ns) / 1e9 if self.root and self.root.end_ns else None,
+            "dropped": self.dropped,
+            "slowest": [{
+                "span": "  " * span.depth + span.name,
+                "start_s": round((span.start_ns - start) / 1e9, 3),
+                "duration_s": round((span.end_ns - span.start_ns) / 1e9, 3),
+                "attributes": ", ".join(f"{key}={value}" for key, value in span.attributes.items()),
+            } for span in slowest],
+            "by_name": [{"span": name, "count": count, "total_s": round(total, 3), "max_s": round(longest, 3)}
+                        for name, (count, total, longest) in summary],
+        }
+
+class Tracer:
+    """Instrumentation listener turning pipeline events into spans."""
+
+    def __init__(self, traces_file: str | None = None, otlp_endpoint: str | None = None):
+        self.traces_file = traces_file
+        self.otlp_endpoint = otlp_endpoint
+        self.recent = deque(maxlen=RECENT_TRACES)
+        self._local = threading.local()
+        # Open stage spans by (pipeline, stage), the parent for requests made on worker threads (see bind_stage).
+        self._open_stages = {}
+        self._exports = []
+        self._lock = threading.Lock()
+
+    def _stack(self) -> list:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _parent(self):
+        stack = self._stack()
+        if stack:
+            return stack[-1]
+        with self._lock:
+            return self._open_stages.get((instrumentation.current_pipeline(), instrumentation.current_stage()))
+
+    def run_started(self, pipeline: str):
+        stack = self._stack()
+        parent = stack[-1] if stack else None
+        trace = parent.trace if parent else Trace(pipeline)
+        span = Span(trace, pipeline, parent=parent, attributes={"pipeline": pipeline})
+        if parent is None:
+            trace.root = span
+        stack.append(span)
+
+    def run_finished(self, pipeline: str, seconds: float, ok: bool):
+        stack = self._stack()
+        self._end_object(stack)
+        if not stack:
+            return
+        span = stack.pop()
+        if not ok:
+            span.status = STATUS_ERROR
+        span.end()
+        if span.parent is None:
+            self.recent.append(span.trace)
+            self._export(span.trace)
+
+    def stage_started(self, pipeline: str, stage: str):
+        parent = self._parent()
+        if parent is None:
+            return
+        span = Span(parent.trace, stage, parent=parent, attributes={"pipeline": pipeline, "stage": stage})
+        self._stack().append(span)
+        with self._lock:
+            self._open_stages[(pipeline, stage)] = span
+
+    def stage_finished(self, pipeline: str, stage: str, seconds: float, objects: int):
+        stack = self._stack()
+        self._end_object(stack)
+        if not stack or stack[-1].attributes.get("stage") != stage:
+            return
+        span = stack.pop()
+        span.attributes["objects"] = objects
+        span.end()
+        with self._lock:
+            if self._open_stages.get((pipeline, stage)) is span:
+                del self._open_stages[(pipeline, stage)]
+
+    def object_started(self, pipeline: str, stage: str, key: str):
+        stack = self._stack()
+        self._end_object(stack)
+        if not stack:
+            return
+        stack.append(Span(stack[-1].trace, f"{stage} {key}", parent=stack[-1], group=f"{stage}{OBJECT_GROUP}",
+                          attributes={"stage": stage, "object.key": str(key)}))
+
+    def _end_object(self, stack: list):
+        if stack and stack[-1].group.endswith(OBJECT_GROUP):
+            stack.pop().end()
+
+    def request_finished(self, method: str, endpoint: str, status: str, seconds: float, retries: int):
+        parent = self._parent()
+        if parent is None:
+            return
+        end_ns = time.time_ns()
+        span = Span(parent.trace, f"{method} {endpoint}", parent=parent, start_ns=end_ns - int(seconds * 1e9),
+                    attributes={"http.request.method": method, "http.route": endpoint,
+                                "http.response.status_code": status, "http.retries": retries})
+        if not status.isdigit() or int(status) >= 400:
+            span.status = STATUS_ERROR
+        span.end(end_ns)
+
+    def parse_finished(self, path: str, seconds: float, items: int):
+        parent = self._parent()
+        if parent is None:
+            return
+        end_ns = time.time_ns()
+        Span(parent.trace, "yaml parse", parent=parent, start_ns=end_ns - int(seconds * 1e9),
+             attributes={"file": os.path.basename(path), "items": items}).end(end_ns)
+
+    def last_trace(self, pipeline: str | None = None):
+        for trace in reversed(self.recent):
+            if pipeline is None or trace.pipeline == pipeline:
+                return trace
+        return None
+
+    def _export(self, trace: Trace):
+        if not self.traces_file and not self.otlp_endpoint:
+            return
+        # Exported off the pipeline thread so a slow collector never delays the run's end.
+        thread = threading.Thread(target=self._write, args=(trace,), name="trace-export", daemon=True)
+        with self._lock:
+            self._exports = [t for t in self._exports if t.is_alive()] + [thread]
+        thread.start()
+
+    def flush(self, timeout: float = 10.0):
+        """Wait for pending exports, e.g. before a CLI process exits."""
+        with self._lock:
+            exports = list(self._exports)
+        for thread in exports:
+            thread.join(timeout)
+
+    def _write(self, trace: Trace):
+        payload = trace.to_otlp()
+        if self.traces_file:
+            try:
+                with open(self.traces_file, "a") as f:
+                    f.write(json.dumps(payload) + "\n")
+            except OSError:
+                pass
+        if self.otlp_endpoint:
+            import requests
+            try:
+                requests.post(self.otlp_endpoint.rstrip("/") + "/v1/traces", json=payload, timeout=10)
+            except requests.RequestException:
+                pass
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+def enable_tracing(traces_file: str | None = None, otlp_endpoint: str | None = None) -> Tracer:
+    """Start recording traces (once per process); the file and collector default to $TRACES_FILE and $OTEL_EXPORTER_OTLP_ENDPOINT."""
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer(traces_file or os.environ.get(TRACES_FILE_ENV),
+                             otlp_endpoint or os.environ.get(OTLP_ENDPOINT_ENV))
+            instrumentation.add_listener(_tracer)
+        return _tracer
+
+def flush(timeout: float = 10.0):
+    if _tracer:
+        _tracer.flush(timeout)
+
+def last_trace(pipeline: str | None = None):
+    """The most recent finished trace (optionally of one pipeline), or None when tracing is off."""
+    return _tracer.last_trace(pipeline) if _tracer else None
@@ -0,0 +1,327 @@
+# validation.py
+import ipaddress
+import os
+from logger import console
+from loader import discover_shards, iter_shard_items
+
+# Statuses Nautobot creates on install; objects may reference them without listing them in statuses.yml.
+BUILTIN_STATUSES = {
+    "Active", "Available", "Connected", "Decommissioning", "Deprecated", "Failed", "Inventory",
+    "Maintenance", "Offline", "Planned", "Reserved", "Retired", "Staged",
+}
+
+PREFIX_TYPES = {"network", "container", "pool"}
+IP_ADDRESS_TYPES = {"host", "dhcp", "slaac"}
+
+IP_ADDRESS_SCHEMA = {
+    "address": {"type": str, "required": True, "format": "ip_interface"},
+    "namespace": {"type": str, "required": True},
+    "type": {"type": str, "required": True, "choices": IP_ADDRESS_TYPES},
+    "status": {"type": str, "required": True, "ref": "statuses.yml"},
+}
+
+INTERFACE_SCHEMA = {
+    "name": {"type": str, "required": True},
+    "status": {"type": str, "required": True, "ref": "statuses.yml"},
+    "type": {"type": str, "required": True},
+    "mgmt_only": {"type": bool},
+    "ip-address": {"type": list, "items": IP_ADDRESS_SCHEMA, "unique": "address"},
+}
+
+INTERFACE_TEMPLATE_SCHEMA = {
+    "name": {"type": str, "required": True},
+    "type": {"type": str},
+    "mgmt_only": {"type": bool},
+}
+
+# Files are validated in this order; every reference points at a file listed before it,
+# so references can be resolved during the single pass.
+SCHEMAS = {
+    "statuses.yml": {"key": "name", "fields": {
+        "name": {"type": str, "required": True},
+        "content_types": {"type": list},
+        "color": {"type": str},
+    }},
+    "roles.yml": {"key": "name", "fields": {
+        "name": {"type": str, "required": True},
+        "content_types": {"type": list},
+        "color": {"type": str},
+    }},
+    "manufacturers.yml": {"key": "name", "fields": {
+        "name": {"type": str, "required": True},
+    }},
+    "location_types.yml": {"key": "name", "fields": {
+        "name": {"type": str, "required": True},
+        "content_types": {"type": list},
+    }},
+    "locations.yml": {"key": "name", "fields": {
+        "name": {"type": str, "required": True},
+        "location_type": {"type": str, "required": True, "ref": "location_types.yml"},
+        "status": {"type": str, "ref": "statuses.yml"},
+    }},
+    "device_types.yml": {"key": "model", "fields": {
+        "model": {"type": str, "required": True},
+        "manufacturer": {"type": str, "required": True, "ref": "manufacturers.yml"},
+        "u_height": {"type": int, "required": True},
+    }},
+    "interface_templates.yml": {"key": None, "by_ref": "device_types.yml", "items": INTERFACE_TEMPLATE_SCHEMA},
+    "prefixes.yml": {"key": "prefix", "fields": {
+        "prefix": {"type": str, "required": True, "format": "ip_network"},
+        "namespace": {"type": str, "required": True},
+        "type": {"type": str, "required": True, "choices": PREFIX_TYPES},
+        "status": {"type": str, "required": True, "ref": "statuses.yml"},
+    }},
+    "devices.yml": {"key": "name", "fields": {
+        "name": {"type": str, "required": True},
+        "role": {"type": str, "required": True, "ref": "roles.yml"},
+        "status": {"type": str, "required": True, "ref": "statuses.yml"},
+        "location": {"type": str, "required": True, "ref": "locations.yml"},
+        "device-type": {"type": str, "required": True, "ref": "device_types.yml"},
+        "primary_ip4": {"type": str, "format": "ip_interface"},
+        "interfaces": {"type": list, "items": INTERFACE_SCHEMA, "unique": "name"},
+    }},
+}
+
+REF_LABELS = {
+    "statuses.yml": "status",
+    "roles.yml": "role",
+    "manufacturers.yml": "manufacturer",
+    "location_types.yml": "location type",
+    "locations.yml": "location",
+    "device_types.yml": "device type",
+}
+
+# Endpoints of the referenced types, to resolve references to objects that exist in Nautobot only.
+REF_ENDPOINTS = {
+    "statuses.yml": "/api/extras/statuses/",
+    "roles.yml": "/api/extras/roles/",
+    "manufacturers.yml": "/api/dcim/manufacturers/",
+    "location_types.yml": "/api/dcim/location-types/",
+    "locations.yml": "/api/dcim/locations/",
+    "device_types.yml": "/api/dcim/device-types/",
+}
+
+_FORMATS = {
+    "ip_interface": lambda value: ipaddress.ip_interface(value),
+    "ip_network": lambda value: ipaddress.ip_network(value, strict=False),
+}
+
+def _type_name(expected) -> str:
+    return {str: "a string", int: "an integer", bool: "a boolean", list: "a list", dict: "a mapping"}[expected]
+
+def _compile_fields(fields: dict):
+    """
+    Turn a field schema into a single check function, so the per-object work is a flat
+    loop over prebuilt closures instead of re-interpreting the schema for every object.
+    """
+    checks = []
+    for name, rule in fields.items():
+        expected = rule["type"]
+        if rule.get("required"):
+            checks.append(_required_check(name))
+        checks.append(_type_check(name, expected))
+        if "choices" in rule:
+            checks.append(_choices_check(name, rule["choices"]))
+        if "format" in rule:
+            checks.append(_format_check(name, rule["format"]))
+        if "ref" in rule:
+            checks.append(_ref_check(name, rule["ref"]))
+        if "items" in rule:
+            checks.append(_items_check(name, _compile_fields(rule["items"]), rule.get("unique")))
+
+    def check(obj: dict, path: str, refs: dict, errors: list):
+        for field_check in checks:
+            field_check(obj, path, refs, errors)
+    return check
+
+def _required_check(name):
+    def check(obj, path, refs, errors):
+        if obj.get(name) in (None, ""):
+            errors.append(f"{path}: missing required field '{name}'")
+    return check
+
+def _type_check(name, expected):
+    def check(obj, path, refs, errors):
+        value = obj.get(name)
+        # bool is a subclass of int; reject it where an integer is expected.
+        if value is not None and (not isinstance(value, expected) or (expected is int and isinstance(value, bool))):
+            errors.append(f"{path}: field '{name}' must be {_type_name(expected)}, got {type(value).__name__}")
+    return check
+
+def _choices_check(name, choices):
+    def check(obj, path, refs, errors):
+        value = obj.get(name)
+        if isinstance(value, str) and value.lower() not in choices:
+            errors.append(f"{path}: field '{name}' has invalid value '{value}' (expected one of {', '.join(sorted(choices))})")
+    return check
+
+def _format_check(name, fmt):
+    parse = _FORMATS[fmt]
+
+    def check(obj, path, refs, errors):
+        value = obj.get(name)
+        if isinstance(value, str):
+            try:
+                parse(value)
+            except ValueError:
+                errors.append(f"{path}: field '{name}' is not a valid {fmt.replace('_', ' ')}: '{value}'")
+    return check
+
+def _ref_check(name, target):
+    def check(obj, path, refs, errors):
+        value = obj.get(name)
+        if isinstance(value, str) and not refs.resolves(target, value):
+            errors.append(f"{path}: '{name}' references unknown {REF_LABELS[target]} '{value}'")
+    return check
+
+def _items_check(name, item_check, unique):
+    def check(obj, path, refs, errors):
+        items = obj.get(name)
+        if not isinstance(items, list):
+            return
+        seen = set()
+        for index, item in enumerate(items):
+            item_path = f"{path}.{name}[{index}]"
+            if not isinstance(item, dict):
+                errors.append(f"{item_path}: must be a mapping")
+                continue
+            item_check(item, item_path, refs, errors)
+            if unique and item.get(unique) is not None:
+                if item[unique] in seen:
+                    errors.append(f"{item_path}: duplicate {unique} '{item[unique]}'")
+                seen.add(item[unique])
+    return check
+
+class _References:
+    """
+    The keys defined by each file validated so far. A key missing from git is looked up with
+    ``known(filename)``, called once per file and only when needed.
+    """
+
+    def __init__(self, known=None):
+        self.defined = {}
+        self._known = known
+        self._outside = {}
+
+    def resolves(self, target: str, value: str) -> bool:
+        defined = self.defined.get(target)
+        # Without the referenced file, the objects may live in Nautobot alone.
+        if defined is None or value in defined:
+            return True
+        if self._known is None:
+            return False
+        if target not in self._outside:
+            self._outside[target] = set(self._known(target))
+        return value in self._outside[target]
+
+def nautobot_keys(snapshot):
+    """``known`` for validate_repo: the keys of a referenced type in Nautobot, from the snapshot (snapshot.py)."""
+    def known(filename: str) -> set:
+        try:
+            return set(snapshot.lookup(REF_ENDPOINTS[filename]))
+        except Exception as e:
+            console.log(f"Error retrieving {REF_LABELS[filename]} names from Nautobot: {e}", style="warning")
+            return set()
+    return known
+
+# Compiled once at import time.
+VALIDATORS = {
+    filename: _compile_fields(schema["items"] if "by_ref" in schema else schema["fields"])
+    for filename, schema in SCHEMAS.items()
+}
+
+def validate_repo(repo_dir: str, known: dict | None = None, cache=None, tracker=None) -> list:
+    """
+    Validate every object file below ``repo_dir`` in one pass and return all errors found.
+
+    Each object is checked against its compiled schema, and references (a device's role,
+    location, device-type, statuses, ...) must name an object defined in the referenced
+    file. References are only checked when that file exists, since the objects may then
+    live in Nautobot alone; a name missing from the file is also accepted when
+    ``known(filename)`` lists it, e.g. ``nautobot_keys(snapshot)`` for objects that exist
+    in Nautobot only. A file that cannot be parsed is a validation error too. An optional
+    loader.ParseCache lets the passes over one clone share parsed files.
+
+    With a loader.ShardTracker (incremental deploys, checks), only the shards changed since
+    they were last recorded are parsed and checked; the keys the tracker holds for the
+    unchanged ones still resolve references and count for duplicates. Shards with errors
+    are rejected in the tracker, so they are never recorded and are checked again next time.
+    """
+    errors = []
+    refs = _References(known)
+
+    def parse_error(shard: str, error: Exception):
+        errors.append(f"{os.path.relpath(shard, repo_dir)}: cannot be parsed: {error}")
+        if tracker is not None:
+            tracker.reject(filename, shard)
+
+    for filename, schema in SCHEMAS.items():
+        shards = discover_shards(repo_dir, filename)
+        if not shards:
+            continue
+        check = VALIDATORS[filename]
+        key_field = schema["key"]
+        keys = {}
+        if tracker is not None:
+            shards, known_keys = tracker.select(filename, shards)
+            keys = {key: os.path.relpath(shard, repo_dir) for key, shard in known_keys.items() if isinstance(key, str)}
+        index_by_shard = {}
+        for shard, obj in iter_shard_items(shards, root=repo_dir, cache=cache, on_error=parse_error):
+            errors_before = len(errors)
+            try:
+                index = index_by_shard.get(shard, 0)
+                index_by_shard[shard] = index + 1
+                path = f"{os.path.relpath(shard, repo_dir)}[{index}]"
+                if not isinstance(obj, dict):
+                    errors.append(f"{path}: must be a mapping")
+                    continue
+                if "by_ref" in schema:
+                    _check_grouped(obj, path, schema["by_ref"], check, refs, errors)
+                    continue
+                key = obj.get(key_field)
+                if isinstance(key, str):
+                    path = f"{path} ({key_field}={key})"
+                    if key in keys:
+                        errors.append(f"{path}: duplicate {key_field} (already defined at {keys[key]})")
+                    else:
+                        keys[key] = path
+                check(obj, path, refs, errors)
+                if filename == "devices.yml":
+                    _check_primary_ip(obj, path, errors)
+            finally:
+                if tracker is not None and len(errors) > errors_before:
+                    tracker.reject(filename, shard)
+        if key_field:
+            refs.defined[filename] = set(keys)
+            if filename == "statuses.yml":
+                refs.defined[filename] |= BUILTIN_STATUSES
+    return errors
+
+def _check_grouped(obj, path, target, check, refs, errors):
+    # interface_templates.yml entries map one device type to a list of templates.
+    if len(obj) != 1:
+        errors.append(f"{path}: must map exactly one device type to its interface templates")
+        return
+    device_type, templates = next(iter(obj.items()))
+    if not refs.resolves(target, device_type):
+        errors.append(f"{path}: references unknown {REF_LABELS[target]} '{device_type}'")
+    if not isinstance(templates, list):
+        errors.append(f"{path}: interface templates for '{device_type}' must be a list")
+        return
+    for index, template in enumerate(templates):
+        if not isinstance(template, dict):
+            errors.append(f"{path}[{index}]: must be a mapping")
+            continue
+        check(template, f"{path}[{index}]", refs, errors)
+
+def _check_primary_ip(obj, path, errors):
+    primary = obj.get("primary_ip4")
+    if not isinstance(primary, str):
+        return
+    addresses = {
+        ip.get("address")
+        for iface in obj.get("interfaces") or [] if isinstance(iface, dict)
+        for ip in iface.get("ip-address") or [] if isinstance(ip, dict)
+    }
+    if primary not in addresses:
+        errors.append(f"{path}: primary_ip4 '{primary}' is not assigned to any of its interfaces")
@@ -0,0 +1,329 @@
+# watch.py
+"""
+Watch mode: reconcile Nautobot with the repository continuously instead of on request.
+
+The repository's HEAD is polled with ``git ls-remote`` every ``interval`` seconds plus a
+random jitter of up to ``jitter`` seconds (so many watchers do not poll in step), or right
+away when the webhook receiver gets a push notification. Bursts of commits are debounced:
+a new HEAD is applied once it has not moved for ``debounce`` seconds, or ``max_wait``
+seconds after the target first fell behind, whichever comes first. Each apply is an
+incremental deploy, so only the shards changed since the last applied commit are
+validated, read and compared (see ShardTracker). A commit counts as applied only when its deploy logs no
+errors; otherwise it is applied again after the next poll, which only re-reads the files
+that failed. Up to ``max_concurrency`` targets are reconciled at once.
+
+Between commits, ``drift_interval`` optionally runs a check of each up-to-date target and
+reports objects missing from Nautobot or whose compared fields differ there, e.g. deleted
+or edited by hand; the next commit (or a deploy) restores missing objects and device
+fields. The status of each target (last applied SHA, lag, duration, drift)
+is kept in the state directory and served as JSON on ``/status``.
+"""
+import json
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logger import console
+from instrumentation import notify
+from state import load_json, save_json, state_key, state_path
+
+DEFAULT_INTERVAL = 60
+DEFAULT_JITTER = 10
+DEFAULT_DEBOUNCE = 30
+DEFAULT_MAX_WAIT = 300
+DEFAULT_MAX_CONCURRENCY = 2
+# Webhook notifications closer together than this are folded into one poll.
+MIN_POLL_SECONDS = 2
+# A commit whose apply failed is only retried after this long (or when a newer commit arrives).
+RETRY_SECONDS = 600
+TICK_SECONDS = 0.2
+
+class WatchTarget:
+    """One Nautobot kept in sync with one directory of the repository."""
+
+    def __init__(self, name: str, nautobot_url: str, nautobot_token: str, subdirectory: str, git_repo_url: str):
+        self.name = name
+        self.nautobot_url = nautobot_url
+        self.nautobot_token = nautobot_token
+        self.subdirectory = subdirectory
+        self.state_file = state_path("watch", state_key(nautobot_url, git_repo_url, subdirectory) + ".json")
+        state = load_json(self.state_file, {}) or {}
+        self.applied_sha = state.get("applied_sha")
+        self.applied_at = state.get("applied_at")
+        self.duration = state.get("duration")
+        self.lag = state.get("lag")
+        self.ok = state.get("ok")
+        self.drift = state.get("drift")
+        self.drift_checked_at = state.get("drift_checked_at")
+        # Unix time the target was first seen behind HEAD, None while up to date.
+        self.behind_since = None
+        self.failed_sha = None
+        self.failed_at = 0.0
+        # Whether the failed commit was deployed with errors, and is retried after the next poll.
+        self.retry_on_poll = False
+        self.busy = False
+
+    def status(self, now: float) -> dict:
+        return {
+            "nautobot_url": self.nautobot_url,
+            "subdirectory": self.subdirectory,
+            "applied_sha": self.applied_sha,
+            "applied_at": self.applied_at,
+            "duration": self.duration,
+            "lag": self.lag,
+            "ok": self.ok,
+            "behind_seconds": round(now - self.behind_since, 1) if self.behind_since is not None else 0,
+            "reconciling": self.busy,
+            "drift": self.drift,
+            "drift_checked_at": self.drift_checked_at,
+        }
+
+    def save(self):
+        save_json(self.state_file, {
+            "applied_sha": self.applied_sha, "applied_at": self.applied_at, "duration": self.duration,
+            "lag": self.lag, "ok": self.ok, "drift": self.drift, "drift_checked_at": self.drift_checked_at,
+        })
+
+class Watcher:
+    def __init__(self, git_repo_url: str, targets: list, username: str = None, token: str = None,
+                 interval: float = DEFAULT_INTERVAL, jitter: float = DEFAULT_JITTER, debounce: float = DEFAULT_DEBOUNCE,
+                 max_wait: float = DEFAULT_MAX_WAIT, max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 drift_interval: float | None = None):
+        self.git_repo_url = git_repo_url
+        self.targets = targets
+        self.username = username
+        self.token = token
+        self.interval = interval
+        self.jitter = jitter
+        self.debounce = debounce
+        self.max_wait = max(max_wait, debounce)
+        self.max_concurrency = max(max_concurrency, 1)
+        self.drift_interval = drift_interval
+        self.head = None
+        # Unix time HEAD last moved, for the debounce.
+        self.head_changed_at = None
+        self.last_poll = None
+        self._nudge = threading.Event()
+        self._stop = threading.Event()
+        self._messages = queue.Queue()
+        self._lock = threading.Lock()
+
+    @property
+    def _authenticated_url(self) -> str:
+        if self.username and self.token:
+            for scheme in ("https://", "http://"):
+                if self.git_repo_url.startswith(scheme):
+                    return self.git_repo_url.replace(scheme, f"{scheme}{self.username}:{self.token}@", 1)
+        return self.git_repo_url
+
+    def nudge(self):
+        """Poll as soon as possible (a push notification arrived)."""
+        self._nudge.set()
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self) -> dict:
+        now = time.time()
+        with self._lock:
+            return {
+                "repo": self.git_repo_url,
+                "head": self.head,
+                "last_poll": self.last_poll,
+                "targets": {target.name: target.status(now) for target in self.targets},
+            }
+
+    def poll(self) -> str | None:
+        """The repository's HEAD commit, or None if it could not be read."""
+        import git
+        self.last_poll = time.time()
+        try:
+            output = git.cmd.Git().ls_remote(self._authenticated_url, "HEAD")
+        except Exception as e:
+            console.log(f"Error polling repository: {str(e).replace(self._authenticated_url, self.git_repo_url)}", style="error")
+            return None
+        sha = output.split()[0] if output.strip() else None
+        if sha and sha != self.head:
+            console.log(f"Repository HEAD is now {sha[:12]}.", style="info")
+            with self._lock:
+                self.head, self.head_changed_at = sha, time.time()
+        return sha
+
+    def run(self, once: bool = False):
+        """
+        Reconcile until stop() is called. With ``once``, poll a single time, apply HEAD to
+        every target that is behind without waiting for the debounce, and return.
+        """
+        console.log(f"Watching {self.git_repo_url} for {len(self.targets)} target(s): every {self.interval}s "
+                    f"(+{self.jitter}s jitter), {self.debounce}s debounce, {self.max_concurrency} at a time.", style="info")
+        futures = set()
+        next_poll = last_poll = 0.0
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="watch") as executor:
+            try:
+                while not self._stop.is_set():
+                    now = time.monotonic()
+                    if now >= next_poll or (self._nudge.is_set() and now - last_poll >= MIN_POLL_SECONDS):
+                        self._nudge.clear()
+                        self.poll()
+                        last_poll = time.monotonic()
+                        next_poll = last_poll + self.interval + random.uniform(0, self.jitter)
+                    futures.update(self._schedule(executor, force=once))
+                    futures = {future for future in futures if not future.done()}
+                    self._drain()
+                    if once and not futures:
+                        break
+                    self._stop.wait(TICK_SECONDS)
+            finally:
+                self._stop.set()
+                executor.shutdown(wait=True)
+                self._drain()
+
+    def _schedule(self, executor: ThreadPoolExecutor, force: bool = False) -> list:
+        """Submit the reconciles and drift checks that are due."""
+        now = time.time()
+        submitted = []
+        with self._lock:
+            head, head_changed_at = self.head, self.head_changed_at
+            if head is None:
+                return submitted
+            idle = [target for target in self.targets if not target.busy]
+            slots = self.max_concurrency - (len(self.targets) - len(idle))
+            for target in idle:
+                if slots <= 0:
+                    break
+                if target.applied_sha == head:
+                    target.behind_since = None
+                    if self.drift_interval and now - (target.drift_checked_at or 0) >= self.drift_interval:
+                        target.busy = True
+                        submitted.append(executor.submit(self._check_drift, target))
+                        slots -= 1
+                    continue
+                if target.behind_since is None:
+                    target.behind_since = head_changed_at if target.applied_sha else now
+                settled = now - head_changed_at >= self.debounce
+                overdue = now - target.behind_since >= self.max_wait
+                retry_ok = (target.failed_sha != head or now - target.failed_at >= RETRY_SECONDS
+                            or (target.retry_on_poll and (self.last_poll or 0) > target.failed_at))
+                if (force or settled or overdue) and retry_ok:
+                    target.busy = True
+                    submitted.append(executor.submit(self._reconcile, target, head))
+                    slots -= 1
+        return submitted
+
+    def _reconcile(self, target: WatchTarget, head: str):
+        from deploy import sync_all_objects_from_git
+        self._messages.put((target.name, f"Applying {head[:12]} (last applied {(target.applied_sha or 'none')[:12]}).", "info"))
+        start = time.perf_counter()
+        errors, applied = self._capture(target, lambda: sync_all_objects_from_git(
+            target.nautobot_token, self.git_repo_url, target.subdirectory, target.nautobot_url,
+            username=self.username, token=self.token, incremental=True))
+        seconds = time.perf_counter() - start
+        now = time.time()
+        with self._lock:
+            target.busy = False
+            target.duration = round(seconds, 2)
+            target.ok = applied is not None and not errors
+            if not target.ok:
+                # Objects that failed are not recorded as applied, so retrying only redoes them.
+                target.failed_sha, target.failed_at, target.retry_on_poll = head, now, applied is not None
+            else:
+                # The clone may hold a newer commit than the polled one; what matters is what was deployed.
+                target.lag = round(now - (target.behind_since or now), 2)
+                target.applied_sha, target.applied_at = applied, now
+                target.behind_since = None
+                target.failed_sha, target.retry_on_poll = None, False
+            target.save()
+            lag = target.lag
+        notify("watch_reconciled", target.name, seconds, lag or 0.0, target.ok)
+        if applied is None:
+            self._messages.put((target.name, f"Could not apply {head[:12]}; retrying in {RETRY_SECONDS}s or on the next commit.", "error"))
+        elif errors:
+            self._messages.put((target.name, f"Deployed {applied[:12]} in {seconds:.1f}s with {len(errors)} error(s); "
+                                             "retrying after the next poll.", "warning"))
+        else:
+            self._messages.put((target.name, f"Applied {applied[:12]} in {seconds:.1f}s.", "info"))
+
+    def _check_drift(self, target: WatchTarget):
+        from sync import compare_objects
+        errors, result = self._capture(target, lambda: compare_objects(
+            target.nautobot_token, self.git_repo_url, target.subdirectory, target.nautobot_url,
+            username=self.username, token=self.token))
+        missing = None
+        if result is not None:
+            missing = {object_type: len(keys) for object_type, keys in result["compare_results"].items() if keys}
+        with self._lock:
+            target.busy = False
+            target.drift_checked_at = time.time()
+            if missing is not None:
+                target.drift = missing
+            target.save()
+        if missing is None:
+            return
+        notify("drift_checked", target.name, sum(missing.values()))
+        if missing:
+            summary = ", ".join(f"{count} {object_type}" for object_type, count in sorted(missing.items()))
+            self._messages.put((target.name, f"Drift: objects missing from or differing in Nautobot ({summary}); "
+                                             "the next deploy restores missing objects and device fields.", "warning"))
+
+    def _capture(self, target: WatchTarget, function) -> tuple:
+        """Run ``function`` with its messages queued for the watch loop; returns its errors and result."""
+        errors = []
+
+        def sink(message: str, style: str | None):
+            if style == "error":
+                errors.append(message)
+            self._messages.put((target.name, message, style))
+
+        result = None
+        with console.redirect(sink):
+            try:
+                result = function()
+            except Exception as e:
+                console.log(f"Unhandled error: {e}", style="error")
+        return errors, result
+
+    def _drain(self):
+        # Worker threads only queue their messages; they are logged here, from the watch loop's thread.
+        while True:
+            try:
+                name, message, style = self._messages.get_nowait()
+            except queue.Empty:
+                return
+            console.log(f"[{name}] {message}", style=style)
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, data):
+        body = json.dumps(data, indent=2).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/status", "/"):
+            self.send_error(404)
+            return
+        self._send_json(200, self.server.watcher.status())
+
+    def do_POST(self):
+        if self.path.split("?")[0] != "/hook":
+            self.send_error(404)
+            return
+        # The payload (GitHub, GitLab, Gitea...) is not needed: any push only triggers a poll.
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self.server.watcher.nudge()
+        self._send_json(202, {"queued": True})
+
+def start_webhook_server(watcher: Watcher, port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve push notifications on ``POST /hook`` and the watcher's status on ``GET /status``."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.watcher = watcher
+    threading.Thread(target=server.serve_forever, name="watch-webhook", daemon=True).start()
+    return server
@@ -0,0 +1,157 @@
+# writebehind.py
+"""
+Write-behind queue turning per-object creates into bulk POSTs.
+
+``writes.create(endpoint, payload)`` queues the object and returns a future for the
+created object (``future.result()["id"]``). An endpoint's queue is sent as one bulk POST
+once it holds ``max_batch`` objects or its oldest object has waited ``max_delay`` seconds,
+when ``flush()`` is called or the queue is closed, and as soon as a caller asks for the
+result of a queued create, since it needs the id now. Nautobot creates a bulk POST
+atomically; when one fails, its objects are retried one by one so only the invalid ones
+fail. Used as a context manager, the queue is closed (flushed) when the block finishes and
+discarded when it raises, e.g. when the job is cancelled.
+"""
+import threading
+import time
+from concurrent.futures import Future
+from instrumentation import bind_stage
+
+DEFAULT_MAX_BATCH = 100
+DEFAULT_MAX_DELAY = 0.5
+
+class PendingCreate(Future):
+    """Future of a queued create; asking for its result sends its queue right away."""
+
+    def __init__(self, queue: "WriteBehind", endpoint: str):
+        super().__init__()
+        self._queue = queue
+        self._endpoint = endpoint
+
+    def result(self, timeout=None):
+        if not self.done():
+            self._queue.flush(self._endpoint)
+        return super().result(timeout)
+
+    def exception(self, timeout=None):
+        if not self.done():
+            self._queue.flush(self._endpoint)
+        return super().exception(timeout)
+
+class WriteBehind:
+    def __init__(self, nautobot_client, max_batch: int = DEFAULT_MAX_BATCH, max_delay: float = DEFAULT_MAX_DELAY):
+        self.client = nautobot_client
+        self.max_batch = max(max_batch, 1)
+        self.max_delay = max_delay
+        self.batches = self.objects = 0
+        # endpoint -> {"items": [(payload, future)], "since": monotonic time of the oldest, "send": stage-bound sender}
+        self._queues = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._closed = False
+        self._timer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def create(self, endpoint: str, payload: dict) -> PendingCreate:
+        future = PendingCreate(self, endpoint)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("write-behind queue is closed")
+            queue = self._queues.get(endpoint)
+            if queue is None:
+                # Sends are attributed to the stage that queued the first object, whichever thread flushes.
+                queue = self._queues[endpoint] = {"items": [], "since": time.monotonic(), "send": bind_stage(self._send)}
+            queue["items"].append((payload, future))
+            full = len(queue["items"]) >= self.max_batch
+            if self._timer is None and self.max_delay is not None:
+                self._timer = threading.Thread(target=self._run_timer, name="write-behind", daemon=True)
+                self._timer.start()
+            self._wakeup.notify()
+        if full:
+            self.flush(endpoint)
+        return future
+
+    def flush(self, endpoint: str | None = None):
+        """Send the queued creates of ``endpoint`` (all endpoints by default) and wait for them."""
+        with self._lock:
+            names = [endpoint] if endpoint is not None else list(self._queues)
+            queues = [(name, self._queues.pop(name)) for name in names if name in self._queues]
+        for name, queue in queues:
+            items = queue["items"]
+            for start in range(0, len(items), self.max_batch):
+                queue["send"](name, items[start:start + self.max_batch])
+
+    def close(self):
+        """Flush everything and stop the timer."""
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+        self.flush()
+        if self._timer is not None:
+            self._timer.join()
+
+    def discard(self):
+        """Drop the queued creates without sending them, cancelling their futures, and stop the timer."""
+        with self._lock:
+            self._closed = True
+            queues, self._queues = self._queues, {}
+            self._wakeup.notify()
+        for queue in queues.values():
+            for _, future in queue["items"]:
+                future.cancel()
+        if self._timer is not None:
+            self._timer.join()
+
+    def _run_timer(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+                now = time.monotonic()
+                due = [name for name, queue in self._queues.items() if now - queue["since"] >= self.max_delay]
+                if not due:
+                    oldest = min((queue["since"] for queue in self._queues.values()), default=None)
+                    self._wakeup.wait(self.max_delay if oldest is None else oldest + self.max_delay - now)
+                    continue
+            for name in due:
+                self.flush(name)
+
+    def _send(self, endpoint: str, items: list):
+        with self._lock:
+            self.batches += 1
+            self.objects += len(items)
+        if len(items) == 1:
+            self._send_one(endpoint, *items[0])
+            return
+        try:
+            results = self.client.http_call(method="post", url=endpoint, json_data=[payload for payload, _ in items])
+        except Exception as e:
+            # Only a rejected batch is known not to be applied; after a timeout, retrying could create duplicates.
+            if getattr(e, "status_code", None) != 400:
+                for _, future in items:
+                    future.set_exception(e)
+                return
+            for payload, future in items:
+                self._send_one(endpoint, payload, future)
+            return
+        if not isinstance(results, list) or len(results) != len(items):
+            error = ValueError(f"bulk create on {endpoint} returned {len(results) if isinstance(results, list) else 'no'} "
+                               f"object(s) for {len(items)}")
+            for _, future in items:
+                future.set_exception(error)
+            return
+        for (_, future), result in zip(items, results):
+            future.set_result(result)
+
+    def _send_one(self, endpoint: str, payload: dict, future: Future):
+        try:
+            future.set_result(self.client.http_call(method="post", url=endpoint, json_data=payload))
+        except Exception as e:
+            future.set_exception(e)
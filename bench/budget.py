@@ -0,0 +1,202 @@
+# budget.py
+"""
+API-call budgets: fail when a pipeline makes more requests than allowed for its input size.
+
+    python bench/budget.py --sizes 50,500
+
+Each scenario runs against the fake Nautobot server with generated repositories of every
+size. Requests are counted by the client per stage and method (NautobotClient.stats) and
+each count must stay within ``fixed + per_object * objects``, where ``objects`` is the
+number of objects the stage handles (devices for ``devices.yml``). A per_object of 0 means
+the stage must make the same number of requests whatever the input size, so N+1 patterns
+show up as soon as they appear. Requests in a stage or method without a budget also fail.
+Exits with 1 on any violation; used as a CI gate.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "app"))
+
+from fake_nautobot import FakeNautobot
+from generate import DEVICE_TYPES, DEVICES_PER_LOCATION, MANUFACTURERS, ROLES, SUBDIRECTORY, TEMPLATES_PER_TYPE, generate
+
+TOKEN = "0123456789abcdef0123456789abcdef01234567"
+
+# Creates queued on a write-behind queue: one bulk POST per 100 objects.
+BULK_POST = (1, 0.01)
+
+# {scenario: {stage: {method: (fixed, per_object)}}}. Lower these as request patterns improve; never raise them
+# to make a change pass without a reason in the commit message.
+BUDGETS = {
+    "deploy": {
+        # The snapshot starts empty: each type is listed once, then lookups are answered locally. Only
+        # namespaces are first needed here.
+        "lookups": {"GET": (1, 0)},
+        "roles.yml": {"GET": (1, 0), "POST": BULK_POST},
+        "manufacturers.yml": {"GET": (1, 0), "POST": BULK_POST},
+        "location_types.yml": {"GET": (1, 0), "POST": BULK_POST},
+        "statuses.yml": {"GET": (1, 0), "POST": BULK_POST},
+        "prefixes.yml": {"GET": (1, 0), "POST": BULK_POST},
+        "device_types.yml": {"GET": (1, 0), "POST": BULK_POST},
+        # One listing of the existing templates, whatever the number of templates.
+        "interface_templates.yml": {"GET": (1, 0), "POST": BULK_POST},
+        "locations.yml": {"GET": (1, 0), "POST": BULK_POST},
+        # The device list and the IP address index, then the existing interfaces of 100 devices per request. POSTs
+        # per device: the device itself; its interfaces go out in bulk with those of the other 99 devices of its
+        # batch, and IP addresses, then their mappings, are created in bulk for the file.
+        "devices.yml": {"GET": (3, 0.01), "POST": (2, 1.06), "PATCH": (0, 1)},
+    },
+    "redeploy": {
+        # Incremental snapshot refreshes: the objects changed since the last run, then the count that reveals
+        # deletions. Two small GETs instead of one full list.
+        "lookups": {"GET": (2, 0)},
+        "roles.yml": {"GET": (2, 0)},
+        "manufacturers.yml": {"GET": (2, 0)},
+        "location_types.yml": {"GET": (2, 0)},
+        "statuses.yml": {"GET": (2, 0)},
+        "prefixes.yml": {"GET": (2, 0)},
+        "device_types.yml": {"GET": (2, 0)},
+        "interface_templates.yml": {"GET": (1, 0)},
+        "locations.yml": {"GET": (2, 0)},
+        # Devices and IP addresses refreshed incrementally, the existing interfaces of 100 devices per request, and
+        # the existing mappings of 100 interfaces per request.
+        "devices.yml": {"GET": (6, 0.02)},
+    },
+    "check": {
+        # Incremental snapshot refreshes, as in redeploy.
+        "manufacturers.yml": {"GET": (2, 0)},
+        "device_types.yml": {"GET": (2, 0)},
+        "roles.yml": {"GET": (2, 0)},
+        "locations.yml": {"GET": (2, 0)},
+        "location_types.yml": {"GET": (2, 0)},
+        "statuses.yml": {"GET": (2, 0)},
+        # Prefixes compare their namespace, so namespaces are refreshed too.
+        "prefixes.yml": {"GET": (4, 0)},
+        "devices.yml": {"GET": (2, 0)},
+    },
+    "export": {
+        # Every type is listed once, page by page.
+        "lookups": {"GET": (1, 0)},
+        "statuses.yml": {"GET": (1, 0)},
+        "roles.yml": {"GET": (1, 0)},
+        "manufacturers.yml": {"GET": (1, 0)},
+        "location_types.yml": {"GET": (1, 0)},
+        "device_types.yml": {"GET": (1, 0)},
+        "interface_templates.yml": {"GET": (1, 0)},
+        "locations.yml": {"GET": (1, 0)},
+        "prefixes.yml": {"GET": (1, 0)},
+        # Per 50 devices: their interfaces, the IP mappings of those interfaces (100 per request) and the IPs.
+        "devices.yml": {"GET": (2, 0.1)},
+    },
+}
+
+# Stage of the export requests, by path.
+EXPORT_STAGES = {
+    "/api/ipam/namespaces/": "lookups",
+    "/api/extras/statuses/": "statuses.yml",
+    "/api/extras/roles/": "roles.yml",
+    "/api/dcim/manufacturers/": "manufacturers.yml",
+    "/api/dcim/location-types/": "location_types.yml",
+    "/api/dcim/device-types/": "device_types.yml",
+    "/api/dcim/interface-templates/": "interface_templates.yml",
+    "/api/dcim/locations/": "locations.yml",
+    "/api/ipam/prefixes/": "prefixes.yml",
+    "/api/dcim/devices/": "devices.yml",
+    "/api/dcim/interfaces/": "devices.yml",
+    "/api/ipam/ip-address-to-interface/": "devices.yml",
+    "/api/ipam/ip-addresses/": "devices.yml",
+}
+
+def stage_objects(devices: int) -> dict:
+    """Objects handled by each stage for a repository generated with ``devices`` devices."""
+    return {
+        "roles.yml": len(ROLES),
+        "manufacturers.yml": len(MANUFACTURERS),
+        "location_types.yml": 1,
+        "statuses.yml": 1,
+        "prefixes.yml": -(-devices // 254),
+        "device_types.yml": DEVICE_TYPES,
+        "interface_templates.yml": DEVICE_TYPES * TEMPLATES_PER_TYPE,
+        "locations.yml": max(1, -(-devices // DEVICES_PER_LOCATION)),
+        "devices.yml": devices,
+    }
+
+def measure(devices: int) -> dict:
+    """Run every scenario for one size and return ``{scenario: {stage: {method: count}}}``."""
+    from logger import console
+    from nautobot_client import NautobotClient
+    from deploy import deploy_objects
+    from sync import REQUIRED_FILES, compare_objects
+    from export import export_objects
+    measured = {}
+    with tempfile.TemporaryDirectory() as temp_dir, FakeNautobot() as fake, console.redirect(lambda message, style: None):
+        # Snapshots of Nautobot (snapshot.py) start empty and are kept across the scenarios of this size.
+        os.environ["NAUTOBOT_GITOPS_STATE_DIR"] = os.path.join(temp_dir, "state")
+        repo_dir = generate(temp_dir, devices)
+        for scenario in ("deploy", "redeploy"):
+            # A client per run, as sync_all_objects_from_git does; its GET memo is run-scoped.
+            nautobot_client = NautobotClient(url=fake.url, token=TOKEN, memoize=True)
+            deploy_objects(nautobot_client, repo_dir)
+            measured[scenario] = nautobot_client.stats.summary()["by_stage"]
+        # compare_objects clones and builds its own client; its requests are read from the server instead.
+        fake.reset_stats()
+        compare_objects(TOKEN, temp_dir, SUBDIRECTORY, fake.url)
+        stages = {info["endpoint"].split("?")[0]: filename for filename, info in REQUIRED_FILES.items()}
+        stages["/api/ipam/namespaces/"] = "prefixes.yml"
+        measured["check"] = by_stage(fake.request_counts(), stages)
+        fake.reset_stats()
+        export_objects(TOKEN, os.path.join(temp_dir, "export"), fake.url)
+        measured["export"] = by_stage(fake.request_counts(), EXPORT_STAGES)
+    return measured
+
+def by_stage(request_counts: dict, stages: dict) -> dict:
+    """Requests counted by the fake server (``"METHOD /path/"``) as ``{stage: {method: count}}``, stages by path."""
+    measured = {}
+    for request, count in request_counts.items():
+        method, path = request.split(" ", 1)
+        methods = measured.setdefault(stages.get(path, path), {})
+        methods[method] = methods.get(method, 0) + count
+    return measured
+
+def check_budgets(devices: int, measured: dict) -> list:
+    objects = stage_objects(devices)
+    violations = []
+    for scenario, stages in measured.items():
+        budget = BUDGETS.get(scenario, {})
+        for stage_name, methods in stages.items():
+            for method, count in methods.items():
+                if method not in budget.get(stage_name, {}):
+                    violations.append(f"{scenario}/{stage_name}: {count} {method} request(s) without a budget")
+                    continue
+                fixed, per_object = budget[stage_name][method]
+                allowed = fixed + per_object * objects.get(stage_name, 0)
+                if count > allowed:
+                    violations.append(f"{scenario}/{stage_name}: {count} {method} request(s) for {devices} devices, "
+                                      f"budget {allowed} ({fixed} + {per_object} x {objects.get(stage_name, 0)})")
+    return violations
+
+def main():
+    parser = argparse.ArgumentParser(description="Check API-call budgets against the fake Nautobot server.")
+    parser.add_argument("--sizes", default="50,500", help="comma-separated device counts")
+    args = parser.parse_args()
+    violations = []
+    for size in (int(size) for size in args.sizes.split(",")):
+        measured = measure(size)
+        for scenario, stages in measured.items():
+            total = sum(sum(methods.values()) for methods in stages.values())
+            print(f"{size:>6} devices  {scenario:<9} {total:>7} request(s)")
+        violations.extend(check_budgets(size, measured))
+    if violations:
+        print("\nAPI-call budget exceeded:", file=sys.stderr)
+        for violation in violations:
+            print(f"  {violation}", file=sys.stderr)
+        return 1
+    print("\nAll API-call budgets met.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,398 @@
+# fake_nautobot.py
+"""
+In-process stand-in for the parts of the Nautobot REST API this tool uses, for benchmarks.
+
+Every ``/api/dcim/*``, ``/api/ipam/*`` and ``/api/extras/*`` resource is an in-memory
+collection supporting list (with limit/offset and field filters), detail, create, update
+and delete, single and bulk. Filters match plain fields, references (by id or by the
+referenced object's name/model/prefix/address), list fields such as tags,
+``cf_<name>`` custom fields and ``last_updated__gte``. Deleting a device or device type also deletes its interfaces
+or templates (and their IP mappings), like Nautobot's cascades. Each request can be
+delayed and can fail at a given rate, and requests beyond a concurrency cap are throttled
+with 429 like a rate-limited Nautobot.
+
+    python bench/fake_nautobot.py --port 8080 --latency 0.005
+"""
+import argparse
+import gzip
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+API_PATH = re.compile(r"^/api/(dcim|ipam|extras)/([\w-]+)/(?:([0-9a-f-]{36})/)?$")
+UUID_SEGMENT = re.compile(r"/[0-9a-f-]{36}/")
+# Query parameters that control the response rather than filter it.
+CONTROL_PARAMS = {"limit", "offset", "depth", "exclude_m2m", "format", "brief", "include"}
+NATURAL_KEYS = ("name", "model", "prefix", "address")
+# References whose target deletion deletes the referencing object; other references are cleared.
+CASCADES = {
+    ("interfaces", "device"),
+    ("interface-templates", "device_type"),
+    ("ip-address-to-interface", "interface"),
+    ("ip-address-to-interface", "ip_address"),
+}
+DEFAULT_PAGE_SIZE = 50
+# Timestamps are not indexed; they are only filtered by range.
+TIMESTAMP_FIELDS = ("created", "last_updated")
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+
+class Store:
+    """Objects per resource, with an inverted index of filterable values and of references."""
+
+    def __init__(self):
+        self.collections = defaultdict(dict)
+        self.index = defaultdict(set)
+        self.referrers = defaultdict(set)
+        self.resource_of = {}
+        self._terms = {}
+        self._seq = {}
+        self._counter = 0
+
+    def _index_terms(self, obj: dict) -> set:
+        terms = set()
+        for field, value in obj.items():
+            if field in TIMESTAMP_FIELDS:
+                continue
+            if isinstance(value, dict) and value.get("id"):
+                terms.add((field, value["id"]))
+                target = self.get(value["id"])
+                if target:
+                    terms.update((field, str(target[key])) for key in NATURAL_KEYS if target.get(key) is not None)
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, dict):
+                        terms.update((field, str(item[key])) for key in ("id", "name") if item.get(key))
+                    else:
+                        terms.add((field, str(item)))
+            elif field == "custom_fields" and isinstance(value, dict):
+                terms.update((f"cf_{name}", str(cf_value)) for name, cf_value in value.items())
+            elif value is not None:
+                terms.add((field, str(value).lower() if isinstance(value, bool) else str(value)))
+        return terms
+
+    def _add_terms(self, resource: str, obj: dict):
+        terms = self._index_terms(obj)
+        self._terms[obj["id"]] = terms
+        for term in terms:
+            self.index[(resource, *term)].add(obj["id"])
+        for value in obj.values():
+            if isinstance(value, dict) and value.get("id"):
+                self.referrers[value["id"]].add(obj["id"])
+
+    def _remove_terms(self, resource: str, obj: dict):
+        for term in self._terms.pop(obj["id"], ()):
+            self.index[(resource, *term)].discard(obj["id"])
+        for value in obj.values():
+            if isinstance(value, dict) and value.get("id"):
+                self.referrers[value["id"]].discard(obj["id"])
+
+    def get(self, obj_id: str):
+        resource = self.resource_of.get(obj_id)
+        return self.collections[resource].get(obj_id) if resource else None
+
+    def create(self, resource: str, data: dict, base_url: str) -> dict:
+        obj = dict(data)
+        obj["id"] = str(uuid.uuid4())
+        obj["url"] = f"{base_url}/{obj['id']}/"
+        obj["display"] = next((str(obj[key]) for key in NATURAL_KEYS if obj.get(key)), obj["id"])
+        obj["created"] = obj["last_updated"] = _now()
+        self._counter += 1
+        self._seq[obj["id"]] = self._counter
+        self.collections[resource][obj["id"]] = obj
+        self.resource_of[obj["id"]] = resource
+        self._add_terms(resource, obj)
+        return obj
+
+    def update(self, resource: str, obj_id: str, changes: dict):
+        obj = self.collections[resource].get(obj_id)
+        if obj is None:
+            return None
+        self._remove_terms(resource, obj)
+        obj.update({key: value for key, value in changes.items() if key not in ("id", "url", *TIMESTAMP_FIELDS)})
+        obj["last_updated"] = _now()
+        self._add_terms(resource, obj)
+        return obj
+
+    def delete(self, resource: str, obj_id: str) -> bool:
+        obj = self.collections[resource].pop(obj_id, None)
+        if obj is None:
+            return False
+        self._remove_terms(resource, obj)
+        self.resource_of.pop(obj_id, None)
+        self._seq.pop(obj_id, None)
+        for referrer in list(self.referrers.pop(obj_id, ())):
+            referrer_resource = self.resource_of.get(referrer)
+            if not referrer_resource:
+                continue
+            fields = [field for field, value in self.collections[referrer_resource][referrer].items()
+                      if isinstance(value, dict) and value.get("id") == obj_id]
+            if any((referrer_resource, field) in CASCADES for field in fields):
+                self.delete(referrer_resource, referrer)
+            else:
+                self.update(referrer_resource, referrer, {field: None for field in fields})
+        return True
+
+    def query(self, resource: str, filters: dict) -> list:
+        candidates = None
+        for field, values in filters.items():
+            if field.endswith("__gte") and field[:-5] in TIMESTAMP_FIELDS:
+                since = max(datetime.fromisoformat(value) for value in values)
+                matched = {obj_id for obj_id, obj in self.collections[resource].items()
+                           if datetime.fromisoformat(obj[field[:-5]]) >= since}
+            elif resource == "ip-addresses" and field == "interface":
+                mappings = set().union(*(self.index[("ip-address-to-interface", "interface", value)] for value in values))
+                matched = {self.collections["ip-address-to-interface"][m]["ip_address"]["id"] for m in mappings}
+            else:
+                matched = set().union(*(self.index[(resource, field, value)] for value in values))
+            candidates = matched if candidates is None else candidates & matched
+            if not candidates:
+                return []
+        if candidates is None:
+            return list(self.collections[resource].values())
+        return [self.collections[resource][obj_id] for obj_id in sorted(candidates, key=self._seq.get)]
+
+class FakeNautobot:
+    """
+    A threaded HTTP server backed by a Store, started in the current process.
+
+    ``latency`` (seconds, plus up to ``jitter``) is added to every request, and a fraction
+    ``error_rate`` of requests fail with ``error_status`` before being applied, so they are
+    safe to retry; requests listed in ``fail_requests`` (``"METHOD /path/"``, as counted)
+    always fail that way. ``max_page_size`` caps ``?limit=0`` like Nautobot's MAX_PAGE_SIZE; it is
+    unlimited by default. With ``max_in_flight``, requests arriving while that many are being
+    served get a 429; ``load_latency`` seconds are added per request already in flight, so
+    latency rises with concurrency. Throttled and failed responses carry ``Retry-After``
+    when ``retry_after`` is set. With ``gzip_responses``, bodies of 1 KB or more are gzipped
+    for clients accepting it, like an nginx front end; gzipped request bodies are always
+    accepted. Requests are counted by method and path, with ids replaced by {id}.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, error_status: int = 503,
+                 max_page_size: int | None = None, seed: int = 0, host: str = "127.0.0.1", port: int = 0,
+                 max_in_flight: int | None = None, load_latency: float = 0.0, retry_after: float | None = None,
+                 gzip_responses: bool = False):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.fail_requests = set()
+        self.max_page_size = max_page_size
+        self.max_in_flight = max_in_flight
+        self.load_latency = load_latency
+        self.retry_after = retry_after
+        self.gzip_responses = gzip_responses
+        self.bytes_sent = 0
+        self.store = Store()
+        self.requests = Counter()
+        self.errors_injected = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _handler_class(self))
+        self._server.daemon_threads = True
+        self._thread = None
+        self.store.create("namespaces", {"name": "Global"}, self.url + "/api/ipam/namespaces")
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeNautobot":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-nautobot", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests.clear()
+            self.errors_injected = 0
+            self.throttled = 0
+            self.bytes_sent = 0
+            self.peak_in_flight = self.in_flight
+
+    def request_counts(self) -> dict:
+        """Requests served so far, keyed by ``"METHOD /path/template/"``."""
+        with self._lock:
+            return {f"{method} {path}": count for (method, path), count in sorted(self.requests.items())}
+
+    @property
+    def total_requests(self) -> int:
+        with self._lock:
+            return sum(self.requests.values())
+
+    def handle(self, method: str, raw_path: str, body) -> tuple:
+        with self._lock:
+            if self.max_in_flight is not None and self.in_flight >= self.max_in_flight:
+                self.throttled += 1
+                return 429, {"detail": "Request was throttled."}
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            return self._handle(method, raw_path, body)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _handle(self, method: str, raw_path: str, body) -> tuple:
+        parsed = urlparse(raw_path)
+        with self._lock:
+            path = UUID_SEGMENT.sub("/{id}/", parsed.path)
+            self.requests[(method, path)] += 1
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0)
+            delay += self.load_latency * (self.in_flight - 1)
+            fail = f"{method} {path}" in self.fail_requests or (self.error_rate and self._random.random() < self.error_rate)
+            if fail:
+                self.errors_injected += 1
+        if delay:
+            time.sleep(delay)
+        if fail:
+            return self.error_status, {"detail": "Injected error."}
+        match = API_PATH.match(parsed.path)
+        if not match:
+            return 404, {"detail": "Not found."}
+        resource, obj_id = match.group(2), match.group(3)
+        base_url = f"{self.url}/api/{match.group(1)}/{resource}"
+        params = parse_qs(parsed.query)
+        with self._lock:
+            if obj_id:
+                return self._detail(method, resource, obj_id, body)
+            return self._list(method, resource, params, body, base_url, parsed.path)
+
+    def _detail(self, method: str, resource: str, obj_id: str, body) -> tuple:
+        store = self.store
+        if obj_id not in store.collections[resource]:
+            return 404, {"detail": "Not found."}
+        if method == "GET":
+            return 200, store.collections[resource][obj_id]
+        if method in ("PATCH", "PUT"):
+            return 200, store.update(resource, obj_id, body or {})
+        if method == "DELETE":
+            store.delete(resource, obj_id)
+            return 204, None
+        return 405, {"detail": f'Method "{method}" not allowed.'}
+
+    def _list(self, method: str, resource: str, params: dict, body, base_url: str, path: str) -> tuple:
+        store = self.store
+        if method == "GET":
+            filters = {key: values for key, values in params.items() if key not in CONTROL_PARAMS}
+            results = store.query(resource, filters)
+            limit = int(params.get("limit", [DEFAULT_PAGE_SIZE])[0])
+            offset = int(params.get("offset", [0])[0])
+            if limit == 0 or (self.max_page_size and limit > self.max_page_size):
+                limit = self.max_page_size or len(results) or 1
+            page = results[offset:offset + limit]
+            next_url = None
+            if offset + limit < len(results):
+                next_params = {key: values for key, values in params.items()}
+                next_params.update(limit=[str(limit)], offset=[str(offset + limit)])
+                next_url = f"{self.url}{path}?{urlencode(next_params, doseq=True)}"
+            return 200, {"count": len(results), "next": next_url, "previous": None, "results": page}
+        if method == "POST":
+            if isinstance(body, list):
+                return 201, [store.create(resource, item, base_url) for item in body]
+            return 201, store.create(resource, body or {}, base_url)
+        if method in ("PATCH", "PUT") and isinstance(body, list):
+            if any(item.get("id") not in store.collections[resource] for item in body):
+                return 400, {"detail": "Unknown object id in bulk update."}
+            return 200, [store.update(resource, item["id"], item) for item in body]
+        if method == "DELETE" and isinstance(body, list):
+            # Bulk deletes are atomic, like Nautobot's: nothing is deleted if an id is unknown.
+            if any(item.get("id") not in store.collections[resource] for item in body):
+                return 404, {"detail": "Not found."}
+            for item in body:
+                store.delete(resource, item["id"])
+            return 204, None
+        return 405, {"detail": f'Method "{method}" not allowed.'}
+
+def _handler_class(fake: FakeNautobot):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body are written separately; without this, Nagle's algorithm adds ~40ms per request.
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _dispatch(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            try:
+                if raw and self.headers.get("Content-Encoding") == "gzip":
+                    raw = gzip.decompress(raw)
+                body = json.loads(raw) if raw else None
+            except (ValueError, OSError):
+                self._respond(400, {"detail": "JSON parse error."})
+                return
+            status, payload = fake.handle(self.command, self.path, body)
+            self._respond(status, payload)
+
+        def _respond(self, status: int, payload):
+            data = json.dumps(payload).encode() if payload is not None else b""
+            compress = (fake.gzip_responses and len(data) >= 1024
+                        and "gzip" in self.headers.get("Accept-Encoding", ""))
+            if compress:
+                data = gzip.compress(data, compresslevel=5)
+            with fake._lock:
+                fake.bytes_sent += len(data)
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            if compress:
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(data)))
+            if status in (429, 503) and fake.retry_after is not None:
+                self.send_header("Retry-After", f"{fake.retry_after:g}")
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = _dispatch
+
+    return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a fake Nautobot REST API for benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra seconds per request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests failing with --error-status")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--max-page-size", type=int, help="cap ?limit=0 responses, like Nautobot's MAX_PAGE_SIZE")
+    parser.add_argument("--max-in-flight", type=int, help="answer 429 to requests beyond this many in flight")
+    parser.add_argument("--load-latency", type=float, default=0.0, help="seconds added per request already in flight")
+    parser.add_argument("--retry-after", type=float, help="Retry-After (seconds) sent with 429/503 responses")
+    parser.add_argument("--gzip", action="store_true", help="gzip responses of 1 KB or more for clients accepting it")
+    args = parser.parse_args()
+    fake = FakeNautobot(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                        error_status=args.error_status, max_page_size=args.max_page_size,
+                        host=args.host, port=args.port, max_in_flight=args.max_in_flight,
+                        load_latency=args.load_latency, retry_after=args.retry_after, gzip_responses=args.gzip)
+    print(f"Fake Nautobot listening on {fake.url}")
+    try:
+        fake._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# faults.py
+"""
+Failure handling checks: fail when a failed write is recorded as applied or a cancelled queue is sent.
+
+    python bench/faults.py
+
+Runs against the fake Nautobot server with a generated repository:
+
+* retry: an incremental deploy whose bulk POST of roles, or of the IP addresses of
+  devices.yml, fails must not record the file as applied, so the next incremental deploy
+  reads it again and creates the objects (and sets the devices' primary IPs).
+* cancel: creates queued on a write-behind queue when the job is cancelled are dropped,
+  not sent.
+* scope: a prune scope with an empty custom field name or value (``=value``, ``name=``,
+  `` = ``) is refused by the CLI and by plan_prune instead of widening the prune to the
+  whole instance.
+
+Exits with 1 on any failure; used as a CI gate.
+"""
+import os
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "app"))
+
+from fake_nautobot import FakeNautobot
+from generate import ROLES, generate
+
+TOKEN = "0123456789abcdef0123456789abcdef01234567"
+DEVICES = 50
+
+def primary_ips(fake: FakeNautobot) -> int:
+    return sum(1 for device in fake.store.collections["devices"].values() if device.get("primary_ip4"))
+
+# (file, request made to fail, what to count in the fake server, expected count once applied)
+RETRY_CASES = [
+    ("roles.yml", "POST /api/extras/roles/", lambda fake: len(fake.store.collections["roles"]), len(ROLES)),
+    ("devices.yml", "POST /api/ipam/ip-addresses/", primary_ips, DEVICES),
+]
+
+def check_retry(temp_dir: str) -> list:
+    from nautobot_client import NautobotClient
+    from deploy import deploy_objects
+    from loader import ShardTracker
+    failures = []
+    for number, (filename, request, count, expected) in enumerate(RETRY_CASES):
+        case_dir = os.path.join(temp_dir, f"retry-{number}")
+        repo_dir = generate(case_dir, DEVICES)
+        state_file = os.path.join(case_dir, "shards.json")
+        with FakeNautobot() as fake:
+            fake.fail_requests = {request}
+            for attempt in ("failing", "retry"):
+                tracker = ShardTracker(state_file, repo_dir)
+                deploy_objects(NautobotClient(url=fake.url, token=TOKEN, memoize=True), repo_dir, tracker)
+                tracker.save()
+                fake.fail_requests = set()
+            if count(fake) != expected:
+                failures.append(f"retry: {count(fake)} of {expected} object(s) applied after failing {request} once; "
+                                f"{filename} was recorded as applied although its writes failed")
+    return failures
+
+def check_cancel(fake: FakeNautobot) -> list:
+    from nautobot_client import NautobotClient
+    from jobs import JobCancelled
+    fake.reset_stats()
+    future = None
+    try:
+        with NautobotClient(url=fake.url, token=TOKEN).write_behind() as writes:
+            future = writes.create("/api/extras/tags/", {"name": "cancelled"})
+            raise JobCancelled()
+    except JobCancelled:
+        pass
+    failures = []
+    if fake.request_counts().get("POST /api/extras/tags/"):
+        failures.append("cancel: creates queued before the cancellation were sent")
+    if future is None or not future.cancelled():
+        failures.append("cancel: the future of a discarded create was not cancelled")
+    return failures
+
+# Custom field scopes that must be refused, and one that must be accepted with its sides stripped.
+INVALID_SCOPES = ["=value", "name=", " = ", "name"]
+VALID_SCOPE = (" managed_by = gitops ", ("managed_by", "gitops"))
+
+def check_scope(fake: FakeNautobot) -> list:
+    import cli
+    from prune import parse_custom_field_scope, plan_prune
+    failures = []
+    for scope in INVALID_SCOPES:
+        args = cli.build_parser().parse_args(["prune", "--nautobot-token", TOKEN, "--nautobot-url", fake.url,
+                                              "--repo", "unused.git", "--subdirectory", "unused", "--custom-field", scope])
+        try:
+            cli.run_prune(args)
+            failures.append(f"scope: --custom-field '{scope}' was accepted")
+        except cli.UsageError:
+            pass
+    if parse_custom_field_scope(VALID_SCOPE[0]) != VALID_SCOPE[1]:
+        failures.append(f"scope: '{VALID_SCOPE[0]}' was not parsed as {VALID_SCOPE[1]}")
+    fake.reset_stats()
+    for name, value in (("", "gitops"), ("managed_by", ""), (" ", " ")):
+        if plan_prune(TOKEN, "unused.git", "unused", fake.url, custom_field=name, custom_field_value=value) is not None:
+            failures.append(f"scope: plan_prune planned with custom field {name!r}={value!r}")
+    if fake.total_requests:
+        failures.append("scope: plan_prune sent requests for an invalid custom field scope")
+    return failures
+
+def main():
+    from logger import console
+    with tempfile.TemporaryDirectory() as temp_dir, console.redirect(lambda message, style: None):
+        os.environ["NAUTOBOT_GITOPS_STATE_DIR"] = os.path.join(temp_dir, "state")
+        failures = check_retry(temp_dir)
+        with FakeNautobot() as fake:
+            failures += check_cancel(fake) + check_scope(fake)
+    if failures:
+        print("Failure handling checks failed:", file=sys.stderr)
+        for failure in failures:
+            print(f"  {failure}", file=sys.stderr)
+        return 1
+    print("All failure handling checks passed.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+# generate.py
+"""
+Generate a synthetic object repository of a given size for benchmarks:
+
+    python bench/generate.py --devices 10000 --out /tmp/bench-repo
+
+The result is a git repository with every object file under SUBDIRECTORY. It passes
+validation and references only objects it defines (plus the ``Global`` namespace). Files
+are written as plain text because yaml.dump is far too slow for 100k devices; devices are
+split into a ``devices/`` shard directory once there are more than ``shard_size``.
+"""
+import argparse
+import os
+import subprocess
+
+SUBDIRECTORY = "nautobot-instances/bench"
+SIZES = (100, 1000, 10000, 100000)
+MANUFACTURERS = ("Arista", "Cisco", "Juniper")
+ROLES = ("leaf", "spine", "border", "edge", "oob")
+DEVICE_TYPES = 6
+TEMPLATES_PER_TYPE = 4
+DEVICES_PER_LOCATION = 50
+
+def device_address(index: int) -> str:
+    """Management address of device ``index``: 254 devices per /24, from 10.0.0.0/8 upwards."""
+    network = index // 254
+    return f"10.{network // 256 % 256}.{network % 256}.{index % 254 + 1}/24"
+
+def _write(path: str, lines):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write("---\n")
+        f.writelines(lines)
+
+def _device_lines(start: int, stop: int, locations: int, interfaces: int):
+    for i in range(start, stop):
+        address = device_address(i)
+        yield (
+            f"- name: dev-{i:06d}\n"
+            f"  role: {ROLES[i % len(ROLES)]}\n"
+            f"  status: Active\n"
+            f"  location: site-{i // DEVICES_PER_LOCATION % locations:04d}\n"
+            f"  device-type: model-{i % DEVICE_TYPES}\n"
+            f"  primary_ip4: {address}\n"
+            f"  interfaces:\n"
+            f"    - name: mgmt0\n"
+            f"      type: 1000base-t\n"
+            f"      status: Active\n"
+            f"      mgmt_only: true\n"
+            f"      ip-address:\n"
+            f"        - address: {address}\n"
+            f"          namespace: Global\n"
+            f"          type: Host\n"
+            f"          status: Active\n"
+        )
+        for port in range(1, interfaces):
+            yield (
+                f"    - name: eth{port}\n"
+                f"      type: 10gbase-x-sfpp\n"
+                f"      status: Active\n"
+            )
+
+def generate(out_dir: str, devices: int, interfaces: int = 4, shard_size: int = 10000, commit: bool = True) -> str:
+    """Write the object files for ``devices`` devices with ``interfaces`` interfaces each; returns the objects directory."""
+    objects_dir = os.path.join(out_dir, SUBDIRECTORY)
+    locations = max(1, -(-devices // DEVICES_PER_LOCATION))
+    networks = -(-devices // 254)
+    _write(os.path.join(objects_dir, "statuses.yml"), [
+        "- name: Active\n  content_types:\n    - dcim.device\n    - dcim.location\n    - dcim.interface\n"
+        "    - ipam.ipaddress\n    - ipam.prefix\n  color: 4caf50\n",
+    ])
+    _write(os.path.join(objects_dir, "roles.yml"),
+           [f"- name: {role}\n  color: 9e9e9e\n  content_types:\n    - dcim.device\n" for role in ROLES])
+    _write(os.path.join(objects_dir, "manufacturers.yml"), [f"- name: {name}\n" for name in MANUFACTURERS])
+    _write(os.path.join(objects_dir, "location_types.yml"), ["- name: site\n  content_types:\n    - dcim.device\n"])
+    _write(os.path.join(objects_dir, "locations.yml"),
+           [f"- name: site-{i:04d}\n  location_type: site\n  status: Active\n" for i in range(locations)])
+    _write(os.path.join(objects_dir, "device_types.yml"),
+           [f"- model: model-{i}\n  manufacturer: {MANUFACTURERS[i % len(MANUFACTURERS)]}\n  u_height: 1\n"
+            for i in range(DEVICE_TYPES)])
+    _write(os.path.join(objects_dir, "interface_templates.yml"), [
+        f"- model-{i}:\n" + "".join(f"  - name: eth{port}\n    type: 10gbase-x-sfpp\n" for port in range(1, TEMPLATES_PER_TYPE + 1))
+        for i in range(DEVICE_TYPES)
+    ])
+    _write(os.path.join(objects_dir, "prefixes.yml"), [
+        f"- prefix: 10.{j // 256 % 256}.{j % 256}.0/24\n  namespace: Global\n  type: Network\n  status: Active\n"
+        for j in range(networks)
+    ])
+    if devices <= shard_size:
+        _write(os.path.join(objects_dir, "devices.yml"), _device_lines(0, devices, locations, interfaces))
+    else:
+        for part, start in enumerate(range(0, devices, shard_size), start=1):
+            _write(os.path.join(objects_dir, "devices", f"part-{part:04d}.yml"),
+                   _device_lines(start, min(start + shard_size, devices), locations, interfaces))
+    if commit:
+        git = ["git", "-c", "user.name=bench", "-c", "user.email=bench@example.com", "-c", "commit.gpgsign=false"]
+        subprocess.run(["git", "init", "-q", out_dir], check=True)
+        subprocess.run(git + ["-C", out_dir, "add", "-A"], check=True)
+        subprocess.run(git + ["-C", out_dir, "commit", "-q", "-m", f"{devices} devices"], check=True)
+    return objects_dir
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic object repository for benchmarks.")
+    parser.add_argument("--devices", type=int, default=1000, help=f"number of devices (e.g. {', '.join(map(str, SIZES))})")
+    parser.add_argument("--interfaces", type=int, default=4, help="interfaces per device")
+    parser.add_argument("--shard-size", type=int, default=10000, help="devices per shard once devices.yml is split")
+    parser.add_argument("--out", required=True, help="directory of the generated git repository")
+    parser.add_argument("--no-commit", action="store_true", help="only write the files")
+    args = parser.parse_args()
+    print(generate(args.out, args.devices, args.interfaces, args.shard_size, commit=not args.no_commit))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# json_bench.py
+"""
+Benchmark JSON decoding/encoding and gzip on Nautobot-sized API payloads:
+
+    python bench/json_bench.py --sizes 1000,10000,50000 --bandwidth 100
+
+For every size, a ``?limit=0`` list response of devices and of IP addresses shaped like
+Nautobot's (depth=1: nested role, status, location, ... objects, custom fields, tags) is
+decoded and encoded with the standard library and with orjson (when installed), and
+gzipped at several levels; ``--bandwidth`` (Mbit/s) turns sizes into transfer times.
+Finally the devices list is fetched end to end from the fake Nautobot server through
+NautobotClient, with plain and gzipped responses and each JSON backend.
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+import uuid
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "app"))
+
+import jsoncodec
+
+BASE = "https://nautobot.example.com"
+TOKEN = "0123456789abcdef0123456789abcdef01234567"
+GZIP_LEVELS = (1, 5, 9)
+REPEAT = 3
+
+def _ref(kind: str, name: str, object_type: str) -> dict:
+    obj_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"{kind}/{name}"))
+    return {"id": obj_id, "object_type": object_type, "url": f"{BASE}/api/{kind}/{obj_id}/", "display": name,
+            "name": name, "natural_slug": f"{name.lower()}_{obj_id[:4]}"}
+
+def device(i: int) -> dict:
+    obj_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"device/{i}"))
+    return {
+        "id": obj_id, "object_type": "dcim.device", "display": f"dev-{i:06d}",
+        "url": f"{BASE}/api/dcim/devices/{obj_id}/", "natural_slug": f"dev-{i:06d}_{obj_id[:4]}",
+        "face": None, "local_config_context_data": None, "local_config_context_data_owner_object_id": None,
+        "name": f"dev-{i:06d}", "serial": f"SN{i:010d}", "asset_tag": None, "position": None,
+        "device_redundancy_group_priority": None, "vc_position": None, "vc_priority": None, "comments": "",
+        "local_config_context_schema": None, "local_config_context_data_owner_content_type": None,
+        "device_type": _ref("dcim/device-types", f"model-{i % 6}", "dcim.devicetype"),
+        "status": _ref("extras/statuses", "Active", "extras.status"),
+        "role": _ref("extras/roles", ("leaf", "spine", "border", "access", "core")[i % 5], "extras.role"),
+        "tenant": None, "platform": _ref("dcim/platforms", "eos", "dcim.platform"),
+        "location": _ref("dcim/locations", f"site-{i // 50:04d}", "dcim.location"), "rack": None,
+        "primary_ip4": _ref("ipam/ip-addresses", f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}/32", "ipam.ipaddress"),
+        "primary_ip6": None, "cluster": None, "virtual_chassis": None, "device_redundancy_group": None,
+        "software_version": None, "secrets_group": None, "controller_managed_device_group": None,
+        "created": "2024-01-01T00:00:00.000000Z", "last_updated": "2024-06-01T12:34:56.789012Z",
+        "notes_url": f"{BASE}/api/dcim/devices/{obj_id}/notes/",
+        "custom_fields": {"owner": "netops", "managed_by": "gitops", "rack_unit": None},
+        "tags": [_ref("extras/tags", "gitops", "extras.tag")],
+    }
+
+def ip_address(i: int) -> dict:
+    obj_id = str(uuid.uuid5(uuid.NAMESPACE_URL, f"ip/{i}"))
+    address = f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}/32"
+    return {
+        "id": obj_id, "object_type": "ipam.ipaddress", "display": address,
+        "url": f"{BASE}/api/ipam/ip-addresses/{obj_id}/", "natural_slug": f"{address}_{obj_id[:4]}",
+        "address": address, "host": address.split("/")[0], "mask_length": 32, "type": "host", "ip_version": 4,
+        "dns_name": f"dev-{i:06d}.example.com", "description": "", "tenant": None, "nat_inside": None,
+        "status": _ref("extras/statuses", "Active", "extras.status"), "role": None,
+        "parent": _ref("ipam/prefixes", f"10.{i // 65536 % 256}.{i // 256 % 256}.0/24", "ipam.prefix"),
+        "created": "2024-01-01T00:00:00.000000Z", "last_updated": "2024-06-01T12:34:56.789012Z",
+        "notes_url": f"{BASE}/api/ipam/ip-addresses/{obj_id}/notes/",
+        "custom_fields": {}, "tags": [],
+    }
+
+def list_response(factory, count: int) -> dict:
+    return {"count": count, "next": None, "previous": None, "results": [factory(i) for i in range(count)]}
+
+def timed(func, repeat: int = REPEAT) -> float:
+    """Best of ``repeat`` runs, in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def bench_codecs(name: str, payload: dict, bandwidth: float):
+    raw = json.dumps(payload).encode()
+    mb = len(raw) / 2 ** 20
+    transfer_ms = len(raw) * 8 / (bandwidth * 1e6) * 1000
+    print(f"\n{name}: {len(payload['results'])} objects, {mb:.1f} MB "
+          f"({transfer_ms:.0f} ms at {bandwidth:g} Mbit/s)")
+    print(f"  {'backend':<10} {'decode ms':>10} {'encode ms':>10}")
+    print(f"  {'json':<10} {timed(lambda: json.loads(raw)):>10.1f} {timed(lambda: json.dumps(payload).encode()):>10.1f}")
+    if jsoncodec.orjson is not None:
+        orjson = jsoncodec.orjson
+        print(f"  {'orjson':<10} {timed(lambda: orjson.loads(raw)):>10.1f} {timed(lambda: orjson.dumps(payload)):>10.1f}")
+    else:
+        print("  orjson     not installed")
+    print(f"  {'gzip':<10} {'MB':>10} {'ratio':>10} {'compress ms':>12} {'decompress ms':>14} {'transfer ms':>12}")
+    for level in GZIP_LEVELS:
+        compressed = gzip.compress(raw, compresslevel=level)
+        print(f"  {f'level {level}':<10} {len(compressed) / 2 ** 20:>10.2f} {len(raw) / len(compressed):>10.1f} "
+              f"{timed(lambda: gzip.compress(raw, compresslevel=level), 1):>12.1f} "
+              f"{timed(lambda: gzip.decompress(compressed)):>14.1f} "
+              f"{len(compressed) * 8 / (bandwidth * 1e6) * 1000:>12.0f}")
+
+def bench_end_to_end(count: int):
+    from fake_nautobot import FakeNautobot
+    from nautobot_client import NautobotClient
+    print(f"\nEnd to end: GET /api/dcim/devices/?limit=0 with {count} devices from the fake server")
+    print(f"  {'responses':<10} {'backend':<8} {'ms':>10} {'bytes sent':>12}")
+    for gzipped in (False, True):
+        with FakeNautobot(gzip_responses=gzipped) as fake:
+            for i in range(count):
+                fake.store.create("devices", device(i), fake.url + "/api/dcim/devices")
+            backends = [("json", None)] + ([("orjson", jsoncodec.orjson)] if jsoncodec.orjson is not None else [])
+            for backend, module in backends:
+                saved, jsoncodec.orjson = jsoncodec.orjson, module
+                try:
+                    client = NautobotClient(url=fake.url, token=TOKEN)
+                    client.http_call("get", "/api/dcim/devices/?limit=1")
+                    fake.reset_stats()
+                    ms = timed(lambda: client.http_call("get", "/api/dcim/devices/?limit=0"), REPEAT)
+                    print(f"  {'gzip' if gzipped else 'plain':<10} {backend:<8} {ms:>10.1f} {fake.bytes_sent // REPEAT:>12}")
+                finally:
+                    jsoncodec.orjson = saved
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark JSON backends and gzip on Nautobot-sized payloads.")
+    parser.add_argument("--sizes", default="1000,10000", help="comma-separated object counts")
+    parser.add_argument("--bandwidth", type=float, default=100.0, help="link speed in Mbit/s for transfer estimates")
+    parser.add_argument("--no-end-to-end", action="store_true", help="skip the fake-server round trips")
+    args = parser.parse_args()
+    print(f"JSON backend used by NautobotClient: {jsoncodec.BACKEND}")
+    sizes = [int(size) for size in args.sizes.split(",")]
+    for size in sizes:
+        bench_codecs("devices", list_response(device, size), args.bandwidth)
+        bench_codecs("ip-addresses", list_response(ip_address, size), args.bandwidth)
+    if not args.no_end_to_end:
+        bench_end_to_end(sizes[-1])
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
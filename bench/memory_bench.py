@@ -0,0 +1,69 @@
+# memory_bench.py
+"""
+Benchmark the memory held by existing-object structures at fleet scale:
+
+    python bench/memory_bench.py --sizes 10000,100000
+
+For every size, Nautobot-shaped device list pages (depth=1, see json_bench.py) are decoded
+page by page and kept as deploy keeps existing devices: the API dicts as returned (what
+deploys held before the snapshot), the projected dicts stored in the snapshot, and the
+snapshot's Records. Memory retained once the pages are gone and the peak while building are
+measured with tracemalloc, plus the ``{name: id}`` lookup built from the Records.
+"""
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "app"))
+
+import jsoncodec
+from json_bench import device
+from snapshot import PAGE_SIZE, Record, project
+
+def pages(count: int) -> list:
+    """Encoded list responses of PAGE_SIZE devices, like snapshot refreshes receive them."""
+    return [jsoncodec.dumps({"count": count, "results": [device(i) for i in range(start, min(start + PAGE_SIZE, count))]})
+            for start in range(0, count, PAGE_SIZE)]
+
+def api_dicts(encoded: list) -> dict:
+    return {obj["name"]: obj for page in encoded for obj in jsoncodec.loads(page)["results"]}
+
+def projected_dicts(encoded: list) -> dict:
+    return {obj["name"]: project(obj) for page in encoded for obj in jsoncodec.loads(page)["results"]}
+
+def records(encoded: list) -> dict:
+    built = (Record(project(obj)) for page in encoded for obj in jsoncodec.loads(page)["results"])
+    return {record.key: record for record in built}
+
+def measure(build, *args) -> tuple:
+    """Bytes retained by ``build(*args)``'s result and the peak while building it."""
+    gc.collect()
+    tracemalloc.start()
+    result = build(*args)
+    gc.collect()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, retained, peak
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure memory held by existing-object structures.")
+    parser.add_argument("--sizes", default="10000,100000", help="comma-separated device counts")
+    args = parser.parse_args()
+    print(f"{'devices':>8} {'structure':<16} {'retained MB':>12} {'bytes/device':>13} {'peak MB':>9}")
+    for count in (int(size) for size in args.sizes.split(",")):
+        encoded = pages(count)
+        for name, build in (("api dicts", api_dicts), ("projected dicts", projected_dicts), ("records", records)):
+            result, retained, peak = measure(build, encoded)
+            print(f"{count:>8} {name:<16} {retained / 2 ** 20:>12.1f} {retained / count:>13.0f} {peak / 2 ** 20:>9.1f}")
+            if name == "records":
+                _, retained, _ = measure(lambda: {key: record.id for key, record in result.items()})
+                print(f"{count:>8} {'name -> id':<16} {retained / 2 ** 20:>12.1f} {retained / count:>13.0f}")
+            del result
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
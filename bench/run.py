@@ -0,0 +1,172 @@
+# run.py
+"""
+Benchmark the check, deploy and delete pipelines against the fake Nautobot server:
+
+    python bench/run.py --sizes 100,1000,10000 --latency 0.002
+    python bench/run.py --sizes 1000 --compare HEAD~1
+
+For every size a synthetic repository is generated and each scenario runs in a fresh
+process against one fake server, in order: ``check`` (compare_objects, the headless part of
+check_and_compare_objects), ``deploy`` (sync_all_objects_from_git into an empty Nautobot),
+``redeploy`` (the same deploy again, with everything in place) and ``delete``
+(delete_all_data). Wall time, requests by endpoint, bytes sent and peak RSS are recorded, plus the
+peak Python heap with ``--tracemalloc`` (which slows the run down by 2-3x). Results are
+written to ``bench/results/<commit>.json``; ``--compare`` prints the change against the
+results of another commit.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+APP_DIR = os.path.join(ROOT_DIR, "app")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+SCENARIOS = ("check", "deploy", "redeploy", "delete")
+TOKEN = "0123456789abcdef0123456789abcdef01234567"
+
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, APP_DIR)
+
+def _scenario(name: str, url: str, repo: str, subdirectory: str, trace: bool, conn):
+    """Runs in a child process so memory figures only cover the scenario, not the fake server."""
+    from logger import console
+    counts = {}
+
+    def sink(message: str, style: str | None):
+        counts[style or "info"] = counts.get(style or "info", 0) + 1
+
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    with console.redirect(sink):
+        if name == "check":
+            from sync import compare_objects
+            compare_objects(TOKEN, repo, subdirectory, url)
+        elif name in ("deploy", "redeploy"):
+            from deploy import sync_all_objects_from_git
+            sync_all_objects_from_git(TOKEN, repo, subdirectory, url)
+        elif name == "delete":
+            from delete import delete_all_data
+            delete_all_data(TOKEN, url)
+    seconds = time.perf_counter() - start
+    result = {
+        "seconds": round(seconds, 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "messages": counts,
+    }
+    if trace:
+        result["peak_heap_mb"] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        tracemalloc.stop()
+    conn.send(result)
+    conn.close()
+
+def run_size(devices: int, scenarios: list, latency: float, error_rate: float, trace: bool) -> dict:
+    from fake_nautobot import FakeNautobot
+    from generate import SUBDIRECTORY, generate
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        generate(temp_dir, devices)
+        # Scenarios share a fresh state directory, so the Nautobot snapshot is loaded by the first and refreshed by the next.
+        os.environ["NAUTOBOT_GITOPS_STATE_DIR"] = os.path.join(temp_dir, "state")
+        with FakeNautobot(latency=latency, error_rate=error_rate) as fake:
+            for name in scenarios:
+                fake.reset_stats()
+                parent_conn, child_conn = context.Pipe(duplex=False)
+                process = context.Process(target=_scenario, args=(name, fake.url, temp_dir, SUBDIRECTORY, trace, child_conn))
+                process.start()
+                child_conn.close()
+                result = parent_conn.recv() if parent_conn.poll(None) else {}
+                process.join()
+                result["requests"] = fake.total_requests
+                result["requests_by_endpoint"] = fake.request_counts()
+                result["errors_injected"] = fake.errors_injected
+                result["bytes_sent"] = fake.bytes_sent
+                results[name] = result
+                print(f"{devices:>7} {name:<9} {result.get('seconds', 0):>9.2f}s {result['requests']:>9} req "
+                      f"{result['bytes_sent'] / 1024:>9.0f} KB "
+                      f"{result.get('peak_rss_mb', '-'):>8} MB rss {result.get('peak_heap_mb', '-'):>8} MB heap", flush=True)
+    return results
+
+def git_commit() -> tuple:
+    def git(*args):
+        return subprocess.run(["git", "-C", ROOT_DIR, *args], capture_output=True, text=True).stdout.strip()
+    return git("rev-parse", "--short", "HEAD") or "unknown", bool(git("status", "--porcelain", "--", "app"))
+
+def results_path(ref: str) -> str:
+    if os.path.isfile(ref):
+        return ref
+    sha = subprocess.run(["git", "-C", ROOT_DIR, "rev-parse", "--short", ref], capture_output=True, text=True).stdout.strip()
+    return os.path.join(RESULTS_DIR, f"{sha or ref}.json")
+
+def compare(baseline: dict, current: dict):
+    print(f"\nCompared with {baseline['commit']} ({baseline['date']}):")
+    print(f"{'devices':>7} {'scenario':<9} {'seconds':>20} {'requests':>20} {'peak RSS MB':>20}")
+    for size, scenarios in current["results"].items():
+        for name, result in scenarios.items():
+            old = baseline["results"].get(size, {}).get(name)
+            if not old:
+                continue
+            cells = []
+            for metric in ("seconds", "requests", "peak_rss_mb"):
+                before, after = old.get(metric), result.get(metric)
+                if before is None or after is None:
+                    cells.append(f"{'-':>20}")
+                    continue
+                change = f"{(after - before) / before * 100:+.0f}%" if before else "n/a"
+                cells.append(f"{f'{before}->{after} ({change})':>20}")
+            print(f"{size:>7} {name:<9} {' '.join(cells)}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipelines against a fake Nautobot.")
+    parser.add_argument("--sizes", default="100,1000", help="comma-separated device counts (e.g. 100,1000,10000,100000)")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every fake API request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake API requests failing with 503")
+    parser.add_argument("--tracemalloc", action="store_true", help="also record the peak Python heap (slower)")
+    parser.add_argument("--compare", metavar="REF", help="commit (or results file) to compare with")
+    parser.add_argument("--no-save", action="store_true", help="do not write bench/results/<commit>.json")
+    args = parser.parse_args()
+    scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    commit, dirty = git_commit()
+    current = {
+        "commit": commit + ("-dirty" if dirty else ""),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "params": {"latency": args.latency, "error_rate": args.error_rate},
+        "results": {},
+    }
+    print(f"{'devices':>7} {'scenario':<9} {'wall':>10} {'requests':>13} {'sent':>12} {'rss':>15} {'heap':>16}")
+    for size in args.sizes.split(","):
+        current["results"][size] = run_size(int(size), scenarios, args.latency, args.error_rate, args.tracemalloc)
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{current['commit']}.json")
+        with open(path, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"\nResults written to {os.path.relpath(path, ROOT_DIR)}")
+    if args.compare:
+        path = results_path(args.compare)
+        try:
+            with open(path, "r") as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Cannot read baseline results {path}: {e}", file=sys.stderr)
+            return 2
+        compare(baseline, current)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())